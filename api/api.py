@@ -10,7 +10,9 @@ from fastapi import FastAPI
 class API:
     def __init__(self):
         nest_asyncio.apply()
-        self.app = FastAPI()
+        # 默认使用 json_codec 编码响应（安装 orjson 时更快）
+        from api.app.utils.json_response import CodecJSONResponse
+        self.app = FastAPI(default_response_class=CodecJSONResponse)
         
         # CORS配置
         from fastapi.middleware.cors import CORSMiddleware
@@ -22,6 +24,10 @@ class API:
             allow_headers=["*"],
         )
         
+        # 生命周期管理（共享连接池的创建与释放）
+        from api.app.dependencies import lifespan
+        self.app.router.lifespan_context = lifespan
+
         self._include_routers()
 
     def _include_routers(self):
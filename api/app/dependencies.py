@@ -4,8 +4,13 @@ import asyncio
 import os
 from dotenv import load_dotenv
 
-
+# 先加载 .env，确保飞书客户端模块在导入时读取到其中的配置
 load_dotenv()
+
+from .utils.feishu_http_async import init_session_pool, close_session_pool
+from .utils import feishu_http
+from .utils.job_queue import job_workers
+
 API_KEY = os.getenv('API_KEY')
 
 # 创建一个依赖项，用于验证API密钥
@@ -28,5 +33,15 @@ stop_event = asyncio.Event()
 
 # 创建一个生命周期依赖项，用于在应用启动和关闭时执行代码
 async def lifespan(app: FastAPI):
-    # 简化生命周期管理
-    yield
\ No newline at end of file
+    # 启动时创建共享的飞书 HTTP 连接池（异步与同步客户端各一个）
+    await init_session_pool()
+    feishu_http.init_session_pool()
+    # 启动任务 worker，上次退出时未完成的任务会重新执行
+    await job_workers.start()
+    try:
+        yield
+    finally:
+        await job_workers.stop()
+        # 关闭时释放连接池中的所有连接
+        await close_session_pool()
+        feishu_http.close_session_pool()
@@ -6,7 +6,7 @@ class FeishuBitableAPIHandler:
         self.FEISHU_APP_ID = FEISHU_APP_ID
         self.FEISHU_APP_SECRET = FEISHU_APP_SECRET
         self.FEISHU_TENANT_ACCESS_TOKEN = get_tenant_access_token(self.FEISHU_APP_ID, self.FEISHU_APP_SECRET)
-        self.feishu_bitable_api = FeishuBitableAPI(self.FEISHU_TENANT_ACCESS_TOKEN)
+        self.feishu_bitable_api = FeishuBitableAPI(self.FEISHU_TENANT_ACCESS_TOKEN, self.FEISHU_APP_ID)
 
     def get_record_list(self, app_token, table_id, args):
         """
@@ -0,0 +1,221 @@
+# file name: feishu_bitable_api_handler_async.py
+import asyncio
+import uuid
+import weakref
+
+from api.app.utils.feishu_app_api_async import FeishuBitableAPI, get_tenant_access_token
+from api.app.utils.concurrency import gather_limited, chunked
+
+# 飞书批量接口单次请求的记录数上限
+BATCH_GET_LIMIT = 100
+BATCH_WRITE_LIMIT = 500
+
+# 同一数据表的写请求必须串行，并发写入会被飞书以写冲突（1254291）拒绝；按数据表共享，所有 handler 实例共用
+_table_write_locks = weakref.WeakValueDictionary()
+
+
+def _table_write_lock(app_token, table_id):
+    key = (app_token, table_id)
+    lock = _table_write_locks.get(key)
+    if lock is None:
+        lock = _table_write_locks[key] = asyncio.Lock()
+    return lock
+
+
+class FeishuBitableAPIHandler:
+    def __init__(self, FEISHU_APP_ID, FEISHU_APP_SECRET):
+        self.FEISHU_APP_ID = FEISHU_APP_ID
+        self.FEISHU_APP_SECRET = FEISHU_APP_SECRET
+
+    async def initialize(self):
+        self.FEISHU_TENANT_ACCESS_TOKEN = await get_tenant_access_token(self.FEISHU_APP_ID, self.FEISHU_APP_SECRET)
+        self.feishu_bitable_api = FeishuBitableAPI(self.FEISHU_TENANT_ACCESS_TOKEN, self.FEISHU_APP_ID)
+
+    async def get_record_list(self, app_token, table_id, args):
+        """
+        获取记录列表
+        :param app_token: str, 多维表格的唯一标识符
+        :param table_id: str, 多维表格数据表的唯一标识符
+        :param args: dict, 查询参数
+        :return: dict, API 响应结果
+        """
+        return await self.feishu_bitable_api.get_record_list(app_token, table_id, args)
+    
+    async def get_record_content(self, app_token, table_id, record_id):
+        """
+        获取单条记录的内容
+        :param app_token: str, 多维表格的唯一标识符
+        :param table_id: str, 多维表格数据表的唯一标识符
+        :param record_id: str, 记录的唯一标识符
+        :return: dict, 记录的内容
+        """
+        return await self.feishu_bitable_api.get_record_content(app_token, table_id, record_id)
+
+    async def create_record(self, app_token, table_id, fields):
+        """
+        创建一条新记录
+        :param app_token: str, 多维表格的唯一标识符
+        :param table_id: str, 多维表格数据表的唯一标识符
+        :param fields: dict, 记录的字段内容
+        :return: dict, API 响应结果
+        """
+        return await self.feishu_bitable_api.create_record(app_token, table_id, fields)
+
+    async def update_record(self, app_token, table_id, record_id, fields):
+        """
+        更新一条记录
+        :param app_token: str, 多维表格的唯一标识符
+        :param table_id: str, 多维表格数据表的唯一标识符
+        :param record_id: str, 记录的唯一标识符
+        :param fields: dict, 更新的字段内容
+        :return: dict, API 响应结果
+        """
+        return await self.feishu_bitable_api.update_record(app_token, table_id, record_id, fields)
+
+    async def delete_record(self, app_token, table_id, record_id):
+        """
+        删除一条记录
+        :param app_token: str, 多维表格的唯一标识符
+        :param table_id: str, 多维表格数据表的唯一标识符
+        :param record_id: str, 记录的唯一标识符
+        :return: dict, API 响应结果
+        """
+        return await self.feishu_bitable_api.delete_record(app_token, table_id, record_id)
+
+    async def batch_create_records(self, app_token, table_id, records, user_id_type="open_id", client_token=None):
+        """
+        批量创建记录
+        :param app_token: str, 多维表格的唯一标识符
+        :param table_id: str, 多维表格数据表的唯一标识符
+        :param records: list, 记录列表，每条记录是一个字典
+        :param user_id_type: str, 用户 ID 类型，默认为 "open_id"
+        :param client_token: str, 幂等操作的唯一标识符，默认为 None
+        :return: dict, API 响应结果
+        """
+        return await self.feishu_bitable_api.batch_create_records(app_token, table_id, records, user_id_type, client_token)
+
+    async def batch_update_records(self, app_token, table_id, records, user_id_type="open_id"):
+        """
+        批量更新记录
+        :param app_token: str, 多维表格的唯一标识符
+        :param table_id: str, 多维表格数据表的唯一标识符
+        :param records: list, 记录列表，每条记录是一个字典
+        :param user_id_type: str, 用户 ID 类型，默认为 "open_id"
+        :return: dict, API 响应结果
+        """
+        return await self.feishu_bitable_api.batch_update_records(app_token, table_id, records, user_id_type)
+
+    async def batch_get_records(self, app_token, table_id, record_ids, user_id_type="open_id", with_shared_url=False, automatic_fields=False):
+        """
+        批量获取记录
+        :param app_token: str, 多维表格的唯一标识符
+        :param table_id: str, 多维表格数据表的唯一标识符
+        :param record_ids: list, 记录 ID 列表
+        :param user_id_type: str, 用户 ID 类型，默认为 "open_id"
+        :param with_shared_url: bool, 是否返回记录的分享链接，默认为 False
+        :param automatic_fields: bool, 是否返回自动计算的字段，默认为 False
+        :return: dict, API 响应结果
+        """
+        return await self.feishu_bitable_api.batch_get_records(app_token, table_id, record_ids, user_id_type, with_shared_url, automatic_fields)
+
+    async def batch_delete_records(self, app_token, table_id, record_ids):
+        """
+        批量删除记录
+        :param app_token: str, 多维表格的唯一标识符
+        :param table_id: str, 多维表格数据表的唯一标识符
+        :param record_ids: list, 要删除的记录 ID 列表
+        :return: dict, API 响应结果
+        """
+        return await self.feishu_bitable_api.batch_delete_records(app_token, table_id, record_ids)
+
+    async def create_bitable(self, name, folder_token=""):
+        """
+        创建一个新的多维表格
+        :param name: str, 表格名称
+        :param folder_token: str, 文件夹标识符，默认为空
+        :return: dict, API 响应结果
+        """
+        return await self.feishu_bitable_api.create_bitable(name, folder_token)
+
+    async def gather_batch_get_records(self, app_token, table_id, record_ids, user_id_type="open_id", with_shared_url=False, automatic_fields=False, concurrency=5):
+        """
+        并发批量获取任意数量的记录，按接口上限切分后同时请求并合并结果
+        :param app_token: str, 多维表格的唯一标识符
+        :param table_id: str, 多维表格数据表的唯一标识符
+        :param record_ids: list, 记录 ID 列表，数量不受单次请求 100 条的限制
+        :param user_id_type: str, 用户 ID 类型，默认为 "open_id"
+        :param with_shared_url: bool, 是否返回记录的分享链接，默认为 False
+        :param automatic_fields: bool, 是否返回自动计算的字段，默认为 False
+        :param concurrency: int, 最大并发请求数
+        :return: dict, 合并后的响应，data 中包含 records、absent_record_ids 和 forbidden_record_ids
+        """
+        responses = await gather_limited([
+            lambda ids=ids: self.batch_get_records(app_token, table_id, ids, user_id_type, with_shared_url, automatic_fields)
+            for ids in chunked(list(record_ids), BATCH_GET_LIMIT)
+        ], concurrency)
+        return self._merge_responses(responses, ["records", "absent_record_ids", "forbidden_record_ids"])
+
+    async def gather_batch_create_records(self, app_token, table_id, records, user_id_type="open_id"):
+        """
+        批量创建任意数量的记录，按接口上限切分后依次提交，每个分片携带独立的 client_token，失败时可以安全重试
+        同一数据表的写请求（包括其他调用方的）串行执行，避免写冲突
+        :param app_token: str, 多维表格的唯一标识符
+        :param table_id: str, 多维表格数据表的唯一标识符
+        :param records: list, 记录列表，数量不受单次请求 500 条的限制
+        :param user_id_type: str, 用户 ID 类型，默认为 "open_id"
+        :return: dict, 合并后的响应，data 中包含 records
+        """
+        responses = []
+        for chunk in chunked(list(records), BATCH_WRITE_LIMIT):
+            async with _table_write_lock(app_token, table_id):
+                responses.append(await self.batch_create_records(app_token, table_id, chunk, user_id_type, str(uuid.uuid4())))
+        return self._merge_responses(responses, ["records"])
+
+    async def gather_batch_update_records(self, app_token, table_id, records, user_id_type="open_id"):
+        """
+        批量更新任意数量的记录，按接口上限切分后依次提交
+        同一数据表的写请求（包括其他调用方的）串行执行，避免写冲突
+        :param app_token: str, 多维表格的唯一标识符
+        :param table_id: str, 多维表格数据表的唯一标识符
+        :param records: list, 记录列表，每条记录包含 record_id 和 fields
+        :param user_id_type: str, 用户 ID 类型，默认为 "open_id"
+        :return: dict, 合并后的响应，data 中包含 records
+        """
+        responses = []
+        for chunk in chunked(list(records), BATCH_WRITE_LIMIT):
+            async with _table_write_lock(app_token, table_id):
+                responses.append(await self.batch_update_records(app_token, table_id, chunk, user_id_type))
+        return self._merge_responses(responses, ["records"])
+
+    async def gather_record_lists(self, app_token, table_id, args_list, concurrency=5):
+        """
+        并发执行多个记录查询
+        :param app_token: str, 多维表格的唯一标识符
+        :param table_id: str, 多维表格数据表的唯一标识符
+        :param args_list: list, 查询参数列表
+        :param concurrency: int, 最大并发请求数
+        :return: list, 与 args_list 顺序一致的响应列表
+        """
+        return await gather_limited([
+            lambda args=args: self.get_record_list(app_token, table_id, args)
+            for args in args_list
+        ], concurrency)
+
+    @staticmethod
+    def _merge_responses(responses, list_fields):
+        """
+        合并多个分片请求的响应，任一分片失败时返回第一个失败的 code 和 msg，
+        成功分片的数据仍然保留在 data 中，失败的响应放在 errors 中
+        """
+        data = {field: [] for field in list_fields}
+        errors = []
+        for response in responses:
+            if response.get('code') != 0:
+                errors.append(response)
+                continue
+            for field in list_fields:
+                data[field].extend(response.get('data', {}).get(field) or [])
+        merged = {"code": 0, "msg": "success", "data": data}
+        if errors:
+            merged.update(code=errors[0].get('code'), msg=errors[0].get('msg'), errors=errors)
+        return merged
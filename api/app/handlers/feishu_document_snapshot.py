@@ -0,0 +1,170 @@
+# file name: feishu_document_snapshot.py
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from api.app.handlers.feishu_document_tree import DocumentTree
+from api.app.utils.singleflight import AsyncSingleFlight
+
+
+class DocumentSnapshotCache:
+    """
+    按文档版本缓存的文档块快照（DocumentTree）
+
+    我们自己的写操作返回新的 document_revision_id 和新建块的 ID，快照据此就地更新，
+    写之后的读取不需要重新下载。版本号的跳变说明文档被其他人修改过，此时丢弃快照，
+    下次读取时重新下载；超过 validate_after 秒未校验的快照会先用文档信息接口核对版本。
+    """
+
+    def __init__(self, max_documents=64, validate_after=30):
+        """
+        :param max_documents: 最多缓存的文档数，超出时按 LRU 淘汰
+        :param validate_after: 快照在多少秒内无需核对版本即可直接使用
+        """
+        self.max_documents = max_documents
+        self.validate_after = validate_after
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._flight = AsyncSingleFlight()
+        self._stats = {"hits": 0, "validated": 0, "loads": 0, "patched": 0, "invalidated": 0}
+
+    @classmethod
+    def from_env(cls):
+        """
+        根据环境变量创建快照缓存
+        FEISHU_SNAPSHOT_MAX_DOCUMENTS: 最多缓存的文档数
+        FEISHU_SNAPSHOT_VALIDATE_AFTER: 核对版本的间隔（秒）
+        """
+        return cls(
+            max_documents=int(os.getenv('FEISHU_SNAPSHOT_MAX_DOCUMENTS', 64)),
+            validate_after=float(os.getenv('FEISHU_SNAPSHOT_VALIDATE_AFTER', 30)),
+        )
+
+    def _count(self, name):
+        with self._lock:
+            self._stats[name] += 1
+
+    def _store(self, key, tree):
+        with self._lock:
+            self._entries[key] = [tree, time.monotonic()]
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_documents:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, app_id, document_id):
+        """
+        丢弃某个文档的快照
+        """
+        with self._lock:
+            if self._entries.pop((app_id, document_id), None) is not None:
+                self._stats["invalidated"] += 1
+
+    @staticmethod
+    async def _current_revision(docx_handler, document_id):
+        # 文档信息有响应缓存，核对版本时必须绕过，否则在缓存有效期内发现不了其他人的修改
+        info = await docx_handler.get_document_info(document_id, use_cache=False)
+        if info.get('code') != 0:
+            raise Exception(f"获取文档信息失败: {info.get('msg', 'Unknown error')}")
+        return info.get('data', {}).get('document', {}).get('revision_id')
+
+    async def _load(self, key, docx_handler, document_id):
+        revision_id = await self._current_revision(docx_handler, document_id)
+        tree = await DocumentTree.load(docx_handler, document_id, revision_id if revision_id is not None else -1)
+        tree.revision_id = revision_id
+        self._store(key, tree)
+        self._count("loads")
+        return tree
+
+    async def get_tree(self, docx_handler, document_id):
+        """
+        获取文档的块索引，优先使用缓存的快照
+        :param docx_handler: 已初始化的异步 FeishuDocxAPIHandler
+        :param document_id: 文档 ID
+        :return: DocumentTree，调用方只读使用，不应修改
+        """
+        key = (docx_handler.FEISHU_APP_ID, document_id)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+        if entry is not None:
+            tree, checked_at = entry
+            if time.monotonic() - checked_at < self.validate_after:
+                self._count("hits")
+                return tree
+            if await self._current_revision(docx_handler, document_id) == tree.revision_id:
+                entry[1] = time.monotonic()
+                self._count("validated")
+                return tree
+            self.invalidate(*key)
+        return await self._flight.do(key, self._load, key, docx_handler, document_id)
+
+    def _apply(self, app_id, document_id, response, patch):
+        """
+        根据写接口的响应更新快照；响应的版本号不是快照版本 + 1 时说明有其他写入，丢弃快照
+        """
+        key = (app_id, document_id)
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is None:
+            return
+        tree = entry[0]
+        revision_id = response.get('data', {}).get('document_revision_id') if response.get('code') == 0 else None
+        if revision_id is None or tree.revision_id is None or revision_id != tree.revision_id + 1:
+            self.invalidate(app_id, document_id)
+            return
+        try:
+            patch(tree)
+        except (KeyError, ValueError, IndexError):
+            self.invalidate(app_id, document_id)
+            return
+        tree.revision_id = revision_id
+        self._count("patched")
+
+    def apply_create_block(self, app_id, document_id, parent_id, index, response):
+        """
+        create_block 成功后，将响应中的新块插入快照
+        """
+        def patch(tree):
+            created = response['data']['children']
+            tree.insert_blocks(parent_id, index, [block['block_id'] for block in created], created)
+        self._apply(app_id, document_id, response, patch)
+
+    def apply_create_descendant_blocks(self, app_id, document_id, parent_id, index, children_ids, response):
+        """
+        create_descendant_blocks 成功后，根据临时 ID 与真实 ID 的对应关系将新块插入快照
+        """
+        def patch(tree):
+            data = response['data']
+            relations = {item['temporary_block_id']: item['block_id'] for item in data.get('block_id_relations', [])}
+            tree.insert_blocks(parent_id, index, [relations[child_id] for child_id in children_ids], data['children'])
+        self._apply(app_id, document_id, response, patch)
+
+    def apply_batch_update(self, app_id, document_id, response):
+        """
+        batch_update_blocks 成功后，用响应中的块替换快照中的块
+        """
+        self._apply(app_id, document_id, response, lambda tree: tree.replace_blocks(response['data'].get('blocks', [])))
+
+    def apply_update_block(self, app_id, document_id, response):
+        """
+        update_block 成功后，用响应中的块替换快照中的块
+        """
+        self._apply(app_id, document_id, response, lambda tree: tree.replace_blocks([response['data']['block']]))
+
+    def apply_delete(self, app_id, document_id, parent_id, start_index, end_index, response):
+        """
+        delete_block 成功后，从快照中删除对应范围的子块
+        """
+        self._apply(app_id, document_id, response, lambda tree: tree.delete_children(parent_id, start_index, end_index))
+
+    def stats(self):
+        """
+        :return: 命中、核对、下载、就地更新、丢弃次数及当前缓存的文档数
+        """
+        with self._lock:
+            return {**self._stats, "documents": len(self._entries)}
+
+
+document_snapshots = DocumentSnapshotCache.from_env()
@@ -0,0 +1,228 @@
+# file name: feishu_document_sync.py
+import difflib
+import hashlib
+import json
+from urllib.parse import unquote
+
+from api.app.handlers.feishu_docx_api_handler_async import BlockType, BlockBatchUpdateRequestBuilder
+
+# 不参与内容比较的块字段
+IGNORED_BLOCK_KEYS = {"block_id", "parent_id", "children", "revision_id", "comment_ids"}
+
+# 只影响外观的字段（callout 每次发布时随机生成的颜色和表情），不参与内容比较
+COSMETIC_KEYS = {"background_color", "border_color", "emoji_id", "text_color"}
+
+
+def _normalize(value):
+    """
+    规范化块内容：去掉 False、空值和默认对齐方式，解码链接中的 URL，
+    使接口返回的完整结构与 BlockFactory 生成的精简结构得到相同的结果
+    """
+    if isinstance(value, dict):
+        result = {}
+        for key, item in value.items():
+            if key in COSMETIC_KEYS or (key == "align" and item == 1):
+                continue
+            if key == "url" and isinstance(item, str):
+                item = unquote(item)
+            item = _normalize(item)
+            if item in (None, False, "", {}, []):
+                continue
+            result[key] = item
+        return result
+    if isinstance(value, list):
+        return [_normalize(item) for item in value]
+    return value
+
+
+def _digest(value):
+    return hashlib.sha1(json.dumps(value, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+class _BlockHasher:
+    """
+    计算块的稳定内容哈希：frame 为块类型和样式，elements 为文本内容，deep 还包含全部子孙块
+    """
+
+    def __init__(self, blocks):
+        self.blocks = blocks
+        self._cache = {}
+
+    def children(self, block_id):
+        return [child_id for child_id in self.blocks[block_id].get('children') or [] if child_id in self.blocks]
+
+    def hashes(self, block_id):
+        """
+        :return: (frame, elements, deep)
+        """
+        if block_id in self._cache:
+            return self._cache[block_id]
+        # 先迭代计算所有子孙块，避免深层嵌套时递归过深
+        stack, order = [block_id], []
+        while stack:
+            current = stack.pop()
+            if current in self._cache:
+                continue
+            order.append(current)
+            stack.extend(self.children(current))
+        for current in reversed(order):
+            block = self.blocks[current]
+            name = BlockType.get_string_by_position(block.get('block_type'))
+            payload = dict(block.get(name) or {}) if name else {}
+            elements = payload.pop('elements', None)
+            frame = _digest(_normalize({
+                "block_type": block.get('block_type'),
+                "payload": payload,
+                "extra": {key: item for key, item in block.items() if key not in IGNORED_BLOCK_KEYS and key != name}
+            }))
+            elements_hash = _digest(_normalize(elements or []))
+            deep = _digest([frame, elements_hash, [self._cache[child_id][2] for child_id in self.children(current)]])
+            self._cache[current] = (frame, elements_hash, deep)
+        return self._cache[block_id]
+
+    def elements(self, block_id):
+        block = self.blocks[block_id]
+        name = BlockType.get_string_by_position(block.get('block_type'))
+        payload = block.get(name) if name else None
+        return payload.get('elements') if isinstance(payload, dict) else None
+
+    def subtree(self, block_id):
+        result, stack = [], [block_id]
+        while stack:
+            block = self.blocks[stack.pop()]
+            result.append(block)
+            stack.extend(reversed(self.children(block['block_id'])))
+        return result
+
+
+class DocumentSyncEngine:
+    """
+    期望状态同步：比较目标块树和文档中的现有块，只提交必要的新增、更新和删除操作
+
+    块按内容哈希比较（忽略块 ID 和 callout 的随机样式），相同的块保持不动；
+    类型和样式相同、仅文本不同的块用批量更新修改文本，子块不同时递归比较子块；
+    其余差异删除旧块并创建新块。同一父块下的操作从后往前执行，保证索引始终有效。
+    """
+
+    def __init__(self, docx_handler, tree):
+        """
+        :param docx_handler: 已初始化的异步 FeishuDocxAPIHandler
+        :param tree: 文档当前的 DocumentTree
+        """
+        self.docx_handler = docx_handler
+        self.tree = tree
+
+    def plan(self, parent_id, children_ids, descendants, start_index=0, end_index=None):
+        """
+        计算把父块下 [start_index, end_index) 范围内的子块同步为目标块树所需的操作
+        :param parent_id: 父块 ID
+        :param children_ids: 目标块树的直接子块临时 ID
+        :param descendants: 目标块树的所有块
+        :param start_index: 同步范围的起始位置
+        :param end_index: 同步范围的结束位置（不含），None 表示到末尾
+        :return: 操作列表，按执行顺序排列，每项的 op 为 update、delete 或 create
+        """
+        live = _BlockHasher(self.tree.blocks)
+        target = _BlockHasher({block['block_id']: block for block in descendants})
+        live_ids = live.children(parent_id)
+        end_index = len(live_ids) if end_index is None else min(end_index, len(live_ids))
+
+        updates, structural = [], []
+        stack = [(parent_id, start_index, live_ids[start_index:end_index], list(children_ids))]
+        while stack:
+            parent, offset, live_children, target_children = stack.pop()
+            self._diff(live, target, parent, offset, live_children, target_children, updates, structural, stack)
+        return updates + structural
+
+    def _diff(self, live, target, parent, offset, live_children, target_children, updates, structural, stack):
+        matcher = difflib.SequenceMatcher(
+            None,
+            [live.hashes(block_id)[2] for block_id in live_children],
+            [target.hashes(block_id)[2] for block_id in target_children],
+            autojunk=False
+        )
+        # 从后往前生成操作，前面位置的索引不受影响
+        for tag, i1, i2, j1, j2 in reversed(matcher.get_opcodes()):
+            if tag == 'equal':
+                continue
+            paired = min(i2 - i1, j2 - j1)
+            if i2 - i1 > paired:
+                structural.append({"op": "delete", "parent": parent, "start": offset + i1 + paired, "end": offset + i2})
+            if j2 - j1 > paired:
+                self._create(target, parent, offset + i1 + paired, target_children[j1 + paired:j2], structural)
+
+            # 逐对比较，类型和样式相同的块就地修改，连续无法就地修改的块合并为一次删除和一次创建
+            run_end = None
+            for k in reversed(range(paired)):
+                live_id, target_id = live_children[i1 + k], target_children[j1 + k]
+                live_frame, live_elements, _ = live.hashes(live_id)
+                target_frame, target_elements, _ = target.hashes(target_id)
+                if live_frame == target_frame:
+                    if run_end is not None:
+                        self._replace(target, parent, offset, i1 + k + 1, run_end, target_children, j1 - i1, structural)
+                        run_end = None
+                    if live_elements != target_elements and target.elements(target_id) is not None:
+                        updates.append({"op": "update", "block_id": live_id, "elements": target.elements(target_id)})
+                    live_grandchildren, target_grandchildren = live.children(live_id), target.children(target_id)
+                    if [live.hashes(block_id)[2] for block_id in live_grandchildren] != \
+                            [target.hashes(block_id)[2] for block_id in target_grandchildren]:
+                        stack.append((live_id, 0, live_grandchildren, target_grandchildren))
+                elif run_end is None:
+                    run_end = i1 + k + 1
+            if run_end is not None:
+                self._replace(target, parent, offset, i1, run_end, target_children, j1 - i1, structural)
+
+    def _replace(self, target, parent, offset, start, end, target_children, shift, structural):
+        structural.append({"op": "delete", "parent": parent, "start": offset + start, "end": offset + end})
+        self._create(target, parent, offset + start, target_children[start + shift:end + shift], structural)
+
+    @staticmethod
+    def _create(target, parent, index, target_ids, structural):
+        descendants = []
+        for block_id in target_ids:
+            descendants.extend(target.subtree(block_id))
+        structural.append({"op": "create", "parent": parent, "index": index, "children_ids": list(target_ids), "descendants": descendants})
+
+    async def apply(self, document_id, operations, on_batch=None):
+        """
+        执行 plan 生成的操作
+        :param on_batch: 可选的回调，传给 create_descendant_blocks_chunked，在每个新建块的请求完成后调用
+        :return: 执行结果，包含请求数和新增、更新、删除的块数；某个请求失败时返回其 code 和 msg
+        """
+        summary = {"requests": 0, "created": 0, "updated": 0, "deleted": 0}
+        builder = BlockBatchUpdateRequestBuilder()
+        for operation in operations:
+            if operation['op'] == 'update':
+                builder.add_update_text_elements(operation['block_id'], operation['elements'])
+        if builder.build():
+            response = await self.docx_handler.batch_update_blocks_planned(document_id, builder.build())
+            summary['requests'] += response.get('data', {}).get('requests', 0)
+            if response.get('code') != 0:
+                return {"code": response.get('code'), "msg": response.get('msg'), "data": summary}
+            summary['updated'] += len(builder.build())
+
+        for operation in operations:
+            if operation['op'] == 'delete':
+                response = await self.docx_handler.delete_block(document_id, operation['parent'], operation['start'], operation['end'])
+                summary['requests'] += 1
+                summary['deleted'] += operation['end'] - operation['start']
+            elif operation['op'] == 'create':
+                response = await self.docx_handler.create_descendant_blocks_chunked(
+                    document_id, operation['parent'], operation['children_ids'], operation['descendants'], operation['index'],
+                    on_batch=on_batch
+                )
+                summary['requests'] += response.get('data', {}).get('requests', 0)
+                summary['created'] += len(operation['descendants'])
+            else:
+                continue
+            if response.get('code') != 0:
+                return {"code": response.get('code'), "msg": response.get('msg'), "data": summary}
+        return {"code": 0, "msg": "success", "data": summary}
+
+    async def sync(self, document_id, parent_id, children_ids, descendants, start_index=0, end_index=None, on_batch=None):
+        """
+        把父块下 [start_index, end_index) 范围内的子块同步为目标块树
+        :return: 同 apply
+        """
+        operations = self.plan(parent_id, children_ids, descendants, start_index, end_index)
+        return await self.apply(document_id, operations, on_batch)
@@ -0,0 +1,292 @@
+# file name: feishu_document_tree.py
+from collections import defaultdict
+
+from api.app.handlers.feishu_docx_api_handler_async import BlockType
+
+
+class DocumentTree:
+    """
+    文档块的内存索引，由文档的全部块一次性构建
+
+    建立 block_id → 块、父块、在父块中的位置和按块类型的索引，
+    查找块、父块和插入位置时不再需要额外的接口调用。
+    """
+
+    def __init__(self, blocks, document_id=None, revision_id=None):
+        """
+        :param blocks: 文档的全部块（get_document_blocks 返回的 items）
+        :param document_id: 文档 ID
+        :param revision_id: 块列表对应的文档版本
+        """
+        self.document_id = document_id
+        self.revision_id = revision_id
+        self.blocks = {}
+        self.parents = {}
+        self.positions = {}
+        self.root_id = document_id
+        self._by_type = None
+        self._order = None
+        for block in blocks:
+            self.blocks[block['block_id']] = block
+        for block_id, block in self.blocks.items():
+            if block.get('block_type') == BlockType.PAGE.position and not block.get('parent_id'):
+                self.root_id = block_id
+            self._index_children(block_id)
+
+    @classmethod
+    async def load(cls, docx_handler, document_id, document_revision_id=-1):
+        """
+        下载文档的全部块并构建索引
+        :param docx_handler: 已初始化的异步 FeishuDocxAPIHandler
+        :param document_id: 文档 ID
+        :param document_revision_id: 查询的文档版本，-1 表示最新版本
+        :return: DocumentTree
+        """
+        block_map = await docx_handler.get_document_block_map(document_id, document_revision_id)
+        return cls(block_map.values(), document_id)
+
+    def _index_children(self, block_id):
+        for position, child_id in enumerate(self.blocks[block_id].get('children') or []):
+            self.parents[child_id] = block_id
+            self.positions[child_id] = position
+
+    def _invalidate_indexes(self):
+        self._by_type = None
+        self._order = None
+
+    def _set_children(self, parent_id, children):
+        # 块字典可能与其他调用方共享（合并的读请求），修改前先复制
+        parent = dict(self.blocks[parent_id])
+        parent['children'] = children
+        self.blocks[parent_id] = parent
+        self._index_children(parent_id)
+
+    def insert_blocks(self, parent_id, index, top_ids, created_blocks):
+        """
+        将新创建的块插入索引（根据写接口的响应就地更新，无需重新下载）
+        :param parent_id: 父块 ID
+        :param index: 插入位置，-1 表示追加到末尾
+        :param top_ids: 直接插入到父块下的块 ID，按顺序排列
+        :param created_blocks: 新创建的全部块（包含嵌套的子孙块）
+        :raises KeyError: 父块不在索引中时抛出
+        """
+        children = list(self.blocks[parent_id].get('children') or [])
+        if index is None or index < 0 or index > len(children):
+            index = len(children)
+        children[index:index] = top_ids
+        for block in created_blocks:
+            self.blocks[block['block_id']] = block
+        for block in created_blocks:
+            self._index_children(block['block_id'])
+        self._set_children(parent_id, children)
+        self._invalidate_indexes()
+
+    def replace_blocks(self, blocks):
+        """
+        用更新后的块替换索引中的块，响应中未返回 children 时保留原有的子块
+        """
+        for block in blocks:
+            current = self.blocks.get(block['block_id'])
+            if current is not None and 'children' not in block and current.get('children'):
+                block = {**block, 'children': current['children']}
+            self.blocks[block['block_id']] = block
+        self._invalidate_indexes()
+
+    def delete_children(self, parent_id, start_index, end_index):
+        """
+        删除父块下 [start_index, end_index) 范围内的子块及其全部子孙块
+        """
+        children = list(self.blocks[parent_id].get('children') or [])
+        removed = children[start_index:end_index]
+        del children[start_index:end_index]
+        for child_id in removed:
+            for block in list(self.walk(child_id)):
+                self.blocks.pop(block['block_id'], None)
+                self.parents.pop(block['block_id'], None)
+                self.positions.pop(block['block_id'], None)
+        self._set_children(parent_id, children)
+        self._invalidate_indexes()
+
+    def __len__(self):
+        return len(self.blocks)
+
+    def __contains__(self, block_id):
+        return block_id in self.blocks
+
+    def get(self, block_id):
+        """
+        :return: 块的字典，不存在时返回 None
+        """
+        return self.blocks.get(block_id)
+
+    def parent_of(self, block_id):
+        """
+        :return: 父块 ID，根块或不存在时返回 None
+        """
+        parent_id = self.parents.get(block_id)
+        if parent_id is None and block_id in self.blocks:
+            parent_id = self.blocks[block_id].get('parent_id') or None
+        return parent_id
+
+    def index_of(self, block_id):
+        """
+        :return: 块在父块 children 中的位置，未知时返回 -1
+        """
+        return self.positions.get(block_id, -1)
+
+    def children(self, block_id):
+        """
+        :return: 子块列表，按文档顺序排列
+        """
+        return [self.blocks[child_id] for child_id in self.blocks.get(block_id, {}).get('children') or []
+                if child_id in self.blocks]
+
+    def insertion_point(self, block_id):
+        """
+        获取在某个块之后插入新块所需的父块和位置
+        :return: (parent_id, target_index)，新块应插入到 target_index + 1
+        :raises ValueError: 块不存在或没有父块时抛出
+        """
+        parent_id = self.parent_of(block_id)
+        target_index = self.index_of(block_id)
+        if parent_id is None or target_index == -1:
+            raise ValueError(f"未找到块 {block_id} 的位置")
+        return parent_id, target_index
+
+    def walk(self, start_id=None):
+        """
+        按文档顺序（先序）遍历块，使用显式栈，不受递归深度限制
+        :param start_id: 起始块 ID，默认为根块
+        :return: 块的生成器
+        """
+        start_id = start_id or self.root_id
+        if start_id not in self.blocks:
+            return
+        stack = [start_id]
+        while stack:
+            block = self.blocks[stack.pop()]
+            yield block
+            children = block.get('children') or []
+            stack.extend(child_id for child_id in reversed(children) if child_id in self.blocks)
+
+    def document_order(self):
+        """
+        :return: block_id 到文档顺序序号的字典
+        """
+        if self._order is None:
+            self._order = {block['block_id']: rank for rank, block in enumerate(self.walk())}
+            # 无法从根块到达的块排在最后，保持列表中的顺序
+            for block_id in self.blocks:
+                self._order.setdefault(block_id, len(self._order))
+        return self._order
+
+    def blocks_of_type(self, block_type):
+        """
+        :param block_type: BlockType 或块类型编号
+        :return: 该类型的全部块，按文档顺序排列
+        """
+        if isinstance(block_type, BlockType):
+            block_type = block_type.position
+        if self._by_type is None:
+            order = self.document_order()
+            by_type = defaultdict(list)
+            for block_id in sorted(self.blocks, key=order.__getitem__):
+                block = self.blocks[block_id]
+                by_type[block.get('block_type')].append(block)
+            self._by_type = by_type
+        return self._by_type.get(block_type, [])
+
+    @staticmethod
+    def text_of(block):
+        """
+        提取块的纯文本，支持所有带 elements 的块类型（文本、标题、列表、代码、引用、待办、callout 等）
+        :return: 文本内容，不含文本的块返回空字符串
+        """
+        name = BlockType.get_string_by_position(block.get('block_type'))
+        payload = block.get(name) if name else None
+        if not isinstance(payload, dict):
+            return ""
+        parts = []
+        for element in payload.get('elements') or []:
+            if 'text_run' in element:
+                parts.append(element['text_run'].get('content', ''))
+            elif 'mention_doc' in element:
+                parts.append(element['mention_doc'].get('title', ''))
+            elif 'equation' in element:
+                parts.append(element['equation'].get('content', ''))
+        return "".join(parts)
+
+    def find_all(self, text=None, block_type=None):
+        """
+        查找包含指定文本且类型匹配的所有块
+        :param text: 要查找的文字内容，None 表示不限
+        :param block_type: BlockType 或块类型编号，None 表示不限
+        :return: 匹配的块列表，按文档顺序排列
+        """
+        candidates = self.walk() if block_type is None else self.blocks_of_type(block_type)
+        return [block for block in candidates if text is None or text in self.text_of(block)]
+
+    def find(self, text=None, block_type=None):
+        """
+        查找第一个包含指定文本且类型匹配的块
+        :return: 块 ID，未找到时返回 None
+        """
+        candidates = self.walk() if block_type is None else self.blocks_of_type(block_type)
+        for block in candidates:
+            if text is None or text in self.text_of(block):
+                return block['block_id']
+        return None
+
+    def search(self, queries):
+        """
+        一次遍历文档，同时执行多个查询
+        :param queries: 查询列表，每个查询是包含以下可选键的字典：
+            text: 要包含的文字；ignore_case: 为 True 时 text 需为小写，按不区分大小写比较；
+            pattern: 已编译的正则表达式；
+            block_types: 块类型编号的集合；limit: 最多返回的匹配数
+        :return: 与 queries 顺序一致的匹配列表，每个匹配包含 block_id、block_type、text、
+            parent_id、index 和 path（从根块到父块的块 ID）
+        """
+        results = [[] for _ in queries]
+        pending = [i for i, query in enumerate(queries) if query.get('limit') != 0]
+        if not pending or self.root_id not in self.blocks:
+            return results
+        path = []
+        stack = [(self.root_id, 0)]
+        while stack and pending:
+            block_id, depth = stack.pop()
+            del path[depth:]
+            block = self.blocks[block_id]
+            text = lowered = None
+            for i in list(pending):
+                query = queries[i]
+                block_types = query.get('block_types')
+                if block_types and block.get('block_type') not in block_types:
+                    continue
+                if query.get('text') is not None or query.get('pattern') is not None:
+                    if text is None:
+                        text = self.text_of(block)
+                    if query.get('text') is not None:
+                        if query.get('ignore_case'):
+                            if lowered is None:
+                                lowered = text.lower()
+                            if query['text'] not in lowered:
+                                continue
+                        elif query['text'] not in text:
+                            continue
+                    if query.get('pattern') is not None and not query['pattern'].search(text):
+                        continue
+                results[i].append({
+                    "block_id": block_id,
+                    "block_type": block.get('block_type'),
+                    "text": text if text is not None else self.text_of(block),
+                    "parent_id": self.parent_of(block_id),
+                    "index": self.index_of(block_id),
+                    "path": list(path)
+                })
+                if query.get('limit') and len(results[i]) >= query['limit']:
+                    pending.remove(i)
+            path.append(block_id)
+            children = block.get('children') or []
+            stack.extend((child_id, depth + 1) for child_id in reversed(children) if child_id in self.blocks)
+        return results
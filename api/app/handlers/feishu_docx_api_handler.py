@@ -62,10 +62,11 @@ class BlockType(Enum):
 
     @classmethod
     def get_string_by_position(cls, position):
-        for block in cls:
-            if block.position == position:
-                return block.string_value
-        return None
+        return _BLOCK_TYPE_NAMES.get(position)
+
+
+# 块类型编号到名称的查找表，避免每次线性扫描枚举
+_BLOCK_TYPE_NAMES = {block.position: block.string_value for block in BlockType}
 
 
 class BlockFactory:
@@ -168,7 +169,7 @@ class BlockFactory:
         }
 
     @staticmethod
-    def create_content_blocks(content: dict) -> tuple[list, list]:
+    def create_content_blocks(content: dict, id_prefix: str = "") -> tuple[list, list]:
         """
         创建包含标题、要点和链接的内容块结构
         
@@ -179,6 +180,7 @@ class BlockFactory:
                     "bullets": list[str],
                     "link": str
                 }
+            id_prefix (str): 临时块ID的前缀，多组内容放在同一棵块树中时用于区分
                 
         Returns:
             tuple[list, list]: 返回两个列表
@@ -191,7 +193,7 @@ class BlockFactory:
         
         def get_next_id(prefix="block"):
             nonlocal current_id
-            block_id = f"{prefix}_{current_id}"
+            block_id = f"{id_prefix}{prefix}_{current_id}"
             current_id += 1
             return block_id
             
@@ -268,6 +270,64 @@ class BlockFactory:
             
         return children_ids, descendants
 
+    @staticmethod
+    def create_issue_blocks(date_str: str, contents: list, callout_styles: list = None) -> tuple[list, list]:
+        """
+        创建一期小报的完整块结构：日期标题，以及每条内容对应的一个 callout（包含标题、要点和链接）
+
+        整棵树可以通过一次 create_descendant_blocks 调用写入文档。
+        
+        Args:
+            date_str (str): 日期标题的内容
+            contents (list): 内容字典列表，按显示顺序排列，格式同 create_content_blocks
+            callout_styles (list): 与 contents 一一对应的 (background_color, border_color, emoji_id)，
+                默认全部为 (2, 2, "bulb")
+                
+        Returns:
+            tuple[list, list]: 返回两个列表
+                - 第一个列表包含直接子块的ID（日期标题和各个callout）
+                - 第二个列表包含所有块的详细信息
+        """
+        heading_id = "date_heading"
+        heading_block = BlockFactory.create_block(
+            block_type=BlockType.HEADING2,
+            text_runs=[{
+                "content": date_str,
+                "text_element_style": {
+                    "bold": False,
+                    "inline_code": False,
+                    "italic": False,
+                    "strikethrough": False,
+                    "underline": False
+                }
+            }],
+            style={
+                "align": 1,
+                "folded": False
+            }
+        )
+        descendants = [{"block_id": heading_id, **heading_block}]
+        children_ids = [heading_id]
+
+        for i, content in enumerate(contents, start=1):
+            background_color, border_color, emoji_id = callout_styles[i - 1] if callout_styles else (2, 2, "bulb")
+            callout_id = f"callout_{i}"
+            item_ids, item_blocks = BlockFactory.create_content_blocks(content, id_prefix=f"{callout_id}_")
+            descendants.append({
+                "block_id": callout_id,
+                "block_type": BlockType.CALLOUT.position,
+                f"{BlockType.CALLOUT.string_value}": {
+                    "background_color": background_color,
+                    "border_color": border_color,
+                    "emoji_id": emoji_id
+                },
+                "children": item_ids
+            })
+            descendants.extend(item_blocks)
+            children_ids.append(callout_id)
+
+        return children_ids, descendants
+
 class BlockBatchUpdateRequestBuilder:
     def __init__(self):
         self.requests = []
@@ -456,7 +516,7 @@ class FeishuDocxAPIHandler:
         self.FEISHU_APP_ID = FEISHU_APP_ID
         self.FEISHU_APP_SECRET = FEISHU_APP_SECRET
         self.FEISHU_TENANT_ACCESS_TOKEN = get_tenant_access_token(self.FEISHU_APP_ID, self.FEISHU_APP_SECRET)
-        self.feishu_docx_api = FeishuDocxAPI(self.FEISHU_TENANT_ACCESS_TOKEN)
+        self.feishu_docx_api = FeishuDocxAPI(self.FEISHU_TENANT_ACCESS_TOKEN, self.FEISHU_APP_ID)
 
     def get_document_raw_content(self, document_id):
         """
@@ -485,13 +545,38 @@ class FeishuDocxAPIHandler:
         """
         return self.feishu_docx_api.get_document_info(document_id)
 
-    def get_document_blocks(self, document_id):
+    def get_document_blocks(self, document_id, page_size=500, page_token=None, document_revision_id=-1):
+        """
+        获取文档的一页块
+        :param document_id: 文档 ID
+        :param page_size: 分页大小，最大值为 500
+        :param page_token: 分页标记，第一次请求不填
+        :param document_revision_id: 查询的文档版本，-1 表示最新版本
+        :return: 文档的块信息，has_more 为 True 时需要用 page_token 继续获取
+        """
+        return self.feishu_docx_api.get_document_blocks(document_id, page_size, page_token, document_revision_id)
+
+    def iter_document_blocks(self, document_id, page_size=500, document_revision_id=-1):
         """
-        获取文档的所有块
+        逐个返回文档的所有块，自动翻页
         :param document_id: 文档 ID
-        :return: 文档的块信息
+        :param page_size: 分页大小，最大值为 500
+        :param document_revision_id: 查询的文档版本，-1 表示最新版本
+        :return: 块的生成器
         """
-        return self.feishu_docx_api.get_document_blocks(document_id)
+        return self.feishu_docx_api.iter_document_blocks(document_id, page_size, document_revision_id)
+
+    def get_document_block_map(self, document_id, document_revision_id=-1):
+        """
+        获取文档的全部块，构建 block_id 到块的映射
+        :param document_id: 文档 ID
+        :param document_revision_id: 查询的文档版本，-1 表示最新版本
+        :return: 按文档顺序排列的 {block_id: block} 字典
+        """
+        block_map = {}
+        for block in self.iter_document_blocks(document_id, document_revision_id=document_revision_id):
+            block_map[block['block_id']] = block
+        return block_map
 
     def get_block_contents(self, document_id, block_id):
         """
@@ -511,23 +596,24 @@ class FeishuDocxAPIHandler:
         """
         return self.feishu_docx_api.get_block_children(document_id, block_id)
 
-    def create_block(self, document_id, block_id, children: list, index=-1):
+    def create_block(self, document_id, block_id, children: list, index=-1, client_token=None):
         """
         在文档中创建块
         :param document_id: 文档 ID
         :param block_id: 父块 ID
         :param children: 子块内容
         :param index: 插入位置
+        :param client_token: 操作的唯一标识，用于幂等操作
         :return: 创建块的响应
         """
-        response = self.feishu_docx_api.create_block(document_id, block_id, children, index)
+        response = self.feishu_docx_api.create_block(document_id, block_id, children, index, client_token)
         if response.get('code') == 0:
             print(f"块创建成功: {BlockType.get_string_by_position(children[0]['block_type'])}")
         else:
             print(f"块创建失败: {response.get('msg')}")
         return response
 
-    def create_descendant_blocks(self, document_id, block_id, children_ids, descendants, index=0, document_revision_id=-1):
+    def create_descendant_blocks(self, document_id, block_id, children_ids, descendants, index=0, document_revision_id=-1, client_token=None):
         """
         在文档中创建嵌套的块结构
         """
@@ -537,7 +623,8 @@ class FeishuDocxAPIHandler:
             children_ids, 
             descendants, 
             index, 
-            document_revision_id
+            document_revision_id,
+            client_token
         )
         if response.get('code') == 0:
             print("嵌套块创建成功")
@@ -1,7 +1,9 @@
 # file name: feishu_docx_api_handler_async.py
 from api.app.utils.feishu_app_api_async import FeishuDocxAPI, get_tenant_access_token
+from collections import deque
 from enum import Enum
 import time
+import uuid
 
 class BlockType(Enum):
     PAGE = (1, "page")
@@ -63,10 +65,18 @@ class BlockType(Enum):
 
     @classmethod
     def get_string_by_position(cls, position):
-        for block in cls:
-            if block.position == position:
-                return block.string_value
-        return None
+        return _BLOCK_TYPE_NAMES.get(position)
+
+
+# 块类型编号到名称的查找表，避免每次线性扫描枚举
+_BLOCK_TYPE_NAMES = {block.position: block.string_value for block in BlockType}
+
+
+# create_descendant_blocks 单次请求的块数上限（children_id 和 descendants 各自的上限）
+MAX_DESCENDANTS_PER_REQUEST = 1000
+
+# batch_update_blocks 单次请求的操作数上限
+MAX_BATCH_UPDATE_REQUESTS = 200
 
 
 class BlockFactory:
@@ -170,7 +180,7 @@ class BlockFactory:
         }
     
     @staticmethod
-    def create_content_blocks(content: dict) -> tuple[list, list]:
+    def create_content_blocks(content: dict, id_prefix: str = "") -> tuple[list, list]:
         """
         创建包含标题、要点和链接的内容块结构
         
@@ -181,6 +191,7 @@ class BlockFactory:
                     "bullets": list[str],
                     "link": str
                 }
+            id_prefix (str): 临时块ID的前缀，多组内容放在同一棵块树中时用于区分
                 
         Returns:
             tuple[list, list]: 返回两个列表
@@ -193,7 +204,7 @@ class BlockFactory:
         
         def get_next_id(prefix="block"):
             nonlocal current_id
-            block_id = f"{prefix}_{current_id}"
+            block_id = f"{id_prefix}{prefix}_{current_id}"
             current_id += 1
             return block_id
             
@@ -270,6 +281,178 @@ class BlockFactory:
             
         return children_ids, descendants
 
+    @staticmethod
+    def create_issue_blocks(date_str: str, contents: list, callout_styles: list = None) -> tuple[list, list]:
+        """
+        创建一期小报的完整块结构：日期标题，以及每条内容对应的一个 callout（包含标题、要点和链接）
+
+        整棵树可以通过一次 create_descendant_blocks 调用写入文档。
+        
+        Args:
+            date_str (str): 日期标题的内容
+            contents (list): 内容字典列表，按显示顺序排列，格式同 create_content_blocks
+            callout_styles (list): 与 contents 一一对应的 (background_color, border_color, emoji_id)，
+                默认全部为 (2, 2, "bulb")
+                
+        Returns:
+            tuple[list, list]: 返回两个列表
+                - 第一个列表包含直接子块的ID（日期标题和各个callout）
+                - 第二个列表包含所有块的详细信息
+        """
+        heading_id = "date_heading"
+        heading_block = BlockFactory.create_block(
+            block_type=BlockType.HEADING2,
+            text_runs=[{
+                "content": date_str,
+                "text_element_style": {
+                    "bold": False,
+                    "inline_code": False,
+                    "italic": False,
+                    "strikethrough": False,
+                    "underline": False
+                }
+            }],
+            style={
+                "align": 1,
+                "folded": False
+            }
+        )
+        descendants = [{"block_id": heading_id, **heading_block}]
+        children_ids = [heading_id]
+
+        for i, content in enumerate(contents, start=1):
+            background_color, border_color, emoji_id = callout_styles[i - 1] if callout_styles else (2, 2, "bulb")
+            callout_id = f"callout_{i}"
+            item_ids, item_blocks = BlockFactory.create_content_blocks(content, id_prefix=f"{callout_id}_")
+            descendants.append({
+                "block_id": callout_id,
+                "block_type": BlockType.CALLOUT.position,
+                f"{BlockType.CALLOUT.string_value}": {
+                    "background_color": background_color,
+                    "border_color": border_color,
+                    "emoji_id": emoji_id
+                },
+                "children": item_ids
+            })
+            descendants.extend(item_blocks)
+            children_ids.append(callout_id)
+
+        return children_ids, descendants
+
+class DescendantBatchPlanner:
+    """
+    将超过单次请求上限的嵌套块树拆分为多个合法的 create_descendant_blocks 请求
+
+    每个请求只包含同一父块下连续的子块及其完整子树，尽量装满单次请求的块数上限；
+    子树本身超过上限时，先创建该块和能放下的前几个子块，其余子块作为续传请求，
+    以该块的临时ID为父块、以已创建的子块数为插入位置继续写入。
+    """
+
+    def __init__(self, children_ids: list, descendants: list, max_blocks: int = MAX_DESCENDANTS_PER_REQUEST):
+        """
+        :param children_ids: 直接子块的临时ID
+        :param descendants: 所有块的详细信息
+        :param max_blocks: 单次请求最多包含的块数
+        """
+        self.children_ids = list(children_ids)
+        self.blocks = {block['block_id']: block for block in descendants}
+        self.max_blocks = max(1, max_blocks)
+        self.sizes = self._subtree_sizes()
+
+    def _children_of(self, block_id):
+        children = self.blocks[block_id].get('children') or []
+        missing = [child_id for child_id in children if child_id not in self.blocks]
+        if missing:
+            raise ValueError(f"descendants 中缺少块: {missing}")
+        return children
+
+    def _subtree_sizes(self):
+        """
+        迭代计算每个块的子树大小（包含自身）
+        """
+        sizes = {}
+        for root_id in self.children_ids:
+            if root_id not in self.blocks:
+                raise ValueError(f"descendants 中缺少块: {root_id}")
+            stack = [(root_id, False)]
+            while stack:
+                block_id, expanded = stack.pop()
+                if expanded:
+                    sizes[block_id] = 1 + sum(sizes[child_id] for child_id in self._children_of(block_id))
+                elif block_id not in sizes:
+                    stack.append((block_id, True))
+                    stack.extend((child_id, False) for child_id in self._children_of(block_id))
+        return sizes
+
+    def _subtree(self, block_id):
+        """
+        按先序返回某个块的完整子树
+        """
+        result, stack = [], [block_id]
+        while stack:
+            block = self.blocks[stack.pop()]
+            result.append(block)
+            stack.extend(reversed(block.get('children') or []))
+        return result
+
+    def _pack(self, block_id, budget, tasks):
+        """
+        创建一个块及能放入 budget 的前几个子块，放不下的子块作为续传任务加入 tasks
+        """
+        children = self._children_of(block_id)
+        kept, blocks, used = [], [], 1
+        for child_id in children:
+            if used + self.sizes[child_id] > budget:
+                break
+            kept.append(child_id)
+            blocks.extend(self._subtree(child_id))
+            used += self.sizes[child_id]
+        if len(kept) < len(children):
+            tasks.append((block_id, len(kept), children[len(kept):]))
+        return [{**self.blocks[block_id], "children": kept}] + blocks
+
+    def plan(self, parent_id: str, index: int = 0) -> list:
+        """
+        生成请求计划
+        :param parent_id: 写入位置的父块ID（真实ID）
+        :param index: 插入位置，-1 表示追加到末尾
+        :return: 按顺序执行的请求列表，每项包含 parent（真实ID或先前请求中的临时ID）、
+            index、children_ids 和 descendants
+        """
+        batches = []
+        tasks = deque([(parent_id, index, self.children_ids)])
+        while tasks:
+            parent, base_index, child_ids = tasks.popleft()
+            position = base_index
+            current_ids, current_blocks = [], []
+
+            def flush():
+                nonlocal position, current_ids, current_blocks
+                if current_ids:
+                    batches.append({
+                        "parent": parent,
+                        "index": position,
+                        "children_ids": current_ids,
+                        "descendants": current_blocks
+                    })
+                    if position != -1:
+                        position += len(current_ids)
+                current_ids, current_blocks = [], []
+
+            for child_id in child_ids:
+                size = self.sizes[child_id]
+                if len(current_blocks) + size > self.max_blocks:
+                    flush()
+                if size > self.max_blocks:
+                    current_ids, current_blocks = [child_id], self._pack(child_id, self.max_blocks, tasks)
+                    flush()
+                else:
+                    current_ids.append(child_id)
+                    current_blocks.extend(self._subtree(child_id))
+            flush()
+        return batches
+
+
 class BlockBatchUpdateRequestBuilder:
     def __init__(self):
         self.requests = []
@@ -453,14 +636,97 @@ class BlockBatchUpdateRequestBuilder:
         """
         return self.requests
 
+class BlockBatchUpdatePlanner:
+    """
+    批量更新请求的执行计划：合并同一块上的冗余操作，并按单次请求的上限拆分
+
+    对同一块的整体替换类操作（文本元素、图片、附件）只保留最后一次；
+    文本样式更新按字段合并；表格行列等结构性操作不能合并，保持原有顺序。
+    """
+
+    # 后一次会完全覆盖前一次结果的操作，同一块只保留最后一次
+    REPLACING_OPERATIONS = ("update_text_elements", "replace_image", "replace_file")
+
+    # 可以按字段合并的操作
+    MERGEABLE_OPERATIONS = ("update_text_style",)
+
+    def __init__(self, requests_list: list, max_requests: int = MAX_BATCH_UPDATE_REQUESTS):
+        """
+        :param requests_list: 批量更新请求列表，格式同 BlockBatchUpdateRequestBuilder.build() 的返回值
+        :param max_requests: 单次请求最多包含的操作数
+        """
+        self.requests_list = list(requests_list)
+        self.max_requests = max(1, max_requests)
+
+    @classmethod
+    def from_builder(cls, builder: "BlockBatchUpdateRequestBuilder", max_requests: int = MAX_BATCH_UPDATE_REQUESTS):
+        return cls(builder.build(), max_requests)
+
+    @staticmethod
+    def _operation_of(request: dict) -> str:
+        return next(key for key in request if key != "block_id")
+
+    @staticmethod
+    def _merge_text_style(previous: dict, current: dict) -> dict:
+        fields = list(previous.get("fields", []))
+        fields.extend(field for field in current.get("fields", []) if field not in fields)
+        return {
+            **previous,
+            **current,
+            "style": {**previous.get("style", {}), **current.get("style", {})},
+            "fields": fields
+        }
+
+    def merged(self) -> list:
+        """
+        合并后的操作列表，合并后的操作放在最后一次出现的位置
+        :return: 批量更新请求列表
+        """
+        result = []
+        slots = {}
+        for request in self.requests_list:
+            operation = self._operation_of(request)
+            key = (request["block_id"], operation)
+            if key in slots:
+                previous = result[slots[key]]
+                result[slots[key]] = None
+                if operation in self.MERGEABLE_OPERATIONS:
+                    request = {
+                        "block_id": request["block_id"],
+                        operation: self._merge_text_style(previous[operation], request[operation])
+                    }
+            if operation in self.REPLACING_OPERATIONS or operation in self.MERGEABLE_OPERATIONS:
+                slots[key] = len(result)
+            result.append(request)
+        return [request for request in result if request is not None]
+
+    def plan(self) -> list:
+        """
+        生成请求计划
+        :return: 按顺序执行的请求列表，每项包含 requests 和用于幂等重试的 client_token
+        """
+        merged = self.merged()
+        return [
+            {
+                "requests": merged[start:start + self.max_requests],
+                "client_token": str(uuid.uuid4())
+            }
+            for start in range(0, len(merged), self.max_requests)
+        ]
+
+
 class FeishuDocxAPIHandler:
-    def __init__(self, FEISHU_APP_ID, FEISHU_APP_SECRET):
+    def __init__(self, FEISHU_APP_ID, FEISHU_APP_SECRET, snapshot_cache=None):
+        """
+        :param snapshot_cache: 可选的 DocumentSnapshotCache，写操作成功后会根据响应更新其中的文档快照
+        """
         self.FEISHU_APP_ID = FEISHU_APP_ID
         self.FEISHU_APP_SECRET = FEISHU_APP_SECRET
+        self.snapshot_cache = snapshot_cache
 
     async def initialize(self):
         self.FEISHU_TENANT_ACCESS_TOKEN = await get_tenant_access_token(self.FEISHU_APP_ID, self.FEISHU_APP_SECRET)
-        self.feishu_docx_api = FeishuDocxAPI(self.FEISHU_TENANT_ACCESS_TOKEN)
+        self.feishu_docx_api = FeishuDocxAPI(self.FEISHU_TENANT_ACCESS_TOKEN, self.FEISHU_APP_ID)
 
     async def get_document_raw_content(self, document_id):
         """
@@ -481,21 +747,47 @@ class FeishuDocxAPIHandler:
         document_id = response.get('data', {}).get('document', {}).get('document_id')
         return document_id
 
-    async def get_document_info(self, document_id):
+    async def get_document_info(self, document_id, use_cache=True):
         """
         获取文档的基本信息
         :param document_id: 文档 ID
+        :param use_cache: 为 False 时不使用缓存的文档信息，用于获取最新的版本号
         :return: 文档的基本信息
         """
-        return await self.feishu_docx_api.get_document_info(document_id)
+        return await self.feishu_docx_api.get_document_info(document_id, use_cache)
+
+    async def get_document_blocks(self, document_id, page_size=500, page_token=None, document_revision_id=-1):
+        """
+        获取文档的一页块
+        :param document_id: 文档 ID
+        :param page_size: 分页大小，最大值为 500
+        :param page_token: 分页标记，第一次请求不填
+        :param document_revision_id: 查询的文档版本，-1 表示最新版本
+        :return: 文档的块信息，has_more 为 True 时需要用 page_token 继续获取
+        """
+        return await self.feishu_docx_api.get_document_blocks(document_id, page_size, page_token, document_revision_id)
+
+    def iter_document_blocks(self, document_id, page_size=500, document_revision_id=-1):
+        """
+        逐个返回文档的所有块，自动翻页
+        :param document_id: 文档 ID
+        :param page_size: 分页大小，最大值为 500
+        :param document_revision_id: 查询的文档版本，-1 表示最新版本
+        :return: 块的异步生成器
+        """
+        return self.feishu_docx_api.iter_document_blocks(document_id, page_size, document_revision_id)
 
-    async def get_document_blocks(self, document_id):
+    async def get_document_block_map(self, document_id, document_revision_id=-1):
         """
-        获取文档的所有块
+        获取文档的全部块，构建 block_id 到块的映射
         :param document_id: 文档 ID
-        :return: 文档的块信息
+        :param document_revision_id: 查询的文档版本，-1 表示最新版本
+        :return: 按文档顺序排列的 {block_id: block} 字典
         """
-        return await self.feishu_docx_api.get_document_blocks(document_id)
+        block_map = {}
+        async for block in self.iter_document_blocks(document_id, document_revision_id=document_revision_id):
+            block_map[block['block_id']] = block
+        return block_map
 
     async def get_block_contents(self, document_id, block_id):
         """
@@ -515,23 +807,26 @@ class FeishuDocxAPIHandler:
         """
         return await self.feishu_docx_api.get_block_children(document_id, block_id)
 
-    async def create_block(self, document_id, block_id, children: list, index=-1):
+    async def create_block(self, document_id, block_id, children: list, index=-1, client_token=None):
         """
         在文档中创建块
         :param document_id: 文档 ID
         :param block_id: 父块 ID
         :param children: 子块内容
         :param index: 插入位置
+        :param client_token: 操作的唯一标识，用于幂等操作
         :return: 创建块的响应
         """
-        response = await self.feishu_docx_api.create_block(document_id, block_id, children, index)
+        response = await self.feishu_docx_api.create_block(document_id, block_id, children, index, client_token)
+        if self.snapshot_cache is not None:
+            self.snapshot_cache.apply_create_block(self.FEISHU_APP_ID, document_id, block_id, index, response)
         if response.get('code') == 0:
             print(f"块创建成功: {BlockType.get_string_by_position(children[0]['block_type'])}")
         else:
             print(f"块创建失败: {response.get('msg')}")
         return response
 
-    async def create_descendant_blocks(self, document_id, block_id, children_ids, descendants, index=0, document_revision_id=-1):
+    async def create_descendant_blocks(self, document_id, block_id, children_ids, descendants, index=0, document_revision_id=-1, client_token=None):
         """
         在文档中创建嵌套的块结构
         """
@@ -541,14 +836,106 @@ class FeishuDocxAPIHandler:
             children_ids, 
             descendants, 
             index, 
-            document_revision_id
+            document_revision_id,
+            client_token
         )
+        if self.snapshot_cache is not None:
+            self.snapshot_cache.apply_create_descendant_blocks(self.FEISHU_APP_ID, document_id, block_id, index, children_ids, response)
         if response.get('code') == 0:
             print("嵌套块创建成功")
         else:
             print(f"嵌套块创建失败: {response.get('msg')}")
         return response
 
+    async def create_descendant_blocks_chunked(self, document_id, block_id, children_ids, descendants, index=0, document_revision_id=-1, max_blocks=MAX_DESCENDANTS_PER_REQUEST, on_batch=None):
+        """
+        创建任意大小的嵌套块结构，超过单次请求上限时自动拆分为多个请求依次提交
+        :param document_id: 文档 ID
+        :param block_id: 父块 ID
+        :param children_ids: 直接子块的临时 ID
+        :param descendants: 所有块的详细信息
+        :param index: 插入位置，-1 表示追加到末尾
+        :param document_revision_id: 第一个请求操作的文档版本，之后的请求使用上一个响应返回的版本
+        :param max_blocks: 单次请求最多包含的块数
+        :param on_batch: 可选的回调，每个请求完成后调用一次，参数为包含请求序号、块数、耗时（毫秒）、
+            返回码和本次新建块的 block_id_relations 的字典
+        :return: 合并后的响应，data 中包含全部新建的块、临时 ID 与真实 ID 的对应关系、最终的文档版本和请求数；
+            某个请求失败时返回其 code 和 msg，data 中为已经完成的部分
+        """
+        batches = DescendantBatchPlanner(children_ids, descendants, max_blocks).plan(block_id, index)
+        resolved = {}
+        merged = {
+            "children": [],
+            "block_id_relations": [],
+            "document_revision_id": document_revision_id,
+            "requests": 0
+        }
+        for batch in batches:
+            started = time.perf_counter()
+            response = await self.create_descendant_blocks(
+                document_id,
+                resolved.get(batch['parent'], batch['parent']),
+                batch['children_ids'],
+                batch['descendants'],
+                batch['index'],
+                merged['document_revision_id'],
+                str(uuid.uuid4())
+            )
+            merged['requests'] += 1
+            data = response.get('data') or {}
+            if on_batch is not None:
+                on_batch({
+                    "request": merged['requests'],
+                    "blocks": len(batch['descendants']),
+                    "latency_ms": round((time.perf_counter() - started) * 1000, 1),
+                    "code": response.get('code'),
+                    "block_id_relations": data.get('block_id_relations', []) if response.get('code') == 0 else []
+                })
+            if response.get('code') != 0:
+                return {"code": response.get('code'), "msg": response.get('msg'), "data": merged}
+            for relation in data.get('block_id_relations', []):
+                resolved[relation['temporary_block_id']] = relation['block_id']
+            merged['children'].extend(data.get('children', []))
+            merged['block_id_relations'].extend(data.get('block_id_relations', []))
+            merged['document_revision_id'] = data.get('document_revision_id', merged['document_revision_id'])
+        return {"code": 0, "msg": "success", "data": merged}
+
+
+    async def create_descendant_block_stream(self, document_id, block_id, chunks, index=-1, document_revision_id=-1, on_batch=None):
+        """
+        依次写入逐批生成的嵌套块结构（如 MarkdownCompiler.compile 的结果），每批按需继续拆分
+        :param document_id: 文档 ID
+        :param block_id: 父块 ID
+        :param chunks: 可迭代对象，每项为 (children_ids, descendants)
+        :param index: 第一批的插入位置，-1 表示追加到末尾，之后的批次紧接在前一批之后
+        :param document_revision_id: 第一个请求操作的文档版本
+        :param on_batch: 同 create_descendant_blocks_chunked，请求序号在所有批次中连续编号
+        :return: 同 create_descendant_blocks_chunked，data 中包含全部批次的结果
+        """
+        merged = {
+            "children": [],
+            "block_id_relations": [],
+            "document_revision_id": document_revision_id,
+            "requests": 0
+        }
+        def report(info):
+            on_batch({**info, "request": merged['requests'] + info['request']})
+
+        for children_ids, descendants in chunks:
+            response = await self.create_descendant_blocks_chunked(
+                document_id, block_id, children_ids, descendants, index, merged['document_revision_id'],
+                on_batch=report if on_batch is not None else None
+            )
+            data = response.get('data', {})
+            merged['children'].extend(data.get('children', []))
+            merged['block_id_relations'].extend(data.get('block_id_relations', []))
+            merged['document_revision_id'] = data.get('document_revision_id', merged['document_revision_id'])
+            merged['requests'] += data.get('requests', 0)
+            if response.get('code') != 0:
+                return {"code": response.get('code'), "msg": response.get('msg'), "data": merged}
+            if index != -1:
+                index += len(children_ids)
+        return {"code": 0, "msg": "success", "data": merged}
 
     async def update_block(self, document_id, block_id, operation: list):
         """
@@ -558,7 +945,10 @@ class FeishuDocxAPIHandler:
         :param operation: 更新操作的列表
         :return: 更新块的响应
         """
-        return await self.feishu_docx_api.update_block(document_id, block_id, operation)
+        response = await self.feishu_docx_api.update_block(document_id, block_id, operation)
+        if self.snapshot_cache is not None:
+            self.snapshot_cache.apply_update_block(self.FEISHU_APP_ID, document_id, response)
+        return response
 
     async def delete_block(self, document_id, block_id, start_index=0, end_index=1):
         """
@@ -569,7 +959,10 @@ class FeishuDocxAPIHandler:
         :param end_index: 结束删除的子块索引
         :return: 删除块的响应
         """
-        return await self.feishu_docx_api.delete_block(document_id, block_id, start_index, end_index)
+        response = await self.feishu_docx_api.delete_block(document_id, block_id, start_index, end_index)
+        if self.snapshot_cache is not None:
+            self.snapshot_cache.apply_delete(self.FEISHU_APP_ID, document_id, block_id, start_index, end_index, response)
+        return response
 
     async def batch_update_blocks(self, document_id, requests_list, document_revision_id=-1, client_token=None, user_id_type="open_id"):
         """
@@ -582,8 +975,46 @@ class FeishuDocxAPIHandler:
         :return: 批量更新块的响应
         """
         response = await self.feishu_docx_api.batch_update_blocks(document_id, requests_list, document_revision_id, client_token, user_id_type)
+        if self.snapshot_cache is not None:
+            self.snapshot_cache.apply_batch_update(self.FEISHU_APP_ID, document_id, response)
         if response.get('code') == 0:
             print("批量更新成功")
         else:
             print(f"批量更新失败: {response.get('msg')}")
-        return response
\ No newline at end of file
+        return response
+
+    async def batch_update_blocks_planned(self, document_id, requests_list, document_revision_id=-1, user_id_type="open_id", max_requests=MAX_BATCH_UPDATE_REQUESTS):
+        """
+        合并冗余操作后分批执行任意数量的批量更新
+        :param document_id: 文档 ID
+        :param requests_list: 批量更新块的请求列表，数量不受单次请求上限的限制
+        :param document_revision_id: 第一个请求操作的文档版本，之后的请求使用上一个响应返回的版本
+        :param user_id_type: 用户 ID 类型，默认为 "open_id"
+        :param max_requests: 单次请求最多包含的操作数
+        :return: 合并后的响应，data 中包含更新后的块、最终的文档版本、请求数以及合并前后的操作数；
+            某个请求失败时返回其 code 和 msg，data 中为已经完成的部分
+        """
+        planner = BlockBatchUpdatePlanner(requests_list, max_requests)
+        batches = planner.plan()
+        merged = {
+            "blocks": [],
+            "document_revision_id": document_revision_id,
+            "requests": 0,
+            "operations": sum(len(batch['requests']) for batch in batches),
+            "submitted_operations": len(planner.requests_list)
+        }
+        for batch in batches:
+            response = await self.batch_update_blocks(
+                document_id,
+                batch['requests'],
+                merged['document_revision_id'],
+                batch['client_token'],
+                user_id_type
+            )
+            merged['requests'] += 1
+            if response.get('code') != 0:
+                return {"code": response.get('code'), "msg": response.get('msg'), "data": merged}
+            data = response.get('data', {})
+            merged['blocks'].extend(data.get('blocks', []))
+            merged['document_revision_id'] = data.get('document_revision_id', merged['document_revision_id'])
+        return {"code": 0, "msg": "success", "data": merged}
@@ -6,7 +6,7 @@ class FeishuDriveAPIHandler:
         self.FEISHU_APP_ID = FEISHU_APP_ID
         self.FEISHU_APP_SECRET = FEISHU_APP_SECRET
         self.FEISHU_TENANT_ACCESS_TOKEN = get_tenant_access_token(self.FEISHU_APP_ID, self.FEISHU_APP_SECRET)
-        self.feishu_drive_api = FeishuDriveAPI(self.FEISHU_TENANT_ACCESS_TOKEN)
+        self.feishu_drive_api = FeishuDriveAPI(self.FEISHU_TENANT_ACCESS_TOKEN, self.FEISHU_APP_ID)
 
     def create_new_folder(self, folder_name, parent_folder_token=""):
         """
@@ -0,0 +1,272 @@
+# file name: feishu_markdown_compiler.py
+import re
+
+from api.app.handlers.feishu_docx_api_handler_async import BlockType, BlockFactory, MAX_DESCENDANTS_PER_REQUEST
+
+# 代码块语言名称到飞书代码语言编号的映射
+CODE_LANGUAGES = {
+    "": 1, "text": 1, "plaintext": 1, "plain": 1,
+    "bash": 7, "sh": 60, "shell": 60, "zsh": 60, "console": 60,
+    "csharp": 8, "c#": 8, "cs": 8,
+    "cpp": 9, "c++": 9, "cc": 9, "hpp": 9,
+    "c": 10, "h": 10,
+    "css": 12,
+    "dart": 15,
+    "dockerfile": 18, "docker": 18,
+    "erlang": 19,
+    "go": 22, "golang": 22,
+    "groovy": 23,
+    "html": 24,
+    "http": 26,
+    "haskell": 27,
+    "json": 28,
+    "java": 29,
+    "javascript": 30, "js": 30, "jsx": 30,
+    "julia": 31,
+    "kotlin": 32, "kt": 32,
+    "latex": 33, "tex": 33,
+    "lisp": 34,
+    "lua": 36,
+    "matlab": 37,
+    "makefile": 38, "make": 38,
+    "markdown": 39, "md": 39,
+    "nginx": 40,
+    "objectivec": 41, "objc": 41, "objective-c": 41,
+    "php": 43,
+    "perl": 44,
+    "powershell": 46, "ps1": 46,
+    "protobuf": 48, "proto": 48,
+    "python": 49, "py": 49,
+    "r": 50,
+    "ruby": 52, "rb": 52,
+    "rust": 53, "rs": 53,
+    "scss": 55,
+    "sql": 56,
+    "scala": 57,
+    "swift": 61,
+    "thrift": 62,
+    "typescript": 63, "ts": 63, "tsx": 63,
+    "xml": 66,
+    "yaml": 67, "yml": 67,
+    "cmake": 68,
+    "diff": 69,
+    "graphql": 71,
+}
+
+_FENCE = re.compile(r"^\s*(```|~~~)\s*([^\s`]*)")
+_HEADING = re.compile(r"^\s{0,3}(#{1,9})\s+(.*?)\s*#*\s*$")
+_DIVIDER = re.compile(r"^\s{0,3}([-*_])(\s*\1){2,}\s*$")
+_LIST_ITEM = re.compile(r"^(\s*)([-*+]|\d+[.)])\s+(.*)$")
+_QUOTE = re.compile(r"^\s{0,3}>\s?(.*)$")
+_IMAGE_LINE = re.compile(r"^\s*!\[([^\]]*)\]\(([^)\s]+)[^)]*\)\s*$")
+_INLINE = re.compile(
+    r"(?P<code>`[^`]+`)"
+    r"|(?P<link>!?\[(?P<link_text>[^\]]*)\]\((?P<link_url>[^)\s]+)[^)]*\))"
+    r"|(?P<autolink><https?://[^>\s]+>)"
+    r"|(?P<bold>\*\*(?P<bold_text>.+?)\*\*|__(?P<bold_text2>.+?)__)"
+    r"|(?P<strike>~~(?P<strike_text>.+?)~~)"
+    r"|(?P<italic>\*(?P<italic_text>[^*\s](?:[^*]*[^*\s])?)\*|(?<!\w)_(?P<italic_text2>[^_\s](?:[^_]*[^_\s])?)_(?!\w))"
+)
+
+_HEADINGS = [BlockType.HEADING1, BlockType.HEADING2, BlockType.HEADING3, BlockType.HEADING4, BlockType.HEADING5,
+             BlockType.HEADING6, BlockType.HEADING7, BlockType.HEADING8, BlockType.HEADING9]
+
+
+def parse_inline(text, style=None):
+    """
+    解析行内 Markdown（粗体、斜体、删除线、行内代码、链接），生成 BlockFactory.create_block 使用的 text_runs
+    :param text: 一行文本
+    :param style: 继承的 text_element_style
+    :return: text_run 列表，每项包含 content 和 text_element_style
+    """
+    style = style or {}
+    runs = []
+    position = 0
+    for match in _INLINE.finditer(text):
+        if match.start() > position:
+            runs.append({"content": text[position:match.start()], "text_element_style": dict(style)})
+        if match.group("code"):
+            runs.append({"content": match.group("code")[1:-1], "text_element_style": {**style, "inline_code": True}})
+        elif match.group("link"):
+            # 图片需要先上传素材才能作为图片块插入，这里以链接文本的形式保留
+            label = match.group("link_text") or ("图片" if match.group("link").startswith("!") else match.group("link_url"))
+            runs.extend(parse_inline(label, {**style, "link": {"url": match.group("link_url")}}))
+        elif match.group("autolink"):
+            url = match.group("autolink")[1:-1]
+            runs.append({"content": url, "text_element_style": {**style, "link": {"url": url}}})
+        elif match.group("bold"):
+            runs.extend(parse_inline(match.group("bold_text") or match.group("bold_text2"), {**style, "bold": True}))
+        elif match.group("strike"):
+            runs.extend(parse_inline(match.group("strike_text"), {**style, "strikethrough": True}))
+        else:
+            runs.extend(parse_inline(match.group("italic_text") or match.group("italic_text2"), {**style, "italic": True}))
+        position = match.end()
+    if position < len(text):
+        runs.append({"content": text[position:], "text_element_style": dict(style)})
+    return runs or [{"content": "", "text_element_style": dict(style)}]
+
+
+class MarkdownCompiler:
+    """
+    逐行流式的 Markdown → 飞书块编译器
+
+    支持标题、有序/无序列表（含嵌套）、代码块、引用、分割线、图片、链接以及行内的粗体、斜体、删除线和代码。
+    编译结果按需分批生成，每批是一组可以直接传给 create_descendant_blocks 的 (children_ids, descendants)，
+    块数不超过单次请求的上限，整个文档不需要一次性放入内存。
+    """
+
+    def __init__(self, max_blocks=MAX_DESCENDANTS_PER_REQUEST, id_prefix="md"):
+        """
+        :param max_blocks: 每批最多包含的块数，单个顶层块的子树超过上限时单独成批，由分批写入接口继续拆分
+        :param id_prefix: 临时块ID的前缀
+        """
+        self.max_blocks = max_blocks
+        self.id_prefix = id_prefix
+        self._next_id = 0
+
+    def _new_block(self, block):
+        self._next_id += 1
+        block["block_id"] = f"{self.id_prefix}_{self._next_id}"
+        return block
+
+    def _text_block(self, block_type, text, style=None):
+        return self._new_block(BlockFactory.create_block(block_type, parse_inline(text), style))
+
+    def _iter_lines(self, source):
+        if isinstance(source, str):
+            source = source.splitlines()
+        for line in source:
+            yield line.rstrip("\r\n")
+
+    def iter_blocks(self, source):
+        """
+        逐个生成顶层块的子树
+        :param source: Markdown 字符串，或逐行产生文本的可迭代对象（如文件对象）
+        :return: 生成器，每项是一个顶层块及其全部子孙块组成的列表（顶层块在最前）
+        """
+        paragraph = []
+        quote = []
+        list_stack = []  # [(缩进, 块)]
+        list_blocks = []
+        code = None  # (围栏, 语言, 行列表)
+
+        def flush_paragraph():
+            if paragraph:
+                text = " ".join(line.strip() for line in paragraph)
+                paragraph.clear()
+                return [[self._text_block(BlockType.TEXT, text)]]
+            return []
+
+        def flush_quote():
+            if quote:
+                children = [self._text_block(BlockType.TEXT, line) for line in quote if line.strip()]
+                quote.clear()
+                container = self._new_block(BlockFactory.create_quote_container_block([block["block_id"] for block in children]))
+                return [[container] + children]
+            return []
+
+        def flush_list():
+            if list_blocks:
+                subtree = list(list_blocks)
+                list_blocks.clear()
+                list_stack.clear()
+                return [subtree]
+            return []
+
+        def flush_all():
+            return flush_paragraph() + flush_quote() + flush_list()
+
+        for line in self._iter_lines(source):
+            if code is not None:
+                fence, language, code_lines = code
+                if line.strip().startswith(fence):
+                    yield [self._new_block(BlockFactory.create_code_block("\n".join(code_lines), language))]
+                    code = None
+                else:
+                    code_lines.append(line)
+                continue
+
+            fence_match = _FENCE.match(line)
+            if fence_match:
+                yield from flush_all()
+                code = (fence_match.group(1), CODE_LANGUAGES.get(fence_match.group(2).lower(), 1), [])
+                continue
+
+            if not line.strip():
+                yield from flush_all()
+                continue
+
+            quote_match = _QUOTE.match(line)
+            if quote_match:
+                yield from flush_paragraph()
+                yield from flush_list()
+                quote.append(quote_match.group(1))
+                continue
+            yield from flush_quote()
+
+            list_match = _LIST_ITEM.match(line)
+            if list_match and not _DIVIDER.match(line):
+                yield from flush_paragraph()
+                indent = len(list_match.group(1).expandtabs(4))
+                block_type = BlockType.BULLET if list_match.group(2) in "-*+" else BlockType.ORDERED
+                item = self._text_block(block_type, list_match.group(3))
+                while list_stack and list_stack[-1][0] >= indent:
+                    list_stack.pop()
+                if list_stack:
+                    parent = list_stack[-1][1]
+                    parent.setdefault("children", []).append(item["block_id"])
+                else:
+                    yield from flush_list()
+                list_blocks.append(item)
+                list_stack.append((indent, item))
+                continue
+
+            if list_stack and line.startswith((" ", "\t")) and not paragraph:
+                # 列表项的续行
+                last = list_blocks[-1]
+                name = BlockType.get_string_by_position(last["block_type"])
+                last[name]["elements"].extend(
+                    {"text_run": {"content": run["content"], "text_element_style": run["text_element_style"]}}
+                    for run in parse_inline(" " + line.strip())
+                )
+                continue
+            yield from flush_list()
+
+            heading_match = _HEADING.match(line)
+            if heading_match:
+                yield from flush_paragraph()
+                yield [self._text_block(_HEADINGS[len(heading_match.group(1)) - 1], heading_match.group(2))]
+                continue
+
+            if _DIVIDER.match(line):
+                yield from flush_paragraph()
+                yield [self._new_block(BlockFactory.create_divider_block())]
+                continue
+
+            image_match = _IMAGE_LINE.match(line)
+            if image_match:
+                yield from flush_paragraph()
+                yield [self._text_block(BlockType.TEXT, line.strip())]
+                continue
+
+            paragraph.append(line)
+
+        if code is not None:
+            yield [self._new_block(BlockFactory.create_code_block("\n".join(code[2]), code[1]))]
+        yield from flush_all()
+
+    def compile(self, source):
+        """
+        编译 Markdown，按请求上限分批生成
+        :param source: Markdown 字符串，或逐行产生文本的可迭代对象
+        :return: 生成器，每项为 (children_ids, descendants)
+        """
+        children_ids, descendants = [], []
+        for subtree in self.iter_blocks(source):
+            if descendants and len(descendants) + len(subtree) > self.max_blocks:
+                yield children_ids, descendants
+                children_ids, descendants = [], []
+            children_ids.append(subtree[0]["block_id"])
+            descendants.extend(subtree)
+        if descendants:
+            yield children_ids, descendants
@@ -1,13 +1,29 @@
-from fastapi import APIRouter, HTTPException, Query, Depends, Body, BackgroundTasks
+from fastapi import APIRouter, BackgroundTasks, HTTPException, Query, Depends, Body, Request, Header
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 import json
+import logging
 import re
 from ..dependencies import verify_api_key
 from typing import Dict, Optional, List, Union, Any
 import random
 import asyncio
+import uuid
 from ..handlers.feishu_docx_api_handler_async import FeishuDocxAPIHandler, BlockFactory, BlockType
+from ..handlers.feishu_document_snapshot import document_snapshots
+from ..handlers.feishu_document_sync import DocumentSyncEngine
+from ..handlers.feishu_markdown_compiler import MarkdownCompiler
 from ..utils.feishu_emoji import EMOJI_DICT
+from ..utils.feishu_retry import retry_metrics
+from ..utils.feishu_response_cache import response_cache
+from ..utils.write_scheduler import write_scheduler
+from ..utils.job_queue import job_queue, job_workers, FINAL_STATUSES, RUNNING, SUCCEEDED, FAILED, WRITING, JobAborted
+from ..utils.credentials import app_credentials, MissingCredentials
+from ..utils.admission import admission, AdmissionRejected
+from ..utils.content_dedup import content_dedup
+from ..utils import json_codec
+
+logger = logging.getLogger(__name__)
 
 class UpdateFeishuPayload(BaseModel):
     feishu_app_id: str
@@ -16,6 +32,23 @@ class UpdateFeishuPayload(BaseModel):
     target_block_id: str
     date_str: str
     content_data: str
+    sync_existing: bool = False  # 为 True 时若该日期的内容已存在，只更新差异而不是重复追加
+    skip_published: bool = True  # 跳过文档中已经发布过的内容（按原文链接和内容摘要判断），为 False 时全部写入
+
+class PublishTarget(BaseModel):
+    doc_id: str
+    target_block_id: str
+
+class UpdateFeishuTargetsPayload(BaseModel):
+    feishu_app_id: str
+    feishu_app_secret: str
+    targets: List[PublishTarget]
+    date_str: str
+    content_data: str
+    sync_existing: bool = False
+    skip_published: bool = True
+    wait: bool = False  # 为 True 时等待所有文档写入完成后再返回各文档的结果
+    timeout: float = 60  # wait 为 True 时的最长等待时间（秒）
 
 class FeishuDocxContentManager:
     """飞书文档内容管理器，用于管理文档中的内容块"""
@@ -25,6 +58,9 @@ class FeishuDocxContentManager:
     
     # 可用的emoji列表
     AVAILABLE_EMOJIS = list(EMOJI_DICT.values())
+
+    # 每期更新的内容数量限制
+    CONTENT_LIMIT = 3
     
     def __init__(self, app_id: str, app_secret: str):
         """
@@ -34,7 +70,7 @@ class FeishuDocxContentManager:
             app_id: 飞书应用的APP ID
             app_secret: 飞书应用的APP Secret
         """
-        self.docx_handler = FeishuDocxAPIHandler(app_id, app_secret)
+        self.docx_handler = FeishuDocxAPIHandler(app_id, app_secret, snapshot_cache=document_snapshots)
     
     async def initialize(self):
         """
@@ -61,154 +97,318 @@ class FeishuDocxContentManager:
         Returns:
             tuple: (parent_id, target_index)
         """
-        # 获取目标块的信息
-        target_block_info = await self.docx_handler.get_block_contents(document_id, target_block_id)
-        if not target_block_info or not target_block_info.get('data'):
+        # 从文档快照的块索引中查找目标块的父块和位置
+        tree = await document_snapshots.get_tree(self.docx_handler, document_id)
+        if target_block_id not in tree:
             raise ValueError("获取目标块信息失败")
-            
-        parent_id = target_block_info['data']['block']['parent_id']
+        return tree.insertion_point(target_block_id)
+    
+    def _issue_contents(self, content_data: Union[Dict[str, Any], List[Dict[str, Any]]]) -> List[Dict[str, Any]]:
+        """
+        按写入文档后的显示顺序排列一期的内容，第 i 条对应临时ID为 callout_{i} 的块
+        """
+        # 确保content_data是列表
+        contents = content_data if isinstance(content_data, list) else [content_data]
+
+        #设置更新的content数量限制
+        contents = contents[:self.CONTENT_LIMIT]
+
+        # 日期标题在最前，之后的callout与逐个插入到同一位置时的顺序一致（后面的内容在上方）
+        return list(reversed(contents))
+
+    def _build_issue_blocks(self, date_str: str, content_data: Union[Dict[str, Any], List[Dict[str, Any]]]) -> tuple:
+        """
+        生成一期内容的块树
         
-        # 获取父块的所有子块
-        parent_children = await self.docx_handler.get_block_children(document_id, parent_id)
-        if not parent_children or not parent_children.get('data'):
-            raise ValueError("获取父块子块信息失败")
-            
-        # 找到目标块在父块中的位置
-        target_index = next(
-            (i for i, block in enumerate(parent_children['data'].get('items', []))
-             if block.get('block_id') == target_block_id),
-            -1
-        )
+        Returns:
+            tuple: (children_ids, descendants)
+        """
+        contents = self._issue_contents(content_data)
+        styles = [self._get_random_callout_style() for _ in contents]
+        return BlockFactory.create_issue_blocks(date_str, contents, styles)
+
+    def _progress_reporter(self, progress, content_data: Union[Dict[str, Any], List[Dict[str, Any]], None] = None):
+        """
+        把写入请求的回调转换为进度事件：每个请求一个 request 事件（耗时和新建的块ID），
+        每个 callout 写入后一个 callout 事件
         
-        if target_index == -1:
-            raise ValueError("未找到目标块位置")
-            
-        return parent_id, target_index
-    
-    async def _add_single_callout(self, 
-                        document_id: str, 
-                        parent_id: str, 
-                        index: int, 
-                        content: Dict[str, Any]) -> Optional[int]:
+        Args:
+            progress: 进度回调 progress(event_type, data)，为 None 时不报告进度
+            content_data: 一期的内容，用于在 callout 事件中附带标题
         """
-        添加单个callout块及其内容
+        if progress is None:
+            return None
+        callouts = {
+            f"callout_{i}": content.get('title') if isinstance(content, dict) else None
+            for i, content in enumerate(self._issue_contents(content_data) if content_data else [], start=1)
+        }
+
+        def on_batch(info):
+            relations = info['block_id_relations']
+            progress("request", {
+                "request": info['request'],
+                "blocks": info['blocks'],
+                "latency_ms": info['latency_ms'],
+                "code": info['code'],
+                "block_ids": [relation['block_id'] for relation in relations]
+            })
+            for relation in relations:
+                temporary_id = relation['temporary_block_id']
+                if temporary_id in callouts:
+                    progress("callout", {
+                        "callout": int(temporary_id.split("_")[1]),
+                        "title": callouts[temporary_id],
+                        "block_id": relation['block_id']
+                    })
+        return on_batch
+
+    async def _filter_published(self, document_id: str, contents: List[Dict[str, Any]]) -> tuple:
+        """
+        过滤文档中已经发布过的内容；文档第一次发布时先从文档现有的 callout 中补齐去重索引
+        
+        Returns:
+            tuple: (未发布过的内容列表, 被跳过的内容列表)
+        """
+        if not content_dedup.is_seeded(document_id):
+            tree = await document_snapshots.get_tree(self.docx_handler, document_id)
+            seeded = content_dedup.seed(document_id, tree)
+            logger.debug("从文档 %s 中补齐去重索引: %d 条内容", document_id, seeded)
+        return content_dedup.filter(document_id, contents)
+
+    @staticmethod
+    def _drop_blocks(blocks: tuple, block_ids: List[str]) -> tuple:
+        """
+        从块树中去掉指定的块及其全部子孙块
+        """
+        children_ids, descendants = blocks
+        by_id = {block['block_id']: block for block in descendants}
+        dropped = set()
+        stack = list(block_ids)
+        while stack:
+            block_id = stack.pop()
+            dropped.add(block_id)
+            stack.extend(by_id[block_id].get('children', []))
+        return (
+            [block_id for block_id in children_ids if block_id not in dropped],
+            [block for block in descendants if block['block_id'] not in dropped]
+        )
+
+    async def _publish_blocks(self,
+                        document_id: str,
+                        parent_id: str,
+                        index: int,
+                        children_ids: List[str],
+                        descendants: List[Dict[str, Any]],
+                        on_batch=None) -> Dict[str, Any]:
+        """
+        将一棵临时ID的块树写入文档，返回合并后的响应数据
         
         Args:
             document_id: 文档ID
             parent_id: 父块ID
             index: 插入位置
-            content: callout内容数据
-            
+            children_ids: 直接子块的临时ID
+            descendants: 所有块的详细信息
+            on_batch: 每个请求完成后的回调
+        """
+        # 未超过单次请求的块数上限时只需一次请求，否则自动拆分并依次提交
+        response = await self.docx_handler.create_descendant_blocks_chunked(
+            document_id=document_id,
+            block_id=parent_id,
+            children_ids=children_ids,
+            descendants=descendants,
+            index=index,
+            on_batch=on_batch
+        )
+        if not response or response.get('code') != 0:
+            raise ValueError(f"创建块失败: {response.get('msg')}")
+        return response['data']
+
+    async def publish_issue(self,
+                        document_id: str,
+                        target_block_id: str,
+                        date_str: str,
+                        content_data: Union[Dict[str, Any], List[Dict[str, Any]]],
+                        progress=None,
+                        blocks: Optional[tuple] = None,
+                        skip_published: bool = True) -> Dict[str, Any]:
+        """
+        在目标块之后发布一期内容，失败时抛出异常
+        
+        Args:
+            progress: 可选的进度回调 progress(event_type, data)
+            blocks: 已经生成好的 (children_ids, descendants)，发布到多个文档时只生成一次；为 None 时根据 content_data 生成
+            skip_published: 是否跳过文档中已经发布过的内容，全部跳过时不写入文档
+        
         Returns:
-            Optional[int]: 成功返回下一个插入位置的索引，失败返回None
+            Dict[str, Any]: 请求数、写入后的文档版本、日期标题和各 callout 的块ID，以及跳过的内容数
         """
-        try:
-            # 1. 创建空的callout块
-            bg_color, border_color, emoji = self._get_random_callout_style()
-            empty_callout = BlockFactory.create_callout_block(
-                content=" ",
-                background_color=bg_color,
-                border_color=border_color,
-                emoji_id=emoji
-            )
-            
-            callout_response = await self.docx_handler.create_block(
-                document_id=document_id,
-                block_id=parent_id,
-                children=[empty_callout],
-                index=index
-            )
-            
-            if not callout_response or callout_response.get('code') != 0:
-                raise ValueError(f"创建callout块失败: {callout_response.get('msg')}")
-            
-            # 获取新创建的callout块的ID
-            callout_block_id = callout_response['data']['children'][0]['block_id']
-            
-            # 2. 准备并添加callout的子块
-            children_ids, descendants = BlockFactory.create_content_blocks(content)
-
-            # 然后可以将这些结果传给 create_descendant_blocks 方法
-            child_response = await self.docx_handler.create_descendant_blocks(
-                document_id=document_id,
-                block_id=callout_block_id,
-                children_ids=children_ids,
-                descendants=descendants
-            )
-            
-            if not child_response or child_response.get('code') != 0:
-                raise ValueError(f"创建子块失败: {child_response.get('msg')}")
-                       
-            return index + 1
-            
-        except Exception as e:
-            print(f"添加callout块失败: {str(e)}")
-            return None
+        # 初始化 FeishuDocxAPIHandler
+        await self.initialize()
+
+        contents = content_data if isinstance(content_data, list) else [content_data]
+        skipped = []
+        if skip_published:
+            contents, skipped = await self._filter_published(document_id, contents)
+            if skipped:
+                logger.debug("跳过文档 %s 中已发布的内容: %s", document_id, [content.get('title') for content in skipped])
+                if progress is not None:
+                    progress("skipped", {"titles": [content.get('title') for content in skipped]})
+            if not contents:
+                return {"requests": 0, "document_revision_id": None, "block_ids": [], "skipped": len(skipped)}
+
+        if blocks is None:
+            blocks = self._build_issue_blocks(date_str, contents)
+            issue_contents = self._issue_contents(contents)
+            progress_contents = contents
+        else:
+            # 块树按全部内容生成，去掉其中已发布内容对应的callout
+            issue_contents = self._issue_contents(content_data)
+            skipped_ids = {id(content) for content in skipped}
+            blocks = self._drop_blocks(blocks, [
+                f"callout_{i}" for i, content in enumerate(issue_contents, start=1) if id(content) in skipped_ids
+            ])
+            issue_contents = [content for content in issue_contents if id(content) not in skipped_ids]
+            progress_contents = content_data
+        children_ids, descendants = blocks
+
+        # 获取父块信息
+        parent_id, target_index = await self._get_parent_info(document_id, target_block_id)
+
+        # 日期标题和所有callout作为一棵块树写入目标块之后；开始写入后任务失败不再整体重试，避免重复写入
+        if progress is not None:
+            progress(WRITING)
+        data = await self._publish_blocks(
+            document_id, parent_id, target_index + 1, children_ids, descendants,
+            self._progress_reporter(progress, progress_contents)
+        )
+        content_dedup.add(document_id, issue_contents)
+        relations = {relation['temporary_block_id']: relation['block_id'] for relation in data['block_id_relations']}
+        return {
+            "requests": data['requests'],
+            "document_revision_id": data['document_revision_id'],
+            "block_ids": [relations.get(block_id) for block_id in children_ids],
+            "skipped": len(skipped)
+        }
 
     async def add_content_blocks(self, 
                         document_id: str, 
                         target_block_id: str, 
                         date_str: str, 
+                        content_data: Union[Dict[str, Any], List[Dict[str, Any]]],
+                        skip_published: bool = True) -> bool:
+        try:
+            await self.publish_issue(document_id, target_block_id, date_str, content_data, skip_published=skip_published)
+            return True
+            
+        except Exception as e:
+            print(f"添加内容块失败: {str(e)}")
+            return False
+
+    async def sync_issue(self,
+                        document_id: str,
+                        target_block_id: str,
+                        date_str: str,
+                        content_data: Union[Dict[str, Any], List[Dict[str, Any]]],
+                        progress=None,
+                        blocks: Optional[tuple] = None) -> Dict[str, Any]:
+        """
+        重新发布某一期内容：找到目标块之后该日期的标题及其后的callout，只提交与新内容的差异；
+        文档中还没有该期内容时与 publish_issue 相同。失败时抛出异常
+        
+        Args:
+            progress: 可选的进度回调 progress(event_type, data)
+            blocks: 同 publish_issue
+        
+        Returns:
+            Dict[str, Any]: 请求数以及新增、更新、删除的块数
+        """
+        await self.initialize()
+
+        tree = await document_snapshots.get_tree(self.docx_handler, document_id)
+        if target_block_id not in tree:
+            raise ValueError("获取目标块信息失败")
+        parent_id, target_index = tree.insertion_point(target_block_id)
+
+        # 查找目标块之后的日期标题，以及紧随其后的callout
+        siblings = tree.children(parent_id)
+        start = next(
+            (i for i in range(target_index + 1, len(siblings))
+             if siblings[i].get('block_type') == BlockType.HEADING2.position
+             and tree.text_of(siblings[i]).strip() == date_str.strip()),
+            None
+        )
+        if start is None:
+            return await self.publish_issue(document_id, target_block_id, date_str, content_data, progress, blocks, skip_published=False)
+        end = start + 1
+        while end < len(siblings) and siblings[end].get('block_type') == BlockType.CALLOUT.position:
+            end += 1
+
+        children_ids, descendants = blocks or self._build_issue_blocks(date_str, content_data)
+        result = await DocumentSyncEngine(self.docx_handler, tree).sync(
+            document_id, parent_id, children_ids, descendants, start, end,
+            self._progress_reporter(progress, content_data)
+        )
+        if result.get('code') != 0:
+            raise ValueError(f"同步内容块失败: {result.get('msg')}")
+        content_dedup.add(document_id, self._issue_contents(content_data))
+        return result['data']
+
+    async def sync_content_blocks(self,
+                        document_id: str,
+                        target_block_id: str,
+                        date_str: str,
                         content_data: Union[Dict[str, Any], List[Dict[str, Any]]]) -> bool:
         try:
-            # 初始化 FeishuDocxAPIHandler
-            await self.initialize()
+            await self.sync_issue(document_id, target_block_id, date_str, content_data)
+            return True
 
-            # 获取父块信息
-            parent_id, target_index = await self._get_parent_info(document_id, target_block_id)
-            
-            # 确保content_data是列表
-            contents = content_data if isinstance(content_data, list) else [content_data]
+        except Exception as e:
+            print(f"同步内容块失败: {str(e)}")
+            return False
 
-            #设置更新的content数量限制
-            content_limit = 3
+    async def publish_markdown(self,
+                        document_id: str,
+                        target_block_id: Optional[str],
+                        markdown: str,
+                        progress=None) -> Dict[str, Any]:
+        """
+        将Markdown编译为飞书块，逐批写入目标块之后；未指定目标块时追加到文档末尾。失败时抛出异常
         
-            # 1. 添加所有callout块
-            for i, content in enumerate(contents):
-                if i >= content_limit:
-                    break
-                next_index = await self._add_single_callout(
-                    document_id=document_id,
-                    parent_id=parent_id,
-                    index=target_index+1,
-                    content=content
-                )
-                await asyncio.sleep(0.5)  # 添加等待
-                
-            
-            # 2. 最后添加日期标题
-            date_heading = BlockFactory.create_block(
-                block_type=BlockType.HEADING2,
-                text_runs=[{
-                    "content": date_str,
-                    "text_element_style": {
-                        "bold": False,
-                        "inline_code": False,
-                        "italic": False,
-                        "strikethrough": False,
-                        "underline": False
-                    }
-                }],
-                style={
-                    "align": 1,
-                    "folded": False
-                }
-            )
-            
-            heading_response = await self.docx_handler.create_block(
-                document_id=document_id,
-                block_id=parent_id,
-                children=[date_heading],
-                index=target_index+1
-            )
-            
-            if not heading_response or heading_response.get('code') != 0:
-                raise ValueError(f"创建日期标题失败: {heading_response.get('msg')}")
-            
+        Args:
+            progress: 可选的进度回调 progress(event_type, data)，每个请求报告一次
+        
+        Returns:
+            Dict[str, Any]: 请求数和写入后的文档版本
+        """
+        await self.initialize()
+
+        if target_block_id:
+            parent_id, target_index = await self._get_parent_info(document_id, target_block_id)
+            index = target_index + 1
+        else:
+            parent_id, index = document_id, -1
+
+        if progress is not None:
+            progress(WRITING)
+        response = await self.docx_handler.create_descendant_block_stream(
+            document_id, parent_id, MarkdownCompiler().compile(markdown), index,
+            on_batch=self._progress_reporter(progress)
+        )
+        if response.get('code') != 0:
+            raise ValueError(f"写入Markdown失败: {response.get('msg')}")
+        return {"requests": response['data']['requests'], "document_revision_id": response['data']['document_revision_id']}
+
+    async def add_markdown_blocks(self,
+                        document_id: str,
+                        target_block_id: Optional[str],
+                        markdown: str) -> bool:
+        try:
+            await self.publish_markdown(document_id, target_block_id, markdown)
             return True
-            
+
         except Exception as e:
-            print(f"添加内容块失败: {str(e)}")
+            print(f"写入Markdown失败: {str(e)}")
             return False
 
 
@@ -243,36 +443,239 @@ def context_to_json(context):
 
 router = APIRouter()
 
-async def background_task(
-    content_manager: FeishuDocxContentManager,
-    DOC_ID: str,
-    TARGET_BLOCK_ID: str,
-    DATE_STR: str,
-    CONTENT_DATA: List[Dict[str, Any]]
-):
-    await content_manager.add_content_blocks(DOC_ID, TARGET_BLOCK_ID, DATE_STR, CONTENT_DATA)
+def _app_secret(payload: Dict[str, Any]) -> str:
+    """
+    在当前进程中直接执行的任务带有 App Secret；队列中的任务根据提交时保存的凭证引用取回，取不到时任务直接失败（重试也不会成功）
+    """
+    if payload.get("feishu_app_secret"):
+        return payload["feishu_app_secret"]
+    try:
+        return app_credentials.unseal(payload["feishu_app_id"], payload.get("credential"))
+    except MissingCredentials as e:
+        raise JobAborted(str(e))
+
+async def run_update_job(payload: Dict[str, Any], job: Dict[str, Any], report) -> Dict[str, Any]:
+    """
+    执行一次小报更新任务，失败时抛出异常由任务队列重试（已开始写入的任务除外）；
+    sync_existing 任务每次都根据文档当前内容计算差异，重新执行不会重复写入
+    """
+    content_manager = FeishuDocxContentManager(payload["feishu_app_id"], _app_secret(payload))
+    # 发布到多个文档时块树在提交时已经生成，各文档使用相同的内容和样式
+    blocks = (payload["children_ids"], payload["descendants"]) if payload.get("descendants") else None
+    if payload.get("sync_existing"):
+        return await content_manager.sync_issue(
+            payload["doc_id"], payload["target_block_id"], payload["date_str"], payload["content_data"], report, blocks
+        )
+    return await content_manager.publish_issue(
+        payload["doc_id"], payload["target_block_id"], payload["date_str"], payload["content_data"], report, blocks,
+        payload.get("skip_published", True)
+    )
+
+async def run_markdown_job(payload: Dict[str, Any], job: Dict[str, Any], report) -> Dict[str, Any]:
+    """
+    执行一次Markdown写入任务
+    """
+    content_manager = FeishuDocxContentManager(payload["feishu_app_id"], _app_secret(payload))
+    return await content_manager.publish_markdown(payload["doc_id"], payload.get("target_block_id"), payload["markdown"], report)
+
+job_queue.register("update_feishu_xiaobao", run_update_job)
+job_queue.register("publish_markdown", run_markdown_job)
+
+def _too_many_requests(e: AdmissionRejected) -> HTTPException:
+    return HTTPException(status_code=429, detail=e.reason, headers={"Retry-After": str(e.retry_after)})
+
+async def _run_in_process(kind: str, job_payload: Dict[str, Any], app_secret: str, document_id: str) -> Dict[str, Any]:
+    """
+    不经过任务队列，在当前进程中执行一次任务：后台 worker 只在常驻进程中通过 lifespan 启动，
+    未运行时（如 Vercel 等 Serverless 部署）使用。任务不会保存到数据库，也不会重试；写入同样按文档排队
+    :return: 任务结果
+    """
+    payload = {**job_payload, "feishu_app_secret": app_secret}
+    return await write_scheduler.submit(document_id, job_queue.handlers[kind], payload, None, None)
+
+async def _run_in_background(kind: str, job_payloads: List[Dict[str, Any]], app_secret: str) -> None:
+    """
+    响应返回后在当前进程中执行任务，多个文档并行写入
+    """
+    results = await asyncio.gather(
+        *(_run_in_process(kind, job_payload, app_secret, job_payload["doc_id"]) for job_payload in job_payloads),
+        return_exceptions=True
+    )
+    for job_payload, result in zip(job_payloads, results):
+        if isinstance(result, BaseException):
+            logger.error("任务执行失败（%s, %s）: %s", kind, job_payload["doc_id"], result)
+
+def _log_failure(kind: str, document_id: str):
+    """
+    :return: 任务的 done 回调，任务失败时记录错误
+    """
+    def on_done(task):
+        if not task.cancelled() and task.exception() is not None:
+            logger.error("任务执行失败（%s, %s）: %s", kind, document_id, task.exception())
+    return on_done
+
+def _seal_credential(app_id: str, app_secret: str) -> Dict[str, Any]:
+    """
+    :return: 随任务保存的凭证引用；服务重启后无法取回凭证时返回 400，不接收重启后无法完成的任务
+    """
+    try:
+        return app_credentials.seal(app_id, app_secret)
+    except MissingCredentials as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+def _enqueue_job(kind: str, job_payload: Dict[str, Any], app_id: str, app_secret: str, document_id: str) -> str:
+    """
+    准入检查通过后写入任务队列，队列已满时返回 429；App Secret 不以明文写入任务数据库，只保存凭证引用
+    """
+    credential = _seal_credential(app_id, app_secret)
+    try:
+        admission.admit_job(job_queue, app_id, job_workers.concurrency)
+    except AdmissionRejected as e:
+        raise _too_many_requests(e)
+    job_id = job_queue.enqueue(kind, {**job_payload, "credential": credential}, app_id=app_id, document_id=document_id)
+    job_workers.notify()
+    return job_id
+
+def _submit_job(background_tasks: BackgroundTasks, kind: str, job_payload: Dict[str, Any], app_id: str, app_secret: str) -> Dict[str, Any]:
+    """
+    后台 worker 运行时把任务写入持久化队列，服务重启后未完成的任务会继续执行；
+    未运行时在响应返回后于当前进程中执行，无法查询任务状态
+    """
+    if not job_workers.running:
+        background_tasks.add_task(_run_in_background, kind, [job_payload], app_secret)
+        return {"status": "processing", "message": "任务已提交，正在后台处理"}
+
+    job_id = _enqueue_job(kind, job_payload, app_id, app_secret, job_payload["doc_id"])
+    return {
+        "status": "processing",
+        "job_id": job_id,
+        "status_url": f"/jobs/{job_id}",
+        "events_url": f"/jobs/{job_id}/events",
+        "message": "任务已提交，正在后台处理"
+    }
 
 @router.post("/update_feishu_xiaobao", dependencies=[Depends(verify_api_key)])
-async def update_feishu_xiaobao_post(
-    payload: UpdateFeishuPayload,
-    background_tasks: BackgroundTasks
-):
-    CONTENT_DATA = context_to_json(payload.content_data)
-    
-    # 初始化
-    content_manager = FeishuDocxContentManager(payload.feishu_app_id, payload.feishu_app_secret)
-    
-    # 将任务添加到后台
-    background_tasks.add_task(
-        background_task, 
-        content_manager, 
-        payload.doc_id, 
-        payload.target_block_id, 
-        payload.date_str, 
-        CONTENT_DATA
+async def update_feishu_xiaobao_post(payload: UpdateFeishuPayload, background_tasks: BackgroundTasks):
+    job_payload = payload.dict(exclude={"content_data", "feishu_app_secret"})
+    job_payload["content_data"] = context_to_json(payload.content_data)
+
+    return _submit_job(background_tasks, "update_feishu_xiaobao", job_payload, payload.feishu_app_id, payload.feishu_app_secret)
+
+
+@router.post("/update_feishu_xiaobao_targets", dependencies=[Depends(verify_api_key)])
+async def update_feishu_xiaobao_targets_post(payload: UpdateFeishuTargetsPayload, background_tasks: BackgroundTasks):
+    """
+    把同一期内容发布到多个文档：内容只解析一次、块树只生成一次，每个目标一个任务，
+    不同文档并行写入，同一文档的多个目标按提交顺序依次写入
+    """
+    if not payload.targets:
+        raise HTTPException(status_code=400, detail="targets 不能为空")
+    if job_workers.running:
+        credential = _seal_credential(payload.feishu_app_id, payload.feishu_app_secret)
+        try:
+            admission.admit_job(job_queue, payload.feishu_app_id, job_workers.concurrency, len(payload.targets))
+        except AdmissionRejected as e:
+            raise _too_many_requests(e)
+
+    content_data = context_to_json(payload.content_data)
+    children_ids, descendants = FeishuDocxContentManager(payload.feishu_app_id, payload.feishu_app_secret)._build_issue_blocks(
+        payload.date_str, content_data
     )
-    
-    return {"status": "processing", "message": "任务已提交，正在后台处理"}
+    job_payload = payload.dict(exclude={"targets", "content_data", "wait", "timeout", "feishu_app_secret"})
+    job_payload.update(content_data=content_data, children_ids=children_ids, descendants=descendants)
+    job_payloads = [
+        {**job_payload, "doc_id": target.doc_id, "target_block_id": target.target_block_id} for target in payload.targets
+    ]
+
+    if not job_workers.running:
+        return await _run_targets_in_process(payload, job_payloads, background_tasks)
+
+    job_ids = [
+        job_queue.enqueue("update_feishu_xiaobao", {**job_payload, "credential": credential}, app_id=payload.feishu_app_id, document_id=job_payload["doc_id"])
+        for job_payload in job_payloads
+    ]
+    job_workers.notify()
+
+    if not payload.wait:
+        return {
+            "status": "processing",
+            "targets": [
+                {**target.dict(), "job_id": job_id, "status_url": f"/jobs/{job_id}", "events_url": f"/jobs/{job_id}/events"}
+                for target, job_id in zip(payload.targets, job_ids)
+            ],
+            "message": "任务已提交，正在后台处理"
+        }
+
+    jobs = await asyncio.gather(*(job_queue.wait(job_id, payload.timeout) for job_id in job_ids))
+    return _targets_summary([
+        {
+            **target.dict(),
+            "job_id": job["id"],
+            "status": job["status"],
+            "result": job["result"],
+            "error": job["last_error"]
+        }
+        for target, job in zip(payload.targets, jobs)
+    ])
+
+async def _run_targets_in_process(payload: UpdateFeishuTargetsPayload, job_payloads: List[Dict[str, Any]],
+                                  background_tasks: BackgroundTasks) -> Dict[str, Any]:
+    """
+    后台 worker 未运行时在当前进程中发布到各文档；wait 为 True 时最多等待 timeout 秒，
+    超时的文档继续写入，不会被中断
+    """
+    if not payload.wait:
+        background_tasks.add_task(_run_in_background, "update_feishu_xiaobao", job_payloads, payload.feishu_app_secret)
+        return {"status": "processing", "targets": [target.dict() for target in payload.targets], "message": "任务已提交，正在后台处理"}
+
+    tasks = [
+        asyncio.ensure_future(_run_in_process("update_feishu_xiaobao", job_payload, payload.feishu_app_secret, job_payload["doc_id"]))
+        for job_payload in job_payloads
+    ]
+    await asyncio.wait(tasks, timeout=payload.timeout)
+    results = []
+    for target, task in zip(payload.targets, tasks):
+        if not task.done():
+            # 超时后继续写入，结束时记录失败
+            task.add_done_callback(_log_failure("update_feishu_xiaobao", target.doc_id))
+            status, result, error = RUNNING, None, None
+        elif task.exception() is not None:
+            status, result, error = FAILED, None, f"{type(task.exception()).__name__}: {task.exception()}"
+        else:
+            status, result, error = SUCCEEDED, task.result(), None
+        results.append({**target.dict(), "job_id": None, "status": status, "result": result, "error": error})
+    return _targets_summary(results)
+
+def _targets_summary(results: List[Dict[str, Any]]) -> Dict[str, Any]:
+    summary = {status: sum(1 for result in results if result["status"] == status) for status in (SUCCEEDED, FAILED)}
+    summary["pending"] = len(results) - summary[SUCCEEDED] - summary[FAILED]
+    if summary[SUCCEEDED] == len(results):
+        status = "success"
+    elif summary["pending"]:
+        status = "processing"
+    else:
+        status = "partial_failure" if summary[SUCCEEDED] else "failure"
+    return {"status": status, "summary": summary, "targets": results}
+
+
+@router.delete("/published_content/{doc_id}", dependencies=[Depends(verify_api_key)])
+async def invalidate_published_content(doc_id: str):
+    """
+    清空文档的已发布内容索引：文档中的内容被手动删除后调用，下次发布时重新从文档现有的内容补齐
+    """
+    return {"status": "success", "doc_id": doc_id, "removed_keys": content_dedup.invalidate(doc_id)}
+
+
+class PublishMarkdownPayload(BaseModel):
+    feishu_app_id: str
+    feishu_app_secret: str
+    doc_id: str
+    target_block_id: Optional[str] = None  # 为空时追加到文档末尾
+    markdown: str
+
+@router.post("/publish_markdown", dependencies=[Depends(verify_api_key)])
+async def publish_markdown_post(payload: PublishMarkdownPayload, background_tasks: BackgroundTasks):
+    return _submit_job(background_tasks, "publish_markdown", payload.dict(exclude={"feishu_app_secret"}), payload.feishu_app_id, payload.feishu_app_secret)
 
 
 class FindBlockPayload(BaseModel):
@@ -282,83 +685,206 @@ class FindBlockPayload(BaseModel):
     target_content: str = "每日推荐"
     target_block_type: int = 3  # 默认为h1块类型
 
-def find_block_by_content_and_type(data: List[Dict], target_content: str, target_block_type: int, block_map: Dict) -> Optional[str]:
-    """
-    递归查找包含特定文字内容和block_type的块，并返回该块的ID
-    
-    Args:
-        data: JSON数据（字典或列表）
-        target_content: 要查找的文字内容
-        target_block_type: 要查找的block_type
-        block_map: 用于查找block_id对应的块的字典
-        
-    Returns:
-        Optional[str]: 符合条件的块ID，若未找到则返回None
-    """
-    if isinstance(data, list):
-        for item in data:
-            if isinstance(item, dict):
-                if item.get('block_type') == target_block_type:
-                    if 'heading1' in item:  # 对于heading1类型
-                        elements = item['heading1'].get('elements', [])
-                        for element in elements:
-                            if 'text_run' in element and target_content in element['text_run'].get('content', ''):
-                                return item.get('block_id')
-                    elif 'text' in item:  # 对于普通文本类型
-                        elements = item['text'].get('elements', [])
-                        for element in elements:
-                            if 'text_run' in element and target_content in element['text_run'].get('content', ''):
-                                return item.get('block_id')
-
-                if 'children' in item:
-                    children_blocks = [block_map.get(child_id) for child_id in item['children']]
-                    children_blocks = [block for block in children_blocks if block is not None]
-                    result = find_block_by_content_and_type(children_blocks, target_content, target_block_type, block_map)
-                    if result:
-                        return result
-    return None
-
-def build_block_map(blocks: List[Dict]) -> Dict:
-    """构建block_id到block的映射字典"""
-    return {block['block_id']: block for block in blocks 
-            if isinstance(block, dict) and 'block_id' in block}
-
 @router.post("/find_block", dependencies=[Depends(verify_api_key)])
 async def find_block_post(payload: FindBlockPayload):
+    # 交互式查询使用独立的并发额度，不受后台发布任务影响
+    try:
+        async with admission.interactive(payload.feishu_app_id):
+            return await _find_block(payload)
+    except AdmissionRejected as e:
+        raise _too_many_requests(e)
+
+async def _find_block(payload: FindBlockPayload):
     try:
         # 初始化 handler
-        docx_handler = FeishuDocxAPIHandler(payload.feishu_app_id, payload.feishu_app_secret)
+        docx_handler = FeishuDocxAPIHandler(payload.feishu_app_id, payload.feishu_app_secret, snapshot_cache=document_snapshots)
         await docx_handler.initialize()
         
-        # 获取文档块
-        document_blocks = await docx_handler.get_document_blocks(payload.doc_id)
-        if not document_blocks or 'data' not in document_blocks:
-            raise HTTPException(status_code=400, detail="Failed to get document blocks")
-            
-        blocks = document_blocks.get('data', {}).get('items', [])
-        
-        # 构建block_map
-        block_map = build_block_map(blocks)
-        
+        # 获取文档的块索引（优先使用缓存的快照）
+        try:
+            tree = await document_snapshots.get_tree(docx_handler, payload.doc_id)
+        except Exception as e:
+            raise HTTPException(status_code=400, detail=f"Failed to get document blocks: {e}")
+
         # 查找特定内容和类型的块
-        block_id = find_block_by_content_and_type(
-            blocks, 
-            payload.target_content, 
-            payload.target_block_type, 
-            block_map
-        )
+        block_id = tree.find(payload.target_content, payload.target_block_type)
         
         if block_id:
             return {
                 "status": "success",
                 "block_id": block_id,
-                "block_content": block_map.get(block_id)
+                "block_content": tree.get(block_id)
             }
         else:
             return {
                 "status": "not_found",
                 "message": "No matching block found"
             }
-            
+
+    except HTTPException:
+        raise
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+class BlockSearchQuery(BaseModel):
+    text: Optional[str] = None  # 块文本中包含的文字
+    regex: Optional[str] = None  # 块文本需要匹配的正则表达式
+    ignore_case: bool = False
+    block_types: Optional[List[int]] = None  # 限定的块类型，为空时不限
+    limit: Optional[int] = None  # 最多返回的匹配数，为空时返回全部
+
+class SearchBlocksPayload(BaseModel):
+    feishu_app_id: str
+    feishu_app_secret: str
+    doc_id: str
+    queries: List[BlockSearchQuery]
+    include_blocks: bool = False  # 是否在结果中附带完整的块内容
+
+@router.post("/search_blocks", dependencies=[Depends(verify_api_key)])
+async def search_blocks_post(payload: SearchBlocksPayload):
+    """
+    一次请求执行多个块查询，每个查询返回全部匹配的块及其父块、位置和路径；
+    文档结构按版本缓存，同一版本只下载一次
+    """
+    try:
+        async with admission.interactive(payload.feishu_app_id):
+            return await _search_blocks(payload)
+    except AdmissionRejected as e:
+        raise _too_many_requests(e)
+
+async def _search_blocks(payload: SearchBlocksPayload):
+    queries = []
+    for query in payload.queries:
+        try:
+            pattern = re.compile(query.regex, re.IGNORECASE if query.ignore_case else 0) if query.regex else None
+        except re.error as e:
+            raise HTTPException(status_code=400, detail=f"Invalid regex {query.regex!r}: {e}")
+        queries.append({
+            "text": query.text.lower() if query.text is not None and query.ignore_case else query.text,
+            "ignore_case": query.ignore_case,
+            "pattern": pattern,
+            "block_types": set(query.block_types) if query.block_types else None,
+            "limit": query.limit
+        })
+
+    try:
+        docx_handler = FeishuDocxAPIHandler(payload.feishu_app_id, payload.feishu_app_secret, snapshot_cache=document_snapshots)
+        await docx_handler.initialize()
+        try:
+            tree = await document_snapshots.get_tree(docx_handler, payload.doc_id)
+        except Exception as e:
+            raise HTTPException(status_code=400, detail=f"Failed to get document blocks: {e}")
+
+        results = tree.search(queries)
+        for matches in results:
+            for match in matches:
+                match["block_type_name"] = BlockType.get_string_by_position(match["block_type"])
+                if payload.include_blocks:
+                    match["block"] = tree.get(match["block_id"])
+
+        return {
+            "status": "success",
+            "revision_id": tree.revision_id,
+            "results": [
+                {"query": query.dict(), "count": len(matches), "matches": matches}
+                for query, matches in zip(payload.queries, results)
+            ]
+        }
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+# 事件流的心跳间隔（秒），避免代理因长时间没有数据而断开连接
+SSE_HEARTBEAT_INTERVAL = 15
+
+def _get_job(job_id: str) -> Dict[str, Any]:
+    job = job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="任务不存在")
+    return job
+
+def _format_sse(event: Dict[str, Any]) -> str:
+    return f"id: {event['id']}\nevent: {event['type']}\ndata: {json_codec.dumps(event)}\n\n"
+
+@router.get("/jobs/{job_id}", dependencies=[Depends(verify_api_key)])
+async def get_job(job_id: str):
+    """
+    查询任务的状态、结果和执行过程中的全部事件（不返回任务参数）
+    """
+    job = _get_job(job_id)
+    return {
+        "job_id": job["id"],
+        "kind": job["kind"],
+        "status": job["status"],
+        "attempts": job["attempts"],
+        "max_attempts": job["max_attempts"],
+        "document_id": job["document_id"],
+        "last_error": job["last_error"],
+        "result": job["result"],
+        "created_at": job["created_at"],
+        "updated_at": job["updated_at"],
+        "events": job_queue.events(job_id)
+    }
+
+@router.get("/jobs/{job_id}/events", dependencies=[Depends(verify_api_key)])
+async def stream_job_events(job_id: str, request: Request, last_event_id: Optional[str] = Header(None)):
+    """
+    以 Server-Sent Events 推送任务事件：先补发已发生的事件（断线重连时从 Last-Event-ID 之后开始），
+    之后实时推送，任务成功或最终失败后结束
+    """
+    _get_job(job_id)
+    after = int(last_event_id) if last_event_id and last_event_id.isdigit() else 0
+
+    async def event_stream():
+        # 先订阅再补发历史事件，两者之间发生的事件按 ID 去重
+        queue = job_queue.events_hub.subscribe(job_id)
+        try:
+            last_id = after
+            for event in job_queue.events(job_id, after):
+                last_id = event["id"]
+                yield _format_sse(event)
+                if event["type"] in FINAL_STATUSES:
+                    return
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), SSE_HEARTBEAT_INTERVAL)
+                except asyncio.TimeoutError:
+                    if await request.is_disconnected():
+                        return
+                    yield ": keepalive\n\n"
+                    continue
+                if event["id"] <= last_id:
+                    continue
+                last_id = event["id"]
+                yield _format_sse(event)
+                if event["type"] in FINAL_STATUSES:
+                    return
+        finally:
+            job_queue.events_hub.unsubscribe(job_id, queue)
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@router.get("/feishu_metrics", dependencies=[Depends(verify_api_key)])
+async def feishu_metrics():
+    """
+    飞书客户端的运行指标
+    """
+    return {
+        "retry": retry_metrics.snapshot(),
+        "response_cache": response_cache.stats(),
+        "document_snapshots": document_snapshots.stats(),
+        "write_scheduler": write_scheduler.stats(),
+        "jobs": job_queue.counts(),
+        "job_event_subscribers": job_queue.events_hub.subscriber_count(),
+        "admission": admission.stats(),
+        "content_dedup": content_dedup.stats()
+    }
@@ -1,6 +1,5 @@
 from fastapi import APIRouter, HTTPException, Query, Depends, Body
 
-import json
 import os
 
 from ..dependencies import verify_api_key
@@ -14,7 +13,7 @@ def fetch_web_content(url: str = Query(...)):
     a1 = os.getenv('XHS_A1')
     web_session = os.getenv('XHS_WEB_SESSION')
 
-    custom_url_rules_json = json.dumps([
+    custom_url_rules = [
         {
             "name": "xiaohongshu",
             "headers": {
@@ -34,9 +33,9 @@ def fetch_web_content(url: str = Query(...)):
                 'Accept-Language': 'zh-CN,zh;q=0.9,en;q=0.8'
             }
         }
-    ])
+    ]
     
-    scraper = WebScraper(url, custom_url_rules_json)   
+    scraper = WebScraper(url, custom_url_rules)   
     return scraper.scrape()
 
 @router.post("/fetch_web_content", dependencies=[Depends(verify_api_key)])
@@ -48,7 +47,7 @@ def fetch_web_content_post(payload: dict = Body(...)):
     a1 = os.getenv('XHS_A1')
     web_session = os.getenv('XHS_WEB_SESSION')
 
-    custom_url_rules_json = json.dumps([
+    custom_url_rules = [
         {
             "name": "xiaohongshu",
             "headers": {
@@ -68,7 +67,7 @@ def fetch_web_content_post(payload: dict = Body(...)):
                 'Accept-Language': 'zh-CN,zh;q=0.9,en;q=0.8'
             }
         }
-    ])
+    ]
     
-    scraper = WebScraper(url, custom_url_rules_json)   
+    scraper = WebScraper(url, custom_url_rules)   
     return scraper.scrape()
\ No newline at end of file
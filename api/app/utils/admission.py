@@ -0,0 +1,133 @@
+# file name: admission.py
+import math
+import os
+from contextlib import asynccontextmanager
+
+from api.app.utils.feishu_rate_limiter import interactive_lane
+
+# 请求通道
+BULK = "bulk"                # 写入文档的后台任务（发布小报、写入 Markdown）
+INTERACTIVE = "interactive"  # 需要立即返回结果的查询（查找块、搜索块）
+
+
+class AdmissionRejected(Exception):
+    """
+    请求超过了准入上限
+    """
+
+    def __init__(self, lane, reason, retry_after):
+        """
+        :param lane: 被拒绝的请求所在的通道
+        :param reason: 拒绝原因
+        :param retry_after: 建议客户端重试前等待的秒数
+        """
+        super().__init__(reason)
+        self.lane = lane
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    """
+    写入任务和交互式查询的准入控制
+
+    后台任务按全局和应用两个维度限制排队中及执行中的任务数，超过上限时立即拒绝，不再无限制地接收任务；
+    任务执行时的并发由 JobWorkerPool 的 worker 数量和 JobQueue 的单应用执行上限控制。
+    交互式查询使用独立的并发额度，不和后台任务共享；查询发出的飞书请求标记为交互式通道，
+    使用 RateLimiter 为交互式请求预留的频率额度，批量发布再多也不会让查询排在它们的请求后面。
+    """
+
+    def __init__(self, max_jobs=200, max_jobs_per_app=50, max_interactive=32, max_interactive_per_app=8,
+                 job_retry_after=10, interactive_retry_after=1):
+        """
+        :param max_jobs: 全局未完成（排队中和执行中）的后台任务数上限
+        :param max_jobs_per_app: 单个应用未完成的后台任务数上限
+        :param max_interactive: 全局同时执行的交互式查询数上限
+        :param max_interactive_per_app: 单个应用同时执行的交互式查询数上限
+        :param job_retry_after: 后台任务被拒绝时建议的最短重试等待时间（秒）
+        :param interactive_retry_after: 交互式查询被拒绝时建议的重试等待时间（秒）
+        """
+        self.max_jobs = max_jobs
+        self.max_jobs_per_app = max_jobs_per_app
+        self.max_interactive = max_interactive
+        self.max_interactive_per_app = max_interactive_per_app
+        self.job_retry_after = job_retry_after
+        self.interactive_retry_after = interactive_retry_after
+        self._interactive = 0
+        self._interactive_per_app = {}
+        self._rejected = {BULK: 0, INTERACTIVE: 0}
+
+    @classmethod
+    def from_env(cls):
+        """
+        根据环境变量创建准入控制器
+        FEISHU_MAX_JOBS / FEISHU_MAX_JOBS_PER_APP: 未完成的后台任务数上限
+        FEISHU_MAX_INTERACTIVE / FEISHU_MAX_INTERACTIVE_PER_APP: 同时执行的交互式查询数上限
+        """
+        return cls(
+            max_jobs=int(os.getenv('FEISHU_MAX_JOBS', 200)),
+            max_jobs_per_app=int(os.getenv('FEISHU_MAX_JOBS_PER_APP', 50)),
+            max_interactive=int(os.getenv('FEISHU_MAX_INTERACTIVE', 32)),
+            max_interactive_per_app=int(os.getenv('FEISHU_MAX_INTERACTIVE_PER_APP', 8)),
+        )
+
+    def _reject(self, lane, reason, retry_after):
+        self._rejected[lane] += 1
+        raise AdmissionRejected(lane, reason, retry_after)
+
+    def admit_job(self, queue, app_id, workers=1, count=1):
+        """
+        检查是否可以再接收 count 个后台任务，超过上限时抛出 AdmissionRejected（全部接收或全部拒绝）
+        检查和随后的 enqueue 之间没有 await，在同一个事件循环中不会被其他请求插入
+        :param queue: JobQueue
+        :param app_id: 提交任务的应用
+        :param workers: 执行任务的 worker 数量，用于估算重试等待时间
+        :param count: 本次提交的任务数
+        """
+        total, per_app = queue.active_counts(app_id)
+        if total + count > self.max_jobs:
+            self._reject(BULK, "任务队列已满", self._job_retry_after(total + count - self.max_jobs, workers))
+        if app_id is not None and per_app + count > self.max_jobs_per_app:
+            self._reject(BULK, "该应用的任务队列已满", self._job_retry_after(per_app + count - self.max_jobs_per_app, workers))
+
+    def _job_retry_after(self, overflow, workers):
+        # 超出的任务数越多，建议等待的时间越长
+        return min(300, self.job_retry_after * math.ceil(overflow / max(1, workers)))
+
+    @asynccontextmanager
+    async def interactive(self, app_id):
+        """
+        在交互式通道中执行查询，超过并发上限时立即抛出 AdmissionRejected；
+        上下文中发出的飞书请求使用交互式请求的频率额度
+        """
+        if self._interactive >= self.max_interactive:
+            self._reject(INTERACTIVE, "查询请求过多", self.interactive_retry_after)
+        if self._interactive_per_app.get(app_id, 0) >= self.max_interactive_per_app:
+            self._reject(INTERACTIVE, "该应用的查询请求过多", self.interactive_retry_after)
+        self._interactive += 1
+        self._interactive_per_app[app_id] = self._interactive_per_app.get(app_id, 0) + 1
+        lane = interactive_lane.set(True)
+        try:
+            yield
+        finally:
+            interactive_lane.reset(lane)
+            self._interactive -= 1
+            self._interactive_per_app[app_id] -= 1
+            if not self._interactive_per_app[app_id]:
+                del self._interactive_per_app[app_id]
+
+    def stats(self):
+        """
+        :return: 执行中的交互式查询数、各通道被拒绝的次数和上限配置
+        """
+        return {
+            "interactive_running": self._interactive,
+            "rejected": dict(self._rejected),
+            "max_jobs": self.max_jobs,
+            "max_jobs_per_app": self.max_jobs_per_app,
+            "max_interactive": self.max_interactive,
+            "max_interactive_per_app": self.max_interactive_per_app
+        }
+
+
+admission = AdmissionController.from_env()
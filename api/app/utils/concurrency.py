@@ -0,0 +1,29 @@
+# file name: concurrency.py
+import asyncio
+
+
+async def gather_limited(factories, limit=5):
+    """
+    并发执行多个协程，同时进行的数量不超过 limit，结果顺序与输入一致
+    :param factories: 返回协程的无参函数列表
+    :param limit: 最大并发数
+    :return: 结果列表
+    """
+    semaphore = asyncio.Semaphore(max(1, limit))
+
+    async def run(factory):
+        async with semaphore:
+            return await factory()
+
+    return await asyncio.gather(*(run(factory) for factory in factories))
+
+
+def chunked(items, size):
+    """
+    将列表按固定大小切分
+    :param items: 列表
+    :param size: 每块的大小
+    :return: 子列表的生成器
+    """
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
@@ -0,0 +1,251 @@
+# file name: content_dedup.py
+import hashlib
+import re
+import sqlite3
+import threading
+import time
+from urllib.parse import parse_qsl, unquote, urlencode, urlsplit, urlunsplit
+
+from api.app.handlers.feishu_docx_api_handler_async import BlockType
+from api.app.utils.data_dir import data_path, ensure_parent_dir
+
+# 已知的广告和分享跟踪参数，规范化链接时去掉；from、source、scene 等通用参数可能标识不同的文章，不在此列
+TRACKING_PARAMS = {
+    "fbclid", "gclid", "dclid", "msclkid", "yclid", "igshid", "mc_cid", "mc_eid", "spm",
+    "share_source", "share_medium", "share_from_user_hidden", "shareRedId", "xhsshare",
+    "sharer_sharetime", "sharer_shareid", "exportkey", "pass_ticket", "wx_header", "vd_source",
+}
+TRACKING_PREFIXES = ("utm_",)
+
+_WHITESPACE = re.compile(r"\s+")
+
+_CALLOUT = BlockType.CALLOUT.position
+_HEADING2 = BlockType.HEADING2.position
+_BULLET = BlockType.BULLET.position
+
+# 链接和内容摘要两种键，同一条内容任意一个键已存在即视为重复
+LINK = "link"
+HASH = "hash"
+
+
+def canonicalize_link(url):
+    """
+    规范化文章链接：解码百分号编码（飞书返回的链接是编码后的），协议和域名小写，
+    去掉默认端口、锚点、跟踪参数和末尾的斜杠，其余查询参数排序；协议保持不变
+    :param url: 原始链接
+    :return: 规范化后的链接，空链接返回 None
+    """
+    if not url:
+        return None
+    url = url.strip()
+    # 飞书会把链接整体编码一次，内容本身也可能带有编码，最多解码两次
+    for _ in range(2):
+        decoded = unquote(url)
+        if decoded == url:
+            break
+        url = decoded
+    parts = urlsplit(url)
+    scheme = parts.scheme.lower()
+    netloc = parts.netloc.lower()
+    if (scheme, netloc.rsplit(":", 1)[-1]) in (("http", "80"), ("https", "443")):
+        netloc = netloc.rsplit(":", 1)[0]
+    query = sorted(
+        (key, value) for key, value in parse_qsl(parts.query, keep_blank_values=True)
+        if key not in TRACKING_PARAMS and not key.lower().startswith(TRACKING_PREFIXES)
+    )
+    path = parts.path.rstrip("/") or "/"
+    return urlunsplit((scheme, netloc, path, urlencode(query), ""))
+
+
+def _normalize_text(text):
+    return _WHITESPACE.sub(" ", text or "").strip().lower()
+
+
+def content_hash(content):
+    """
+    根据标题和要点计算内容摘要，忽略空白差异和大小写
+    :param content: 内容字典，格式同 context_to_json 的输出
+    """
+    parts = [_normalize_text(content.get("title"))]
+    parts.extend(_normalize_text(bullet) for bullet in content.get("bullets") or [] if bullet)
+    return hashlib.sha1("\n".join(parts).encode("utf-8")).hexdigest()
+
+
+def content_keys(content):
+    """
+    :return: 内容的去重键列表，如 [("link", 规范化链接), ("hash", 摘要)]；没有标题和要点时不计算摘要
+    """
+    keys = []
+    if content.get("title") or any(content.get("bullets") or []):
+        keys.append((HASH, content_hash(content)))
+    link = canonicalize_link(content.get("link"))
+    if link:
+        keys.insert(0, (LINK, link))
+    return keys
+
+
+class ContentDedupIndex:
+    """
+    已发布内容的去重索引，按文档记录已发布内容的规范化链接和内容摘要
+
+    索引保存在 SQLite 中，每个文档首次使用时整体加载到内存中的集合，之后每条内容的检查是 O(1) 的集合查找。
+    文档第一次发布前通过 seed 从文档现有的 callout 中补齐索引，因此接入前已经发布的内容同样会被识别。
+    文档中的内容被手动删除后可以通过 invalidate 清空该文档的索引，下次发布时重新从文档补齐。
+    数据库在第一次使用时才打开，导入模块不会创建文件。
+    """
+
+    def __init__(self, path):
+        """
+        :param path: 数据库文件路径
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        self._keys = {}
+        self._seeded = None
+        self._skipped = 0
+        self._conn = None
+
+    def _db(self):
+        """
+        :return: 数据库连接，第一次调用时打开并建表；调用方需持有 _lock
+        """
+        if self._conn is not None:
+            return self._conn
+        ensure_parent_dir(self.path)
+        conn = sqlite3.connect(self.path, check_same_thread=False)
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS published_content ("
+            "document_id TEXT NOT NULL, kind TEXT NOT NULL, key TEXT NOT NULL, created_at REAL NOT NULL, "
+            "PRIMARY KEY (document_id, kind, key))"
+        )
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS seeded_documents (document_id TEXT PRIMARY KEY, revision_id INTEGER, seeded_at REAL NOT NULL)"
+        )
+        conn.commit()
+        self._seeded = {row[0] for row in conn.execute("SELECT document_id FROM seeded_documents")}
+        self._conn = conn
+        return conn
+
+    @classmethod
+    def from_env(cls):
+        """
+        根据环境变量创建去重索引
+        FEISHU_DEDUP_DB_PATH: 数据库文件路径，默认为 FEISHU_DATA_DIR 目录下的 feishu_dedup.sqlite3
+        """
+        return cls(data_path('feishu_dedup.sqlite3', 'FEISHU_DEDUP_DB_PATH'))
+
+    def _document_keys(self, document_id):
+        keys = self._keys.get(document_id)
+        if keys is None:
+            with self._lock:
+                rows = self._db().execute(
+                    "SELECT kind, key FROM published_content WHERE document_id = ?", (document_id,)
+                ).fetchall()
+            keys = self._keys[document_id] = set(rows)
+        return keys
+
+    def is_seeded(self, document_id):
+        if self._seeded is None:
+            with self._lock:
+                self._db()
+        return document_id in self._seeded
+
+    def seed(self, document_id, tree):
+        """
+        从文档的块树中提取已经发布的内容（callout 中的标题、要点和原文链接）加入索引
+        :param tree: DocumentTree
+        :return: 提取到的内容数
+        """
+        contents = [self._content_of_callout(tree, callout) for callout in tree.blocks_of_type(_CALLOUT)]
+        contents = [content for content in contents if content["title"] or content["bullets"] or content["link"]]
+        self.add(document_id, contents)
+        with self._lock:
+            conn = self._db()
+            conn.execute(
+                "INSERT OR REPLACE INTO seeded_documents (document_id, revision_id, seeded_at) VALUES (?, ?, ?)",
+                (document_id, tree.revision_id, time.time()),
+            )
+            conn.commit()
+            self._seeded.add(document_id)
+        return len(contents)
+
+    @staticmethod
+    def _content_of_callout(tree, callout):
+        content = {"title": "", "bullets": [], "link": None}
+        for child in tree.children(callout["block_id"]):
+            block_type = child.get("block_type")
+            if block_type == _HEADING2 and not content["title"]:
+                content["title"] = tree.text_of(child)
+            elif block_type == _BULLET:
+                content["bullets"].append(tree.text_of(child))
+            name = BlockType.get_string_by_position(block_type)
+            for element in (child.get(name) or {}).get("elements") or []:
+                url = (((element.get("text_run") or {}).get("text_element_style") or {}).get("link") or {}).get("url")
+                if url and content["link"] is None:
+                    content["link"] = url
+        return content
+
+    def filter(self, document_id, contents):
+        """
+        过滤已经发布过的内容，同一批中重复的内容只保留第一条
+        :param contents: 内容字典列表
+        :return: (未发布过的内容列表, 被跳过的内容列表)
+        """
+        published = self._document_keys(document_id)
+        batch = set()
+        fresh, skipped = [], []
+        for content in contents:
+            keys = content_keys(content)
+            if any(key in published or key in batch for key in keys):
+                skipped.append(content)
+            else:
+                fresh.append(content)
+                batch.update(keys)
+        self._skipped += len(skipped)
+        return fresh, skipped
+
+    def add(self, document_id, contents):
+        """
+        记录已经发布到文档的内容
+        """
+        published = self._document_keys(document_id)
+        new_keys = {key for content in contents for key in content_keys(content)} - published
+        if not new_keys:
+            return
+        now = time.time()
+        with self._lock:
+            conn = self._db()
+            conn.executemany(
+                "INSERT OR IGNORE INTO published_content (document_id, kind, key, created_at) VALUES (?, ?, ?, ?)",
+                [(document_id, kind, key, now) for kind, key in new_keys],
+            )
+            conn.commit()
+        published.update(new_keys)
+
+    def invalidate(self, document_id):
+        """
+        清空文档的去重索引（如文档中已发布的内容被手动删除后），下次发布时重新从文档现有的 callout 补齐
+        :return: 删除的键数
+        """
+        with self._lock:
+            conn = self._db()
+            count = conn.execute("DELETE FROM published_content WHERE document_id = ?", (document_id,)).rowcount
+            conn.execute("DELETE FROM seeded_documents WHERE document_id = ?", (document_id,))
+            conn.commit()
+            self._seeded.discard(document_id)
+            self._keys.pop(document_id, None)
+        return count
+
+    def stats(self):
+        """
+        :return: 已加载的文档数、已加载的键数、已补齐索引的文档数和累计跳过的内容数
+        """
+        return {
+            "documents": len(self._keys),
+            "keys": sum(len(keys) for keys in self._keys.values()),
+            "seeded_documents": len(self._seeded or ()),
+            "skipped": self._skipped
+        }
+
+
+content_dedup = ContentDedupIndex.from_env()
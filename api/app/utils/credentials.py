@@ -0,0 +1,87 @@
+# file name: credentials.py
+import base64
+import hashlib
+import os
+
+try:
+    from cryptography.fernet import Fernet, InvalidToken
+except ImportError:  # pragma: no cover - 取决于运行环境
+    Fernet = None
+
+HAS_CRYPTOGRAPHY = Fernet is not None
+
+# 凭证引用的来源
+ENV = "env"              # .env 中配置的应用，执行时从环境变量读取
+ENCRYPTED = "encrypted"  # 加密后随任务保存的 App Secret
+
+
+class MissingCredentials(Exception):
+    """
+    找不到应用的凭证
+    """
+
+
+class CredentialStore:
+    """
+    后台任务的应用凭证
+
+    任务数据库中不保存明文的 App Secret，只保存服务重启后仍能取回凭证的引用（seal 的返回值）：
+    .env 中配置的应用（FEISHU_APP_ID / FEISHU_APP_SECRET）只记录来源，执行时从环境变量读取；
+    其他应用的 App Secret 用 FEISHU_CREDENTIALS_KEY 派生的密钥加密后保存（需要安装 cryptography）。
+    两者都不可用时 seal 抛出 MissingCredentials：这样的任务在服务重启后无法完成，不应被接收。
+    """
+
+    def __init__(self, key=None):
+        """
+        :param key: 加密 App Secret 的密钥（任意字符串），为 None 时只能使用 .env 中配置的应用
+        """
+        self.key = key
+        self._fernet = None
+        if key and HAS_CRYPTOGRAPHY:
+            self._fernet = Fernet(base64.urlsafe_b64encode(hashlib.sha256(key.encode("utf-8")).digest()))
+
+    @classmethod
+    def from_env(cls):
+        """
+        FEISHU_CREDENTIALS_KEY: 加密任务中 App Secret 的密钥，更换后尚未执行的任务无法再解密
+        """
+        return cls(os.getenv('FEISHU_CREDENTIALS_KEY'))
+
+    @staticmethod
+    def _env_secret(app_id):
+        if app_id and app_id == os.getenv('FEISHU_APP_ID'):
+            return os.getenv('FEISHU_APP_SECRET') or None
+        return None
+
+    def seal(self, app_id, app_secret):
+        """
+        :return: 可以随任务保存到数据库的凭证引用
+        :raises MissingCredentials: 服务重启后无法取回该凭证
+        """
+        if app_secret and app_secret == self._env_secret(app_id):
+            return {"source": ENV}
+        if self._fernet is None:
+            reason = "未安装 cryptography" if self.key else "未配置 FEISHU_CREDENTIALS_KEY"
+            raise MissingCredentials(f"应用 {app_id} 的凭证无法安全保存（{reason}），服务重启后任务将无法执行")
+        return {"source": ENCRYPTED, "token": self._fernet.encrypt(app_secret.encode("utf-8")).decode("ascii")}
+
+    def unseal(self, app_id, credential):
+        """
+        :param credential: seal 返回的凭证引用；为 None 时（早期版本提交的任务）尝试使用 .env 中的凭证
+        :return: App Secret
+        :raises MissingCredentials: 凭证无法取回
+        """
+        if credential and credential.get("source") == ENCRYPTED:
+            if self._fernet is None:
+                raise MissingCredentials(f"应用 {app_id} 的凭证已加密保存，但当前未配置 FEISHU_CREDENTIALS_KEY 或未安装 cryptography")
+            try:
+                return self._fernet.decrypt(credential["token"].encode("ascii")).decode("utf-8")
+            except InvalidToken:
+                raise MissingCredentials(f"应用 {app_id} 的凭证无法解密，FEISHU_CREDENTIALS_KEY 可能已经更换")
+        secret = self._env_secret(app_id)
+        if secret is None:
+            raise MissingCredentials(f"应用 {app_id} 的凭证不在环境变量中，需要重新提交任务")
+        return secret
+
+
+app_credentials = CredentialStore.from_env()
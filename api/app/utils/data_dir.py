@@ -0,0 +1,22 @@
+# file name: data_dir.py
+import os
+
+
+def data_path(filename, env_name=None):
+    """
+    本地数据文件的路径
+    :param filename: 文件名
+    :param env_name: 可选的环境变量名，设置时直接使用其值作为完整路径
+    :return: env_name 指定的路径，否则为 FEISHU_DATA_DIR 目录（默认当前目录）下的 filename
+    """
+    if env_name and os.getenv(env_name):
+        return os.getenv(env_name)
+    return os.path.join(os.getenv('FEISHU_DATA_DIR', '.'), filename)
+
+
+def ensure_parent_dir(path):
+    """
+    创建数据文件所在的目录；只在第一次打开数据库时调用，导入模块时不会写文件系统
+    """
+    if path != ":memory:":
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
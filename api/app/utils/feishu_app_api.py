@@ -1,13 +1,17 @@
-import requests
-import json
+from api.app.utils.feishu_http import request
+from api.app.utils import json_codec
+from api.app.utils.feishu_token_cache import tenant_token_cache
+from api.app.utils.feishu_response_cache import owner_key, response_cache
 
 class FeishuDriveAPI:
-    def __init__(self, access_token):
+    def __init__(self, access_token, app_id=None):
         """
         初始化 FeishuDriveAPI 类
         :param access_token: tenant_access_token 或 user_access_token
+        :param app_id: 飞书应用的 APP ID，用于按应用限流
         """
         self.access_token = access_token
+        self.app_id = app_id
         self.base_url = "https://open.feishu.cn/open-apis"
 
     def _get_headers(self):
@@ -20,6 +24,12 @@ class FeishuDriveAPI:
             "Content-Type": "application/json; charset=utf-8"
         }
 
+    def _request(self, method, url, **kwargs):
+        """
+        发送请求，并按应用和接口类别限流
+        """
+        return request(method, url, rate_key=owner_key(self.app_id, self.access_token), family="drive", **kwargs)
+
     def get_folder_files(self, folder_token="", page_size=50, page_token=None, order_by="EditedTime", direction="DESC", user_id_type="open_id"):
         """
         获取文件夹中的文件清单
@@ -43,12 +53,37 @@ class FeishuDriveAPI:
         if page_token:
             params["page_token"] = page_token
 
-        response = requests.get(url, headers=headers, params=params)
-        return response.json()
+        cache_key = (owner_key(self.app_id, self.access_token), folder_token, page_size, page_token, order_by, direction, user_id_type)
+        cached = response_cache.get("drive.folder_files", *cache_key)
+        if cached is not None:
+            return cached
+
+        response = self._request("GET", url, headers=headers, params=params)
+        response_cache.set("drive.folder_files", *cache_key, value=response)
+        return response
+
+    def create_folder(self, name, folder_token=""):
+        """
+        在指定文件夹中新建文件夹
+        :param name: 文件夹名称
+        :param folder_token: 父文件夹的 token，为空字符串时在根目录下创建
+        :return: API 响应结果，data 中包含新文件夹的 token 和 url
+        """
+        url = f"{self.base_url}/drive/v1/files/create_folder"
+        headers = self._get_headers()
+        payload = {
+            "name": name,
+            "folder_token": folder_token
+        }
+
+        response = self._request("POST", url, headers=headers, data=json_codec.encode(payload))
+        response_cache.invalidate("drive.folder_files", owner_key(self.app_id, self.access_token), folder_token)
+        return response
 
 class FeishuWikiAPI:
-    def __init__(self, api_key):
+    def __init__(self, api_key, app_id=None):
         self.api_key = api_key
+        self.app_id = app_id
         self.base_url = "https://open.feishu.cn/open-apis"
 
     def _get_headers(self):
@@ -56,6 +91,12 @@ class FeishuWikiAPI:
             "Authorization": f"Bearer {self.api_key}",
             "Content-Type": "application/json; charset=utf-8"
         }
+
+    def _request(self, method, url, **kwargs):
+        """
+        发送请求，并按应用和接口类别限流
+        """
+        return request(method, url, rate_key=owner_key(self.app_id, self.api_key), family="wiki", **kwargs)
     
     def get_space_list(self, page_token=""):
         url = f"{self.base_url}/wiki/v2/spaces"
@@ -64,16 +105,21 @@ class FeishuWikiAPI:
             "page_token": page_token
         }
         
-        response = requests.get(url, headers=headers, data=json.dumps(payload))
-        return response.json()
+        return self._request("GET", url, headers=headers, data=json_codec.encode(payload))
     
     def get_space_info(self, space_id):
         url = f"{self.base_url}/wiki/v2/spaces/{space_id}"
         headers = self._get_headers()
         
-        response = requests.get(url, headers=headers)
-        return response.json()
-    
+        cache_key = (owner_key(self.app_id, self.api_key), space_id)
+        cached = response_cache.get("wiki.space_info", *cache_key)
+        if cached is not None:
+            return cached
+
+        response = self._request("GET", url, headers=headers)
+        response_cache.set("wiki.space_info", *cache_key, value=response)
+        return response
+
     def create_space(self, name, description=""):
         url = f"{self.base_url}/wiki/v2/spaces"
         headers = self._get_headers()
@@ -82,8 +128,7 @@ class FeishuWikiAPI:
             "description": description
         }
         
-        response = requests.post(url, headers=headers, data=json.dumps(payload))
-        return response.json()
+        return self._request("POST", url, headers=headers, data=json_codec.encode(payload))
     
     def create_nodes(self, space_id, obj_type,parent_node_token="", node_type="origin", origin_node_token="", title=""):
         url = f"{self.base_url}/wiki/v2/spaces/{space_id}/nodes"
@@ -96,9 +141,10 @@ class FeishuWikiAPI:
             "title": title
         }
         
-        response = requests.post(url, headers=headers, data=json.dumps(payload))
-        return response.json()
-    
+        response = self._request("POST", url, headers=headers, data=json_codec.encode(payload))
+        response_cache.invalidate("wiki.node_info", owner_key(self.app_id, self.api_key))
+        return response
+
     def get_node_info(self, token,obj_type="wiki"):
         url = f"{self.base_url}/wiki/v2/spaces/get_node"
         headers = self._get_headers()
@@ -107,12 +153,19 @@ class FeishuWikiAPI:
             "token": token
         }
         
-        response = requests.get(url, headers=headers, data=json.dumps(payload))
-        return response.json()
+        cache_key = (owner_key(self.app_id, self.api_key), obj_type, token)
+        cached = response_cache.get("wiki.node_info", *cache_key)
+        if cached is not None:
+            return cached
+
+        response = self._request("GET", url, headers=headers, data=json_codec.encode(payload))
+        response_cache.set("wiki.node_info", *cache_key, value=response)
+        return response
 
 class FeishuDocxAPI:
-    def __init__(self, api_key):
+    def __init__(self, api_key, app_id=None):
         self.api_key = api_key
+        self.app_id = app_id
         self.base_url = "https://open.feishu.cn/open-apis"
 
     def _get_headers(self):
@@ -121,6 +174,19 @@ class FeishuDocxAPI:
             "Content-Type": "application/json; charset=utf-8"
         }
 
+    def _request(self, method, url, **kwargs):
+        """
+        发送请求，并按应用和接口类别限流
+        """
+        family = "docx_read" if method == "GET" else "docx_write"
+        return request(method, url, rate_key=owner_key(self.app_id, self.api_key), family=family, **kwargs)
+
+    def _invalidate_document(self, document_id):
+        """
+        文档被修改后版本号会变化，使缓存的文档信息失效
+        """
+        response_cache.invalidate("docx.document_info", owner_key(self.app_id, self.api_key), document_id)
+
     def create_document(self, title, folder_token=""):
         url = f"{self.base_url}/docx/v1/documents"
         headers = self._get_headers()
@@ -129,56 +195,92 @@ class FeishuDocxAPI:
             "title": title,
         }
         
-        response = requests.post(url, headers=headers, data=json.dumps(payload))
-        return response.json()
+        return self._request("POST", url, headers=headers, data=json_codec.encode(payload))
 
     def get_document_info(self, document_id):
         url = f"{self.base_url}/docx/v1/documents/{document_id}"
         headers = self._get_headers()
         
-        response = requests.get(url, headers=headers)
-        return response.json()
+        cache_key = (owner_key(self.app_id, self.api_key), document_id)
+        cached = response_cache.get("docx.document_info", *cache_key)
+        if cached is not None:
+            return cached
+
+        response = self._request("GET", url, headers=headers)
+        response_cache.set("docx.document_info", *cache_key, value=response)
+        return response
 
     def get_document_raw_content(self, document_id):
         url = f"{self.base_url}/docx/v1/documents/{document_id}/raw_content"
         headers = self._get_headers()
         
-        response = requests.get(url, headers=headers)
-        return response.json()
+        return self._request("GET", url, headers=headers)
 
-    def get_document_blocks(self, document_id):
+    def get_document_blocks(self, document_id, page_size=500, page_token=None, document_revision_id=-1, user_id_type="open_id"):
+        """
+        获取文档的一页块
+        :param page_size: 分页大小，最大值为 500
+        :param page_token: 分页标记，第一次请求不填
+        :param document_revision_id: 查询的文档版本，-1 表示最新版本
+        :return: 响应的 data 中包含 items、has_more 和 page_token
+        """
         url = f"{self.base_url}/docx/v1/documents/{document_id}/blocks"
         headers = self._get_headers()
-        
-        response = requests.get(url, headers=headers)
-        return response.json()
+        params = {
+            "page_size": page_size,
+            "document_revision_id": document_revision_id,
+            "user_id_type": user_id_type
+        }
+        if page_token:
+            params["page_token"] = page_token
+
+        return self._request("GET", url, headers=headers, params=params)
+
+    def iter_document_blocks(self, document_id, page_size=500, document_revision_id=-1, user_id_type="open_id"):
+        """
+        逐个返回文档的所有块，自动翻页
+        :raises Exception: 任意一页请求失败时抛出
+        """
+        page_token = None
+        while True:
+            response = self.get_document_blocks(document_id, page_size, page_token, document_revision_id, user_id_type)
+            if response.get('code') != 0:
+                raise Exception(f"获取文档块失败: {response.get('msg', 'Unknown error')}")
+            data = response.get('data', {})
+            yield from data.get('items', [])
+            page_token = data.get('page_token')
+            if not data.get('has_more') or not page_token:
+                break
     
     def get_block_contents(self, document_id, block_id):
         url = f"{self.base_url}/docx/v1/documents/{document_id}/blocks/{block_id}"
         headers = self._get_headers()
         
-        response = requests.get(url, headers=headers)
-        return response.json()
+        return self._request("GET", url, headers=headers)
     
     def get_block_children(self, document_id, block_id):
         url = f"{self.base_url}/docx/v1/documents/{document_id}/blocks/{block_id}/children"
         headers = self._get_headers()
         
-        response = requests.get(url, headers=headers)
-        return response.json()   
+        return self._request("GET", url, headers=headers)   
       
-    def create_block(self, document_id, block_id, children: list, index=-1):
+    def create_block(self, document_id, block_id, children: list, index=-1, client_token=None):
         url = f"{self.base_url}/docx/v1/documents/{document_id}/blocks/{block_id}/children"
         headers = self._get_headers()
         payload = {
             "children": children,
             "index": index
         }
+        # 携带 client_token 时请求是幂等的，失败后可以安全重试
+        params = {}
+        if client_token:
+            params["client_token"] = client_token
         
-        response = requests.post(url, headers=headers, data=json.dumps(payload))
-        return response.json()
+        response = self._request("POST", url, headers=headers, params=params, data=json_codec.encode(payload), idempotent=bool(client_token))
+        self._invalidate_document(document_id)
+        return response
 
-    def create_descendant_blocks(self, document_id, block_id, children_ids, descendants, index=0, document_revision_id=-1):
+    def create_descendant_blocks(self, document_id, block_id, children_ids, descendants, index=0, document_revision_id=-1, client_token=None):
         """
         在文档中创建嵌套块结构
 
@@ -188,6 +290,7 @@ class FeishuDocxAPI:
         :param descendants: 所有后代块的详细信息列表
         :param index: 插入位置的索引，默认为0
         :param document_revision_id: 文档版本号，默认为-1（最新版本）
+        :param client_token: 操作的唯一标识，用于幂等操作，携带时失败可自动重试
         :return: API 响应结果
         """
         url = f"{self.base_url}/docx/v1/documents/{document_id}/blocks/{block_id}/descendant"
@@ -204,19 +307,23 @@ class FeishuDocxAPI:
         params = {}
         if document_revision_id is not None:
             params["document_revision_id"] = document_revision_id
+        if client_token:
+            params["client_token"] = client_token
         
         # 发送 POST 请求
-        response = requests.post(url, headers=headers, params=params, data=json.dumps(payload))
-        return response.json()
+        response = self._request("POST", url, headers=headers, params=params, data=json_codec.encode(payload), idempotent=bool(client_token))
+        self._invalidate_document(document_id)
+        return response
 
     def update_block(self, document_id, block_id, operation: list):
         url = f"{self.base_url}/docx/v1/documents/{document_id}/blocks/{block_id}"
         headers = self._get_headers()
         payload = operation
         
-        response = requests.patch(url, headers=headers, data=json.dumps(payload))
-        return response.json()
-    
+        response = self._request("PATCH", url, headers=headers, data=json_codec.encode(payload))
+        self._invalidate_document(document_id)
+        return response
+
     def delete_block(self, document_id, block_id, start_index=0, end_index=1):
         url = f"{self.base_url}/docx/v1/documents/{document_id}/blocks/{block_id}/children/batch_delete"
         headers = self._get_headers()
@@ -225,8 +332,9 @@ class FeishuDocxAPI:
             "end_index": end_index
         }
         
-        response = requests.delete(url, headers=headers, data=json.dumps(payload))
-        return response.json()
+        response = self._request("DELETE", url, headers=headers, data=json_codec.encode(payload))
+        self._invalidate_document(document_id)
+        return response
 
     def batch_update_blocks(self, document_id, requests_list, document_revision_id=-1, client_token=None, user_id_type="open_id"):
         """
@@ -244,21 +352,26 @@ class FeishuDocxAPI:
         
         # 构建请求体
         payload = {
-            "requests": requests_list,
+            "requests": requests_list
+        }
+
+        # 版本、幂等标识和用户 ID 类型均为查询参数
+        params = {
             "document_revision_id": document_revision_id,
-            "client_token": client_token,
             "user_id_type": user_id_type
         }
+        if client_token:
+            params["client_token"] = client_token
         
-        # 发送 PATCH 请求
-        response = requests.patch(url, headers=headers, data=json.dumps(payload))
-        return response.json()
-
-
+        # 发送 PATCH 请求，携带 client_token 时失败可自动重试
+        response = self._request("PATCH", url, headers=headers, params=params, data=json_codec.encode(payload), idempotent=bool(client_token))
+        self._invalidate_document(document_id)
+        return response
 
 class FeishuBitableAPI:
-    def __init__(self, api_key):
+    def __init__(self, api_key, app_id=None):
         self.api_key = api_key
+        self.app_id = app_id
         self.base_url = "https://open.feishu.cn/open-apis"
 
     def _get_headers(self):
@@ -267,6 +380,12 @@ class FeishuBitableAPI:
             "Content-Type": "application/json; charset=utf-8"
         }
 
+    def _request(self, method, url, **kwargs):
+        """
+        发送请求，并按应用和接口类别限流
+        """
+        return request(method, url, rate_key=owner_key(self.app_id, self.api_key), family="bitable", **kwargs)
+
     def create_bitable(self, name, folder_token=""):
         url = f"{self.base_url}/bitable/v1/apps"
         headers = self._get_headers()
@@ -275,8 +394,7 @@ class FeishuBitableAPI:
             "name": name,
         }
         
-        response = requests.post(url, headers=headers, data=json.dumps(payload))
-        return response.json()
+        return self._request("POST", url, headers=headers, data=json_codec.encode(payload))
 
     def get_record_content(self, app_token, table_id, record_id):
         args = {
@@ -304,8 +422,8 @@ class FeishuBitableAPI:
         
         payload = args
         
-        response = requests.post(url, headers=headers, data=json.dumps(payload))
-        return response.json()    
+        # 查询接口虽然使用 POST，但不会修改数据，可以安全重试
+        return self._request("POST", url, headers=headers, data=json_codec.encode(payload), idempotent=True)    
 
     def create_record(self, app_token, table_id, fields: list):
         url = f"{self.base_url}/bitable/v1/apps/{app_token}/tables/{table_id}/records"
@@ -314,8 +432,7 @@ class FeishuBitableAPI:
             "fields": fields,
         }
         
-        response = requests.post(url, headers=headers, data=json.dumps(payload))
-        return response.json()
+        return self._request("POST", url, headers=headers, data=json_codec.encode(payload))
 
     def update_record(self, app_token, table_id, record_id, fields: list):
         url = f"{self.base_url}/bitable/v1/apps/{app_token}/tables/{table_id}/records/{record_id}"
@@ -324,15 +441,13 @@ class FeishuBitableAPI:
             "fields": fields,
         }
         
-        response = requests.put(url, headers=headers, data=json.dumps(payload))
-        return response.json()
+        return self._request("PUT", url, headers=headers, data=json_codec.encode(payload))
 
     def delete_record(self, app_token, table_id, record_id):
         url = f"{self.base_url}/bitable/v1/apps/{app_token}/tables/{table_id}/records/{record_id}"
         headers = self._get_headers()
         
-        response = requests.delete(url, headers=headers)
-        return response.json()
+        return self._request("DELETE", url, headers=headers)
 
     def batch_create_records(self, app_token, table_id, records, user_id_type="open_id", client_token=None):
         """
@@ -360,9 +475,8 @@ class FeishuBitableAPI:
         if client_token:
             params["client_token"] = client_token
 
-        # 发送 POST 请求
-        response = requests.post(url, headers=headers, params=params, data=json.dumps(payload))
-        return response.json()
+        # 发送 POST 请求，携带 client_token 时失败可自动重试
+        return self._request("POST", url, headers=headers, params=params, data=json_codec.encode(payload), idempotent=bool(client_token))
 
     def batch_update_records(self, app_token, table_id, records, user_id_type="open_id"):
         """
@@ -388,8 +502,7 @@ class FeishuBitableAPI:
         }
 
         # 发送 POST 请求
-        response = requests.post(url, headers=headers, params=params, data=json.dumps(payload))
-        return response.json()
+        return self._request("POST", url, headers=headers, params=params, data=json_codec.encode(payload))
 
     def batch_get_records(self, app_token, table_id, record_ids, user_id_type="open_id", with_shared_url=False, automatic_fields=False):
         """
@@ -418,9 +531,8 @@ class FeishuBitableAPI:
             "user_id_type": user_id_type
         }
 
-        # 发送 POST 请求
-        response = requests.post(url, headers=headers, params=params, data=json.dumps(payload))
-        return response.json()
+        # 发送 POST 请求，批量获取不会修改数据，可以安全重试
+        return self._request("POST", url, headers=headers, params=params, data=json_codec.encode(payload), idempotent=True)
 
     def batch_delete_records(self, app_token, table_id, record_ids):
         """
@@ -440,8 +552,7 @@ class FeishuBitableAPI:
         }
 
         # 发送 POST 请求
-        response = requests.post(url, headers=headers, data=json.dumps(payload))
-        return response.json()
+        return self._request("POST", url, headers=headers, data=json_codec.encode(payload))
 
 
 
@@ -454,11 +565,10 @@ def get_app_access_token(app_id, app_secret):
         "app_id": app_id,
         "app_secret": app_secret,
     }
-    response = requests.post(url, headers=headers, json=payload)
-    response_data = response.json()
+    response_data = request("POST", url, headers=headers, json=payload, idempotent=True)
     return response_data.get("app_access_token")
 
-def get_tenant_access_token(app_id, app_secret):
+def _fetch_tenant_access_token(app_id, app_secret):
     url = f"https://open.feishu.cn/open-apis/auth/v3/tenant_access_token/internal"
     headers = {
         "Content-Type": "application/json"
@@ -467,9 +577,17 @@ def get_tenant_access_token(app_id, app_secret):
         "app_id": app_id,
         "app_secret": app_secret,
     }
-    response = requests.post(url, headers=headers, json=payload)
-    response_data = response.json()
-    return response_data.get("tenant_access_token")
+    response_data = request("POST", url, headers=headers, json=payload, idempotent=True)
+    return response_data.get("tenant_access_token"), response_data.get("expire")
+
+def get_tenant_access_token(app_id, app_secret):
+    """
+    获取 tenant_access_token，按 app_id 缓存并在到期前自动刷新
+    :param app_id: 飞书应用的 APP ID
+    :param app_secret: 飞书应用的 APP Secret
+    :return: tenant_access_token，获取失败时返回 None
+    """
+    return tenant_token_cache.get(app_id, app_secret, _fetch_tenant_access_token)
 
 def get_user_access_token(app_access_token,auth_code):
     url = f"https://open.feishu.cn/open-apis/authen/v1/oidc/access_token"
@@ -481,8 +599,7 @@ def get_user_access_token(app_access_token,auth_code):
         "grant_type": "authorization_code",
         "code": auth_code
     } 
-    response = requests.post(url, headers=headers, json=payload)  
-    response_data = response.json()
+    response_data = request("POST", url, headers=headers, json=payload)
     return response_data
 
 
@@ -501,8 +618,7 @@ def refresh_feishu_access_token(access_token,refresh_token):
         "refresh_token": refresh_token
     }
 
-    response = requests.post(url, headers=headers, data=json.dumps(payload))
-    return response.json()
+    return request("POST", url, headers=headers, data=json_codec.encode(payload))
 
 
 def parse_text_to_feishu_json(text, is_first_line_heading=True, max_blocks_per_group=50):
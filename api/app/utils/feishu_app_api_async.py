@@ -1,13 +1,23 @@
-import aiohttp
-import json
+import asyncio
+
+from api.app.utils.feishu_http_async import request
+from api.app.utils import json_codec
+from api.app.utils.feishu_token_cache import tenant_token_cache
+from api.app.utils.feishu_response_cache import owner_key, response_cache
+from api.app.utils.singleflight import AsyncSingleFlight
+
+# 合并并发的相同文档读请求
+_read_flight = AsyncSingleFlight()
 
 class FeishuDriveAPI:
-    def __init__(self, access_token):
+    def __init__(self, access_token, app_id=None):
         """
         初始化 FeishuDriveAPI 类
         :param access_token: tenant_access_token 或 user_access_token
+        :param app_id: 飞书应用的 APP ID，用于按应用限流
         """
         self.access_token = access_token
+        self.app_id = app_id
         self.base_url = "https://open.feishu.cn/open-apis"
 
     def _get_headers(self):
@@ -20,6 +30,12 @@ class FeishuDriveAPI:
             "Content-Type": "application/json; charset=utf-8"
         }
 
+    async def _request(self, method, url, **kwargs):
+        """
+        发送请求，并按应用和接口类别限流
+        """
+        return await request(method, url, rate_key=owner_key(self.app_id, self.access_token), family="drive", **kwargs)
+
     async def get_folder_files(self, folder_token="", page_size=50, page_token=None, order_by="EditedTime", direction="DESC", user_id_type="open_id"):
         """
         获取文件夹中的文件清单
@@ -43,13 +59,37 @@ class FeishuDriveAPI:
         if page_token:
             params["page_token"] = page_token
 
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url, headers=headers, params=params) as response:
-                return await response.json()
+        cache_key = (owner_key(self.app_id, self.access_token), folder_token, page_size, page_token, order_by, direction, user_id_type)
+        cached = response_cache.get("drive.folder_files", *cache_key)
+        if cached is not None:
+            return cached
+
+        response = await self._request("GET", url, headers=headers, params=params)
+        response_cache.set("drive.folder_files", *cache_key, value=response)
+        return response
+
+    async def create_folder(self, name, folder_token=""):
+        """
+        在指定文件夹中新建文件夹
+        :param name: 文件夹名称
+        :param folder_token: 父文件夹的 token，为空字符串时在根目录下创建
+        :return: API 响应结果，data 中包含新文件夹的 token 和 url
+        """
+        url = f"{self.base_url}/drive/v1/files/create_folder"
+        headers = self._get_headers()
+        payload = {
+            "name": name,
+            "folder_token": folder_token
+        }
+
+        response = await self._request("POST", url, headers=headers, data=json_codec.encode(payload))
+        response_cache.invalidate("drive.folder_files", owner_key(self.app_id, self.access_token), folder_token)
+        return response
 
 class FeishuWikiAPI:
-    def __init__(self, api_key):
+    def __init__(self, api_key, app_id=None):
         self.api_key = api_key
+        self.app_id = app_id
         self.base_url = "https://open.feishu.cn/open-apis"
 
     def _get_headers(self):
@@ -57,6 +97,12 @@ class FeishuWikiAPI:
             "Authorization": f"Bearer {self.api_key}",
             "Content-Type": "application/json; charset=utf-8"
         }
+
+    async def _request(self, method, url, **kwargs):
+        """
+        发送请求，并按应用和接口类别限流
+        """
+        return await request(method, url, rate_key=owner_key(self.app_id, self.api_key), family="wiki", **kwargs)
     
     async def get_space_list(self, page_token=""):
         url = f"{self.base_url}/wiki/v2/spaces"
@@ -65,18 +111,21 @@ class FeishuWikiAPI:
             "page_token": page_token
         }
         
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url, headers=headers, data=json.dumps(payload)) as response:
-                return await response.json()
+        return await self._request("GET", url, headers=headers, data=json_codec.encode(payload))
     
     async def get_space_info(self, space_id):
         url = f"{self.base_url}/wiki/v2/spaces/{space_id}"
         headers = self._get_headers()
         
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url, headers=headers) as response:
-                return await response.json()
-    
+        cache_key = (owner_key(self.app_id, self.api_key), space_id)
+        cached = response_cache.get("wiki.space_info", *cache_key)
+        if cached is not None:
+            return cached
+
+        response = await self._request("GET", url, headers=headers)
+        response_cache.set("wiki.space_info", *cache_key, value=response)
+        return response
+
     async def create_space(self, name, description=""):
         url = f"{self.base_url}/wiki/v2/spaces"
         headers = self._get_headers()
@@ -85,9 +134,7 @@ class FeishuWikiAPI:
             "description": description
         }
         
-        async with aiohttp.ClientSession() as session:
-            async with session.post(url, headers=headers, data=json.dumps(payload)) as response:
-                return await response.json()
+        return await self._request("POST", url, headers=headers, data=json_codec.encode(payload))
     
     async def create_nodes(self, space_id, obj_type, parent_node_token="", node_type="origin", origin_node_token="", title=""):
         url = f"{self.base_url}/wiki/v2/spaces/{space_id}/nodes"
@@ -100,10 +147,10 @@ class FeishuWikiAPI:
             "title": title
         }
         
-        async with aiohttp.ClientSession() as session:
-            async with session.post(url, headers=headers, data=json.dumps(payload)) as response:
-                return await response.json()
-    
+        response = await self._request("POST", url, headers=headers, data=json_codec.encode(payload))
+        response_cache.invalidate("wiki.node_info", owner_key(self.app_id, self.api_key))
+        return response
+
     async def get_node_info(self, token, obj_type="wiki"):
         url = f"{self.base_url}/wiki/v2/spaces/get_node"
         headers = self._get_headers()
@@ -112,13 +159,19 @@ class FeishuWikiAPI:
             "token": token
         }
         
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url, headers=headers, data=json.dumps(payload)) as response:
-                return await response.json()
+        cache_key = (owner_key(self.app_id, self.api_key), obj_type, token)
+        cached = response_cache.get("wiki.node_info", *cache_key)
+        if cached is not None:
+            return cached
+
+        response = await self._request("GET", url, headers=headers, data=json_codec.encode(payload))
+        response_cache.set("wiki.node_info", *cache_key, value=response)
+        return response
 
 class FeishuDocxAPI:
-    def __init__(self, api_key):
+    def __init__(self, api_key, app_id=None):
         self.api_key = api_key
+        self.app_id = app_id
         self.base_url = "https://open.feishu.cn/open-apis"
 
     def _get_headers(self):
@@ -127,6 +180,27 @@ class FeishuDocxAPI:
             "Content-Type": "application/json; charset=utf-8"
         }
 
+    async def _request(self, method, url, **kwargs):
+        """
+        发送请求，并按应用和接口类别限流
+
+        并发的相同 GET 请求（同一 token、URL 和查询参数）会合并为一次上游调用，
+        所有调用方共享同一个解析后的结果，调用方不应修改返回的字典。
+        """
+        rate_key = owner_key(self.app_id, self.api_key)
+        if method != "GET":
+            return await request(method, url, rate_key=rate_key, family="docx_write", **kwargs)
+
+        params = kwargs.get('params')
+        key = (self.api_key, url, tuple(sorted(params.items())) if params else ())
+        return await _read_flight.do(key, request, method, url, rate_key=rate_key, family="docx_read", **kwargs)
+
+    def _invalidate_document(self, document_id):
+        """
+        文档被修改后版本号会变化，使缓存的文档信息失效
+        """
+        response_cache.invalidate("docx.document_info", owner_key(self.app_id, self.api_key), document_id)
+
     async def create_document(self, title, folder_token=""):
         url = f"{self.base_url}/docx/v1/documents"
         headers = self._get_headers()
@@ -135,63 +209,107 @@ class FeishuDocxAPI:
             "title": title,
         }
         
-        async with aiohttp.ClientSession() as session:
-            async with session.post(url, headers=headers, data=json.dumps(payload)) as response:
-                return await response.json()
+        return await self._request("POST", url, headers=headers, data=json_codec.encode(payload))
 
-    async def get_document_info(self, document_id):
+    async def get_document_info(self, document_id, use_cache=True):
+        """
+        :param use_cache: 为 False 时跳过缓存直接请求（如核对文档版本），结果仍会写入缓存
+        """
         url = f"{self.base_url}/docx/v1/documents/{document_id}"
         headers = self._get_headers()
         
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url, headers=headers) as response:
-                return await response.json()
+        cache_key = (owner_key(self.app_id, self.api_key), document_id)
+        cached = response_cache.get("docx.document_info", *cache_key) if use_cache else None
+        if cached is not None:
+            return cached
+
+        response = await self._request("GET", url, headers=headers)
+        response_cache.set("docx.document_info", *cache_key, value=response)
+        return response
 
     async def get_document_raw_content(self, document_id):
         url = f"{self.base_url}/docx/v1/documents/{document_id}/raw_content"
         headers = self._get_headers()
         
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url, headers=headers) as response:
-                return await response.json()
+        return await self._request("GET", url, headers=headers)
 
-    async def get_document_blocks(self, document_id):
+    async def get_document_blocks(self, document_id, page_size=500, page_token=None, document_revision_id=-1, user_id_type="open_id"):
+        """
+        获取文档的一页块
+        :param page_size: 分页大小，最大值为 500
+        :param page_token: 分页标记，第一次请求不填
+        :param document_revision_id: 查询的文档版本，-1 表示最新版本
+        :return: 响应的 data 中包含 items、has_more 和 page_token
+        """
         url = f"{self.base_url}/docx/v1/documents/{document_id}/blocks"
         headers = self._get_headers()
-        
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url, headers=headers) as response:
-                return await response.json()
+        params = {
+            "page_size": page_size,
+            "document_revision_id": document_revision_id,
+            "user_id_type": user_id_type
+        }
+        if page_token:
+            params["page_token"] = page_token
+
+        return await self._request("GET", url, headers=headers, params=params)
+
+    async def iter_document_blocks(self, document_id, page_size=500, document_revision_id=-1, user_id_type="open_id"):
+        """
+        逐个返回文档的所有块，自动翻页
+
+        处理当前页时会预先请求下一页，同一时间最多只持有两页数据。
+        :raises Exception: 任意一页请求失败时抛出
+        """
+        def fetch(page_token):
+            return asyncio.ensure_future(
+                self.get_document_blocks(document_id, page_size, page_token, document_revision_id, user_id_type)
+            )
+
+        pending = fetch(None)
+        try:
+            while pending is not None:
+                response = await pending
+                pending = None
+                if response.get('code') != 0:
+                    raise Exception(f"获取文档块失败: {response.get('msg', 'Unknown error')}")
+                data = response.get('data', {})
+                if data.get('has_more') and data.get('page_token'):
+                    pending = fetch(data['page_token'])
+                for block in data.get('items', []):
+                    yield block
+        finally:
+            if pending is not None:
+                pending.cancel()
     
     async def get_block_contents(self, document_id, block_id):
         url = f"{self.base_url}/docx/v1/documents/{document_id}/blocks/{block_id}"
         headers = self._get_headers()
         
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url, headers=headers) as response:
-                return await response.json()
+        return await self._request("GET", url, headers=headers)
     
     async def get_block_children(self, document_id, block_id):
         url = f"{self.base_url}/docx/v1/documents/{document_id}/blocks/{block_id}/children"
         headers = self._get_headers()
         
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url, headers=headers) as response:
-                return await response.json()   
+        return await self._request("GET", url, headers=headers)   
       
-    async def create_block(self, document_id, block_id, children: list, index=-1):
+    async def create_block(self, document_id, block_id, children: list, index=-1, client_token=None):
         url = f"{self.base_url}/docx/v1/documents/{document_id}/blocks/{block_id}/children"
         headers = self._get_headers()
         payload = {
             "children": children,
             "index": index
         }
+        # 携带 client_token 时请求是幂等的，失败后可以安全重试
+        params = {}
+        if client_token:
+            params["client_token"] = client_token
         
-        async with aiohttp.ClientSession() as session:
-            async with session.post(url, headers=headers, data=json.dumps(payload)) as response:
-                return await response.json()
+        response = await self._request("POST", url, headers=headers, params=params, data=json_codec.encode(payload), idempotent=bool(client_token))
+        self._invalidate_document(document_id)
+        return response
 
-    async def create_descendant_blocks(self, document_id, block_id, children_ids, descendants, index=0, document_revision_id=-1):
+    async def create_descendant_blocks(self, document_id, block_id, children_ids, descendants, index=0, document_revision_id=-1, client_token=None):
         """
         在文档中创建嵌套块结构
 
@@ -201,6 +319,7 @@ class FeishuDocxAPI:
         :param descendants: 所有后代块的详细信息列表
         :param index: 插入位置的索引，默认为0
         :param document_revision_id: 文档版本ID，默认为-1（最新版本）
+        :param client_token: 操作的唯一标识，用于幂等操作，携带时失败可自动重试
         :return: API 响应结果
 
         示例使用:
@@ -250,22 +369,23 @@ class FeishuDocxAPI:
         params = {
             "document_revision_id": document_revision_id
         }
+        if client_token:
+            params["client_token"] = client_token
         
         # 发送请求
-        async with aiohttp.ClientSession() as session:
-            async with session.post(url, headers=headers, params=params, json=payload) as response:
-                return await response.json()
-
+        response = await self._request("POST", url, headers=headers, params=params, json=payload, idempotent=bool(client_token))
+        self._invalidate_document(document_id)
+        return response
 
     async def update_block(self, document_id, block_id, operation: list):
         url = f"{self.base_url}/docx/v1/documents/{document_id}/blocks/{block_id}"
         headers = self._get_headers()
         payload = operation
         
-        async with aiohttp.ClientSession() as session:
-            async with session.patch(url, headers=headers, data=json.dumps(payload)) as response:
-                return await response.json()
-    
+        response = await self._request("PATCH", url, headers=headers, data=json_codec.encode(payload))
+        self._invalidate_document(document_id)
+        return response
+
     async def delete_block(self, document_id, block_id, start_index=0, end_index=1):
         url = f"{self.base_url}/docx/v1/documents/{document_id}/blocks/{block_id}/children/batch_delete"
         headers = self._get_headers()
@@ -274,9 +394,9 @@ class FeishuDocxAPI:
             "end_index": end_index
         }
         
-        async with aiohttp.ClientSession() as session:
-            async with session.delete(url, headers=headers, data=json.dumps(payload)) as response:
-                return await response.json()
+        response = await self._request("DELETE", url, headers=headers, data=json_codec.encode(payload))
+        self._invalidate_document(document_id)
+        return response
 
     async def batch_update_blocks(self, document_id, requests_list, document_revision_id=-1, client_token=None, user_id_type="open_id"):
         """
@@ -294,20 +414,26 @@ class FeishuDocxAPI:
         
         # 构建请求体
         payload = {
-            "requests": requests_list,
+            "requests": requests_list
+        }
+
+        # 版本、幂等标识和用户 ID 类型均为查询参数
+        params = {
             "document_revision_id": document_revision_id,
-            "client_token": client_token,
             "user_id_type": user_id_type
         }
+        if client_token:
+            params["client_token"] = client_token
         
-        # 发送 PATCH 请求
-        async with aiohttp.ClientSession() as session:
-            async with session.patch(url, headers=headers, data=json.dumps(payload)) as response:
-                return await response.json()
+        # 发送 PATCH 请求，携带 client_token 时失败可自动重试
+        response = await self._request("PATCH", url, headers=headers, params=params, data=json_codec.encode(payload), idempotent=bool(client_token))
+        self._invalidate_document(document_id)
+        return response
 
 class FeishuBitableAPI:
-    def __init__(self, api_key):
+    def __init__(self, api_key, app_id=None):
         self.api_key = api_key
+        self.app_id = app_id
         self.base_url = "https://open.feishu.cn/open-apis"
 
     def _get_headers(self):
@@ -316,6 +442,12 @@ class FeishuBitableAPI:
             "Content-Type": "application/json; charset=utf-8"
         }
 
+    async def _request(self, method, url, **kwargs):
+        """
+        发送请求，并按应用和接口类别限流
+        """
+        return await request(method, url, rate_key=owner_key(self.app_id, self.api_key), family="bitable", **kwargs)
+
     async def create_bitable(self, name, folder_token=""):
         url = f"{self.base_url}/bitable/v1/apps"
         headers = self._get_headers()
@@ -324,9 +456,7 @@ class FeishuBitableAPI:
             "name": name,
         }
         
-        async with aiohttp.ClientSession() as session:
-            async with session.post(url, headers=headers, data=json.dumps(payload)) as response:
-                return await response.json()
+        return await self._request("POST", url, headers=headers, data=json_codec.encode(payload))
 
     async def get_record_content(self, app_token, table_id, record_id):
         args = {
@@ -354,9 +484,8 @@ class FeishuBitableAPI:
         
         payload = args
         
-        async with aiohttp.ClientSession() as session:
-            async with session.post(url, headers=headers, data=json.dumps(payload)) as response:
-                return await response.json()    
+        # 查询接口虽然使用 POST，但不会修改数据，可以安全重试
+        return await self._request("POST", url, headers=headers, data=json_codec.encode(payload), idempotent=True)    
 
     async def create_record(self, app_token, table_id, fields: list):
         url = f"{self.base_url}/bitable/v1/apps/{app_token}/tables/{table_id}/records"
@@ -365,9 +494,7 @@ class FeishuBitableAPI:
             "fields": fields,
         }
         
-        async with aiohttp.ClientSession() as session:
-            async with session.post(url, headers=headers, data=json.dumps(payload)) as response:
-                return await response.json()
+        return await self._request("POST", url, headers=headers, data=json_codec.encode(payload))
 
     async def update_record(self, app_token, table_id, record_id, fields: list):
         url = f"{self.base_url}/bitable/v1/apps/{app_token}/tables/{table_id}/records/{record_id}"
@@ -376,17 +503,13 @@ class FeishuBitableAPI:
             "fields": fields,
         }
         
-        async with aiohttp.ClientSession() as session:
-            async with session.put(url, headers=headers, data=json.dumps(payload)) as response:
-                return await response.json()
+        return await self._request("PUT", url, headers=headers, data=json_codec.encode(payload))
 
     async def delete_record(self, app_token, table_id, record_id):
         url = f"{self.base_url}/bitable/v1/apps/{app_token}/tables/{table_id}/records/{record_id}"
         headers = self._get_headers()
         
-        async with aiohttp.ClientSession() as session:
-            async with session.delete(url, headers=headers) as response:
-                return await response.json()
+        return await self._request("DELETE", url, headers=headers)
 
     async def batch_create_records(self, app_token, table_id, records, user_id_type="open_id", client_token=None):
         """
@@ -414,10 +537,8 @@ class FeishuBitableAPI:
         if client_token:
             params["client_token"] = client_token
 
-        # 发送 POST 请求
-        async with aiohttp.ClientSession() as session:
-            async with session.post(url, headers=headers, params=params, data=json.dumps(payload)) as response:
-                return await response.json()
+        # 发送 POST 请求，携带 client_token 时失败可自动重试
+        return await self._request("POST", url, headers=headers, params=params, data=json_codec.encode(payload), idempotent=bool(client_token))
 
     async def batch_update_records(self, app_token, table_id, records, user_id_type="open_id"):
         """
@@ -443,9 +564,7 @@ class FeishuBitableAPI:
         }
 
         # 发送 POST 请求
-        async with aiohttp.ClientSession() as session:
-            async with session.post(url, headers=headers, params=params, data=json.dumps(payload)) as response:
-                return await response.json()
+        return await self._request("POST", url, headers=headers, params=params, data=json_codec.encode(payload))
 
     async def batch_get_records(self, app_token, table_id, record_ids, user_id_type="open_id", with_shared_url=False, automatic_fields=False):
         """
@@ -474,10 +593,8 @@ class FeishuBitableAPI:
             "user_id_type": user_id_type
         }
 
-        # 发送 POST 请求
-        async with aiohttp.ClientSession() as session:
-            async with session.post(url, headers=headers, params=params, data=json.dumps(payload)) as response:
-                return await response.json()
+        # 发送 POST 请求，批量获取不会修改数据，可以安全重试
+        return await self._request("POST", url, headers=headers, params=params, data=json_codec.encode(payload), idempotent=True)
 
     async def batch_delete_records(self, app_token, table_id, record_ids):
         """
@@ -497,9 +614,7 @@ class FeishuBitableAPI:
         }
 
         # 发送 POST 请求
-        async with aiohttp.ClientSession() as session:
-            async with session.post(url, headers=headers, data=json.dumps(payload)) as response:
-                return await response.json()
+        return await self._request("POST", url, headers=headers, data=json_codec.encode(payload))
 
 async def get_app_access_token(app_id, app_secret):
     url = f"https://open.feishu.cn/open-apis/auth/v3/app_access_token/internal"
@@ -510,12 +625,10 @@ async def get_app_access_token(app_id, app_secret):
         "app_id": app_id,
         "app_secret": app_secret,
     }
-    async with aiohttp.ClientSession() as session:
-        async with session.post(url, headers=headers, json=payload) as response:
-            response_data = await response.json()
-            return response_data.get("app_access_token")
+    response_data = await request("POST", url, headers=headers, json=payload, idempotent=True)
+    return response_data.get("app_access_token")
 
-async def get_tenant_access_token(app_id, app_secret):
+async def _fetch_tenant_access_token(app_id, app_secret):
     url = f"https://open.feishu.cn/open-apis/auth/v3/tenant_access_token/internal"
     headers = {
         "Content-Type": "application/json"
@@ -524,10 +637,17 @@ async def get_tenant_access_token(app_id, app_secret):
         "app_id": app_id,
         "app_secret": app_secret,
     }
-    async with aiohttp.ClientSession() as session:
-        async with session.post(url, headers=headers, json=payload) as response:
-            response_data = await response.json()
-            return response_data.get("tenant_access_token")
+    response_data = await request("POST", url, headers=headers, json=payload, idempotent=True)
+    return response_data.get("tenant_access_token"), response_data.get("expire")
+
+async def get_tenant_access_token(app_id, app_secret):
+    """
+    获取 tenant_access_token，按 app_id 缓存并在到期前自动刷新
+    :param app_id: 飞书应用的 APP ID
+    :param app_secret: 飞书应用的 APP Secret
+    :return: tenant_access_token，获取失败时返回 None
+    """
+    return await tenant_token_cache.aget(app_id, app_secret, _fetch_tenant_access_token)
 
 async def get_user_access_token(app_access_token, auth_code):
     url = f"https://open.feishu.cn/open-apis/authen/v1/oidc/access_token"
@@ -539,10 +659,8 @@ async def get_user_access_token(app_access_token, auth_code):
         "grant_type": "authorization_code",
         "code": auth_code
     } 
-    async with aiohttp.ClientSession() as session:
-        async with session.post(url, headers=headers, json=payload) as response:
-            response_data = await response.json()
-            return response_data
+    response_data = await request("POST", url, headers=headers, json=payload)
+    return response_data
 
 # 刷新飞书access_token
 async def refresh_feishu_access_token(access_token, refresh_token):
@@ -558,9 +676,7 @@ async def refresh_feishu_access_token(access_token, refresh_token):
         "refresh_token": refresh_token
     }
 
-    async with aiohttp.ClientSession() as session:
-        async with session.post(url, headers=headers, data=json.dumps(payload)) as response:
-            return await response.json()
+    return await request("POST", url, headers=headers, data=json_codec.encode(payload))
 
 def parse_text_to_feishu_json(text, is_first_line_heading=True, max_blocks_per_group=50):
     lines = text.strip().split('\n')
@@ -0,0 +1,215 @@
+# file name: feishu_http.py
+import os
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import ConnectTimeoutError
+
+from api.app.utils import json_codec
+from api.app.utils.feishu_rate_limiter import rate_limiter
+from api.app.utils.feishu_retry import retry_policy, retry_metrics
+
+
+class SessionPool:
+    """
+    进程级共享的 requests 连接池
+
+    所有同步飞书 API 类通过同一个 HTTPAdapter 发送请求，复用到 open.feishu.cn 的连接。
+    线程安全模式下每个线程持有独立的 Session，但共同挂载同一个 HTTPAdapter
+    （其底层 urllib3 连接池是线程安全的），因此线程池中的调用仍然可以复用连接。
+    """
+
+    def __init__(self, pool_connections=10, pool_maxsize=20, pool_block=False, timeout=30, thread_safe=True):
+        """
+        :param pool_connections: 缓存的主机连接池数量
+        :param pool_maxsize: 单个主机连接池中保留的最大连接数
+        :param pool_block: 连接池耗尽时是否阻塞等待可用连接
+        :param timeout: 单次请求的超时时间（秒）
+        :param thread_safe: 是否为每个线程创建独立的 Session
+        """
+        self.pool_connections = pool_connections
+        self.pool_maxsize = pool_maxsize
+        self.pool_block = pool_block
+        self.timeout = timeout
+        self.thread_safe = thread_safe
+        self._lock = threading.Lock()
+        self._adapter = None
+        self._session = None
+        self._local = threading.local()
+
+    @staticmethod
+    def config_from_env():
+        """
+        从环境变量读取连接池配置
+        :return: 配置字典
+        """
+        return {
+            "pool_connections": int(os.getenv('FEISHU_HTTP_POOL_CONNECTIONS', 10)),
+            "pool_maxsize": int(os.getenv('FEISHU_HTTP_POOL_MAXSIZE', 20)),
+            "timeout": float(os.getenv('FEISHU_HTTP_TIMEOUT', 30)),
+            "thread_safe": os.getenv('FEISHU_HTTP_THREAD_SAFE', 'true').lower() in ('1', 'true', 'yes'),
+        }
+
+    @classmethod
+    def from_env(cls):
+        """
+        根据环境变量创建连接池
+        """
+        return cls(**cls.config_from_env())
+
+    def configure(self, **kwargs):
+        """
+        更新连接池配置，已创建的连接会被关闭，之后的请求使用新配置
+        """
+        for key in kwargs:
+            if not hasattr(self, key) or key.startswith('_'):
+                raise ValueError(f"未知的连接池配置项: {key}")
+        self.close()
+        with self._lock:
+            for key, value in kwargs.items():
+                setattr(self, key, value)
+
+    def _get_adapter(self):
+        if self._adapter is None:
+            with self._lock:
+                if self._adapter is None:
+                    self._adapter = HTTPAdapter(
+                        pool_connections=self.pool_connections,
+                        pool_maxsize=self.pool_maxsize,
+                        pool_block=self.pool_block,
+                    )
+        return self._adapter
+
+    def _create_session(self):
+        adapter = self._get_adapter()
+        session = requests.Session()
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        return session
+
+    def get_session(self):
+        """
+        获取当前线程可用的 Session
+        """
+        if self.thread_safe:
+            session = getattr(self._local, 'session', None)
+            if session is None or session.adapters.get("https://") is not self._get_adapter():
+                session = self._create_session()
+                self._local.session = session
+            return session
+
+        if self._session is None:
+            with self._lock:
+                if self._session is None:
+                    self._session = self._create_session()
+        return self._session
+
+    def close(self):
+        """
+        关闭共享的连接池
+        """
+        with self._lock:
+            adapter, self._adapter = self._adapter, None
+            self._session = None
+            self._local = threading.local()
+        if adapter is not None:
+            adapter.close()
+
+
+session_pool = SessionPool.from_env()
+
+
+def init_session_pool(**kwargs):
+    """
+    在应用启动时按环境变量重新配置共享连接池
+    :param kwargs: 覆盖环境变量中的连接池配置
+    """
+    session_pool.configure(**{**SessionPool.config_from_env(), **kwargs})
+
+
+def close_session_pool():
+    """
+    在应用关闭时释放共享连接池
+    """
+    session_pool.close()
+
+
+def _decode(response):
+    try:
+        return json_codec.decode(response.content)
+    except ValueError:
+        return {"code": -1, "msg": f"HTTP {response.status_code}: {response.text[:200]}"}
+
+
+def _is_connect_error(error):
+    """
+    判断异常是否发生在建立连接阶段（连接超时、连接被拒绝、DNS 解析失败等），此时请求一定没有发出
+    """
+    if isinstance(error, requests.exceptions.ConnectTimeout):
+        return True
+    if not isinstance(error, requests.exceptions.ConnectionError) or isinstance(error, requests.exceptions.ReadTimeout):
+        return False
+    # requests 把 urllib3 的异常包装在 MaxRetryError.reason 中；NewConnectionError 是 ConnectTimeoutError 的子类
+    cause = error.args[0] if error.args else None
+    seen = set()
+    while cause is not None and id(cause) not in seen:
+        seen.add(id(cause))
+        if isinstance(cause, ConnectTimeoutError):
+            return True
+        cause = getattr(cause, "reason", None) or cause.__cause__ or cause.__context__
+    return False
+
+
+def request(method, url, headers=None, params=None, data=None, json=None, rate_key=None, family=None, idempotent=None):
+    """
+    通过共享连接池发送请求，并返回解析后的 JSON 响应
+
+    遇到 429、5xx 或飞书限流错误码时按 retry_policy 退避重试；
+    写请求只有在携带幂等的 client_token（idempotent=True）时才会重试。
+    :param method: HTTP 方法
+    :param url: 请求地址
+    :param headers: 请求头
+    :param params: 查询参数
+    :param data: 请求体（已编码）
+    :param json: 请求体（由 json_codec 编码）
+    :param rate_key: 限流键（通常为 app_id）
+    :param family: 接口类别，用于选择限流额度，为 None 时不限流
+    :param idempotent: 请求是否可以安全重试，默认仅 GET 请求可以重试
+    :return: 响应的 JSON 数据
+    """
+    if idempotent is None:
+        idempotent = method == "GET"
+    if json is not None:
+        data = json_codec.encode(json)
+    attempt = 0
+    while True:
+        rate_limiter.acquire(rate_key, family)
+        session = session_pool.get_session()
+        response_headers = None
+        try:
+            response = session.request(method, url, headers=headers, params=params, data=data, timeout=session_pool.timeout)
+            response_headers = response.headers
+            body = _decode(response)
+            reason = retry_policy.retry_reason(response.status_code, body)
+            error = None
+        except requests.RequestException as e:
+            if _is_connect_error(e):
+                # 连接未建立，请求没有发出，写请求也可以安全重试
+                reason, error = "connect_error", e
+            elif not idempotent:
+                raise
+            else:
+                reason, error = "network_error", e
+
+        if reason is None:
+            return body
+        if (not idempotent and error is None) or attempt + 1 >= retry_policy.max_attempts:
+            retry_metrics.record_exhausted(family, reason)
+            if error is not None:
+                raise error
+            return body
+        retry_metrics.record_retry(family, reason)
+        time.sleep(retry_policy.compute_delay(attempt, response_headers))
+        attempt += 1
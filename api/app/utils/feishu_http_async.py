@@ -0,0 +1,185 @@
+# file name: feishu_http_async.py
+import asyncio
+import os
+
+import aiohttp
+
+from api.app.utils import json_codec
+from api.app.utils.feishu_rate_limiter import rate_limiter
+from api.app.utils.feishu_retry import retry_policy, retry_metrics
+
+
+class AsyncSessionPool:
+    """
+    进程级共享的 aiohttp 连接池
+
+    所有异步飞书 API 类通过同一个 ClientSession 发送请求，复用到 open.feishu.cn 的
+    TCP/TLS 连接，避免每次调用都重新握手。
+    """
+
+    def __init__(self, limit=100, limit_per_host=30, keepalive_timeout=30, ttl_dns_cache=300, total_timeout=30):
+        """
+        :param limit: 连接池的总连接数上限
+        :param limit_per_host: 单个主机的连接数上限
+        :param keepalive_timeout: 空闲连接保持时间（秒）
+        :param ttl_dns_cache: DNS 缓存时间（秒）
+        :param total_timeout: 单次请求的总超时时间（秒）
+        """
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.keepalive_timeout = keepalive_timeout
+        self.ttl_dns_cache = ttl_dns_cache
+        self.total_timeout = total_timeout
+        self._session = None
+        self._loop = None
+
+    @staticmethod
+    def config_from_env():
+        """
+        从环境变量读取连接池配置
+        :return: 配置字典
+        """
+        return {
+            "limit": int(os.getenv('FEISHU_HTTP_LIMIT', 100)),
+            "limit_per_host": int(os.getenv('FEISHU_HTTP_LIMIT_PER_HOST', 30)),
+            "keepalive_timeout": float(os.getenv('FEISHU_HTTP_KEEPALIVE_TIMEOUT', 30)),
+            "ttl_dns_cache": int(os.getenv('FEISHU_HTTP_DNS_TTL', 300)),
+            "total_timeout": float(os.getenv('FEISHU_HTTP_TIMEOUT', 30)),
+        }
+
+    @classmethod
+    def from_env(cls):
+        """
+        根据环境变量创建连接池
+        """
+        return cls(**cls.config_from_env())
+
+    def configure(self, **kwargs):
+        """
+        更新连接池配置，仅对之后新建的 session 生效
+        """
+        for key, value in kwargs.items():
+            if not hasattr(self, key) or key.startswith('_'):
+                raise ValueError(f"未知的连接池配置项: {key}")
+            setattr(self, key, value)
+
+    def _create_session(self):
+        connector = aiohttp.TCPConnector(
+            limit=self.limit,
+            limit_per_host=self.limit_per_host,
+            keepalive_timeout=self.keepalive_timeout,
+            ttl_dns_cache=self.ttl_dns_cache,
+            use_dns_cache=True,
+        )
+        timeout = aiohttp.ClientTimeout(total=self.total_timeout)
+        return aiohttp.ClientSession(connector=connector, timeout=timeout)
+
+    async def start(self):
+        """
+        创建共享的 session（已存在时直接返回）
+        """
+        return self.get_session()
+
+    def get_session(self):
+        """
+        获取共享的 session
+
+        未在 lifespan 中初始化时（例如脚本直接调用）会按需创建；
+        session 绑定事件循环，循环变化时会重新创建。
+        """
+        loop = asyncio.get_running_loop()
+        if self._session is None or self._session.closed or self._loop is not loop:
+            self._session = self._create_session()
+            self._loop = loop
+        return self._session
+
+    async def close(self):
+        """
+        关闭共享的 session 并释放所有连接
+        """
+        session, self._session, self._loop = self._session, None, None
+        if session is not None and not session.closed:
+            await session.close()
+            # 给 SSL 连接留出完成关闭握手的时间
+            await asyncio.sleep(0.25)
+
+
+session_pool = AsyncSessionPool.from_env()
+
+
+async def init_session_pool(**kwargs):
+    """
+    在应用启动时初始化共享连接池
+    :param kwargs: 覆盖环境变量中的连接池配置
+    """
+    # 启动时重新读取环境变量，确保 .env 中的配置生效
+    session_pool.configure(**{**AsyncSessionPool.config_from_env(), **kwargs})
+    await session_pool.start()
+
+
+async def close_session_pool():
+    """
+    在应用关闭时释放共享连接池
+    """
+    await session_pool.close()
+
+
+async def _decode(response):
+    raw = await response.read()
+    try:
+        return json_codec.decode(raw)
+    except ValueError:
+        text = raw[:200].decode("utf-8", errors="replace")
+        return {"code": -1, "msg": f"HTTP {response.status}: {text}"}
+
+
+async def request(method, url, headers=None, params=None, data=None, json=None, rate_key=None, family=None, idempotent=None):
+    """
+    通过共享连接池发送请求，并返回解析后的 JSON 响应
+
+    遇到 429、5xx 或飞书限流错误码时按 retry_policy 退避重试；
+    写请求只有在携带幂等的 client_token（idempotent=True）时才会重试。
+    :param method: HTTP 方法
+    :param url: 请求地址
+    :param headers: 请求头
+    :param params: 查询参数
+    :param data: 请求体（已编码）
+    :param json: 请求体（由 json_codec 编码）
+    :param rate_key: 限流键（通常为 app_id）
+    :param family: 接口类别，用于选择限流额度，为 None 时不限流
+    :param idempotent: 请求是否可以安全重试，默认仅 GET 请求可以重试
+    :return: 响应的 JSON 数据
+    """
+    if idempotent is None:
+        idempotent = method == "GET"
+    if json is not None:
+        data = json_codec.encode(json)
+    attempt = 0
+    while True:
+        await rate_limiter.acquire_async(rate_key, family)
+        session = session_pool.get_session()
+        response_headers = None
+        try:
+            async with session.request(method, url, headers=headers, params=params, data=data) as response:
+                response_headers = response.headers
+                body = await _decode(response)
+            reason = retry_policy.retry_reason(response.status, body)
+            error = None
+        except aiohttp.ClientConnectorError as e:
+            # 连接未建立，请求没有发出，写请求也可以安全重试
+            reason, error = "connect_error", e
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            if not idempotent:
+                raise
+            reason, error = "network_error", e
+
+        if reason is None:
+            return body
+        if (not idempotent and error is None) or attempt + 1 >= retry_policy.max_attempts:
+            retry_metrics.record_exhausted(family, reason)
+            if error is not None:
+                raise error
+            return body
+        retry_metrics.record_retry(family, reason)
+        await asyncio.sleep(retry_policy.compute_delay(attempt, response_headers))
+        attempt += 1
@@ -0,0 +1,150 @@
+# file name: feishu_rate_limiter.py
+import asyncio
+import contextvars
+import os
+import threading
+import time
+
+# 飞书开放平台文档中各类接口的频率限制（次/秒，按应用计算）
+DEFAULT_QPS = {
+    "docx_write": 3,   # 创建块、创建嵌套块、更新块、批量更新块、删除块
+    "docx_read": 5,    # 获取文档信息、获取文档所有块、获取块及子块
+    "bitable": 10,     # 多维表格记录的增删改查
+    "drive": 5,        # 云空间文件清单、新建文件夹
+    "wiki": 10,        # 知识空间、节点相关接口
+}
+
+# 当前请求是否属于交互式通道（由 AdmissionController.interactive 设置），交互式请求使用预留的额度
+interactive_lane = contextvars.ContextVar("feishu_interactive_lane", default=False)
+
+
+class TokenBucket:
+    """
+    令牌桶
+
+    使用“预约”的方式扣减令牌：令牌不足时允许余额为负，调用方按返回的等待时间休眠，
+    因此同一个桶的同步与异步调用方共享额度，并按到达顺序依次放行。
+    """
+
+    def __init__(self, rate, capacity=None):
+        """
+        :param rate: 每秒补充的令牌数
+        :param capacity: 桶容量（允许的突发请求数），默认与 rate 相同
+        """
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else max(rate, 1))
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, tokens=1):
+        """
+        预约令牌
+        :param tokens: 需要的令牌数
+        :return: 需要等待的秒数，0 表示可以立即执行
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= tokens
+            if self._tokens >= 0:
+                return 0.0
+            return -self._tokens / self.rate
+
+    def try_take(self, tokens=1):
+        """
+        令牌足够时立即扣减，不足时不预约
+        :return: 是否取得令牌
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            if self._tokens < tokens:
+                return False
+            self._tokens -= tokens
+            return True
+
+
+class RateLimiter:
+    """
+    客户端限流器，按 (app_id, 接口类别) 维护令牌桶
+
+    每个 (app_id, 接口类别) 的额度分成两个桶：交互式请求预留 interactive_share 的额度，其余归批量请求。
+    批量请求再多也只会在自己的桶里排队；交互式请求先用预留的额度，用完时借用批量桶中当前空闲的令牌，
+    两者都没有时才等待预留额度恢复，不会排在批量请求之后。两个桶的速率之和等于该类接口的频率限制。
+    """
+
+    def __init__(self, limits=None, interactive_share=None):
+        """
+        :param limits: 覆盖默认频率的字典，如 {"docx_write": 2}。
+                       未覆盖的类别读取环境变量 FEISHU_QPS_<类别>，再回退到 DEFAULT_QPS
+        :param interactive_share: 为交互式请求预留的额度比例（0~1），默认读取环境变量 FEISHU_INTERACTIVE_QPS_SHARE，
+                       再回退到 0.2；为 0 时不预留，两类请求共用一个桶
+        """
+        self.limits = dict(limits or {})
+        if interactive_share is None:
+            interactive_share = float(os.getenv('FEISHU_INTERACTIVE_QPS_SHARE', 0.2))
+        self.interactive_share = min(max(interactive_share, 0.0), 1.0)
+        self._lock = threading.Lock()
+        self._buckets = {}
+
+    def _qps_for(self, family):
+        if family in self.limits:
+            return self.limits[family]
+        env_value = os.getenv(f'FEISHU_QPS_{family.upper()}')
+        if env_value:
+            return float(env_value)
+        return DEFAULT_QPS.get(family)
+
+    def buckets(self, key, family):
+        """
+        获取（或创建）某个应用某类接口的令牌桶
+        :return: (批量请求的 TokenBucket, 交互式请求的 TokenBucket)，不预留额度时后者为 None；
+                 该类别不限流时返回 None
+        """
+        bucket_key = (key, family)
+        buckets = self._buckets.get(bucket_key)
+        if buckets is None:
+            qps = self._qps_for(family)
+            if not qps:
+                return None
+            reserved = qps * self.interactive_share
+            if reserved and reserved < qps:
+                new_buckets = (TokenBucket(qps - reserved), TokenBucket(reserved, capacity=1))
+            else:
+                new_buckets = (TokenBucket(qps), None)
+            with self._lock:
+                buckets = self._buckets.setdefault(bucket_key, new_buckets)
+        return buckets
+
+    def _reserve(self, key, family):
+        buckets = self.buckets(key, family) if family else None
+        if buckets is None:
+            return 0.0
+        bulk, interactive = buckets
+        if interactive is None or not interactive_lane.get():
+            return bulk.reserve()
+        if interactive.try_take() or bulk.try_take():
+            return 0.0
+        return interactive.reserve()
+
+    def acquire(self, key, family):
+        """
+        同步获取一次调用额度，额度不足时阻塞等待
+        """
+        delay = self._reserve(key, family)
+        if delay > 0:
+            time.sleep(delay)
+
+    async def acquire_async(self, key, family):
+        """
+        异步获取一次调用额度，额度不足时让出事件循环等待
+        """
+        delay = self._reserve(key, family)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+rate_limiter = RateLimiter()
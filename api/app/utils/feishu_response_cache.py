@@ -0,0 +1,261 @@
+# file name: feishu_response_cache.py
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from api.app.utils import json_codec
+from api.app.utils.data_dir import data_path, ensure_parent_dir
+
+# 各类只读元数据接口的默认缓存时间（秒）
+DEFAULT_TTLS = {
+    "wiki.space_info": 600,
+    "wiki.node_info": 300,
+    "docx.document_info": 30,
+    "drive.folder_files": 60,
+}
+
+
+def owner_key(app_id, token):
+    """
+    限流和响应缓存中区分调用方的键
+    :param app_id: 飞书应用的 APP ID
+    :param token: 调用接口使用的 access token
+    :return: app_id；没有 app_id 时为 token 的摘要，避免 token 明文写入缓存数据库
+    """
+    if app_id:
+        return app_id
+    return "token:" + hashlib.sha256((token or "").encode("utf-8")).hexdigest()
+
+
+class MemoryCacheBackend:
+    """
+    进程内缓存后端，超出容量时按 LRU 淘汰
+    """
+
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def get(self, key):
+        """
+        :return: (value, expires_at)，不存在时返回 None
+        """
+        with self._lock:
+            item = self._entries.get(key)
+            if item is not None:
+                self._entries.move_to_end(key)
+            return item
+
+    def set(self, key, value, expires_at):
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def delete_prefix(self, prefix):
+        with self._lock:
+            for key in [k for k in self._entries if k.startswith(prefix)]:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class SQLiteCacheBackend:
+    """
+    基于 SQLite 的磁盘缓存后端，服务重启后缓存仍然有效，超出容量时按最近访问时间淘汰
+    """
+
+    def __init__(self, path, max_entries=10000):
+        """
+        :param path: 数据库文件路径，第一次读写缓存时打开
+        """
+        self.path = path
+        self.max_entries = max_entries
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._conn = None
+
+    def _db(self):
+        """
+        :return: 数据库连接，第一次调用时打开并建表；调用方需持有 _lock
+        """
+        if self._conn is not None:
+            return self._conn
+        ensure_parent_dir(self.path)
+        is_new = self.path != ":memory:" and not os.path.exists(self.path)
+        conn = sqlite3.connect(self.path, check_same_thread=False)
+        if is_new:
+            os.chmod(self.path, 0o600)
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS response_cache ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_response_cache_accessed ON response_cache (accessed_at)")
+        conn.commit()
+        self._conn = conn
+        return conn
+
+    def get(self, key):
+        with self._lock:
+            conn = self._db()
+            row = conn.execute(
+                "SELECT value, expires_at FROM response_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            conn.execute("UPDATE response_cache SET accessed_at = ? WHERE key = ?", (time.time(), key))
+            conn.commit()
+        return json_codec.decode(row[0]), row[1]
+
+    def set(self, key, value, expires_at):
+        encoded = json_codec.dumps(value)
+        with self._lock:
+            conn = self._db()
+            conn.execute(
+                "INSERT OR REPLACE INTO response_cache (key, value, expires_at, accessed_at) VALUES (?, ?, ?, ?)",
+                (key, encoded, expires_at, time.time()),
+            )
+            overflow = conn.execute("SELECT COUNT(*) FROM response_cache").fetchone()[0] - self.max_entries
+            if overflow > 0:
+                conn.execute(
+                    "DELETE FROM response_cache WHERE key IN "
+                    "(SELECT key FROM response_cache ORDER BY accessed_at LIMIT ?)",
+                    (overflow,),
+                )
+                self.evictions += overflow
+            conn.commit()
+
+    def delete(self, key):
+        with self._lock:
+            conn = self._db()
+            conn.execute("DELETE FROM response_cache WHERE key = ?", (key,))
+            conn.commit()
+
+    def delete_prefix(self, prefix):
+        escaped = prefix.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        with self._lock:
+            conn = self._db()
+            conn.execute("DELETE FROM response_cache WHERE key LIKE ? ESCAPE '\\'", (escaped + "%",))
+            conn.commit()
+
+    def clear(self):
+        with self._lock:
+            conn = self._db()
+            conn.execute("DELETE FROM response_cache")
+            conn.commit()
+
+    def __len__(self):
+        with self._lock:
+            return self._db().execute("SELECT COUNT(*) FROM response_cache").fetchone()[0]
+
+
+class ResponseCache:
+    """
+    飞书只读接口的响应缓存
+
+    按接口命名空间（如 "wiki.space_info"）设置 TTL，只缓存 code 为 0 的成功响应；
+    写接口调用后通过 invalidate 使相关缓存失效。
+    """
+
+    def __init__(self, backend=None, ttls=None):
+        """
+        :param backend: 缓存后端，默认为 MemoryCacheBackend
+        :param ttls: 覆盖默认 TTL 的字典，TTL 为 0 表示不缓存该命名空间
+        """
+        self.backend = backend if backend is not None else MemoryCacheBackend()
+        self.ttls = {**DEFAULT_TTLS, **(ttls or {})}
+        self._lock = threading.Lock()
+        self.hits = {}
+        self.misses = {}
+
+    @classmethod
+    def from_env(cls):
+        """
+        根据环境变量创建缓存
+        FEISHU_CACHE_BACKEND: memory（默认）或 sqlite
+        FEISHU_CACHE_PATH: sqlite 后端的文件路径，默认为 $FEISHU_DATA_DIR/feishu_cache.sqlite3
+        FEISHU_CACHE_MAX_ENTRIES: 最大缓存条目数
+        """
+        max_entries = int(os.getenv('FEISHU_CACHE_MAX_ENTRIES', 1024))
+        if os.getenv('FEISHU_CACHE_BACKEND', 'memory').lower() == 'sqlite':
+            backend = SQLiteCacheBackend(data_path('feishu_cache.sqlite3', 'FEISHU_CACHE_PATH'), max_entries)
+        else:
+            backend = MemoryCacheBackend(max_entries)
+        return cls(backend)
+
+    @staticmethod
+    def make_key(namespace, *parts):
+        """
+        生成缓存键，各部分以 "|" 连接，便于按前缀失效
+        """
+        return "|".join([namespace, *[str(part) for part in parts]])
+
+    def _count(self, counter, namespace):
+        with self._lock:
+            counter[namespace] = counter.get(namespace, 0) + 1
+
+    def get(self, namespace, *parts):
+        """
+        读取缓存
+        :return: 缓存的响应，不存在或已过期时返回 None
+        """
+        if not self.ttls.get(namespace):
+            return None
+        key = self.make_key(namespace, *parts)
+        item = self.backend.get(key)
+        if item is not None:
+            value, expires_at = item
+            if time.time() < expires_at:
+                self._count(self.hits, namespace)
+                return value
+            self.backend.delete(key)
+        self._count(self.misses, namespace)
+        return None
+
+    def set(self, namespace, *parts, value):
+        """
+        写入缓存，仅缓存成功的响应
+        """
+        ttl = self.ttls.get(namespace)
+        if not ttl or not isinstance(value, dict) or value.get('code') != 0:
+            return
+        self.backend.set(self.make_key(namespace, *parts), value, time.time() + ttl)
+
+    def invalidate(self, namespace, *parts):
+        """
+        使缓存失效，parts 为键的前缀部分，省略时使整个命名空间失效
+        """
+        prefix = self.make_key(namespace, *parts)
+        self.backend.delete(prefix)
+        self.backend.delete_prefix(prefix + "|")
+
+    def stats(self):
+        """
+        :return: 命中、未命中、淘汰次数及当前条目数
+        """
+        with self._lock:
+            return {
+                "hits": dict(self.hits),
+                "misses": dict(self.misses),
+                "evictions": self.backend.evictions,
+                "entries": len(self.backend),
+            }
+
+
+response_cache = ResponseCache.from_env()
@@ -0,0 +1,110 @@
+# file name: feishu_retry.py
+import os
+import random
+import threading
+from collections import Counter
+
+# 需要重试的 HTTP 状态码
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+# 需要重试的飞书业务错误码
+RETRYABLE_CODES = {
+    99991400,  # 应用请求频率超限
+    1254290,   # 多维表格请求过于频繁
+    1254291,   # 多维表格写冲突
+}
+
+
+class RetryPolicy:
+    """
+    飞书接口的重试策略：指数退避 + 全抖动，并优先遵循 x-ogw-ratelimit-reset 响应头
+    """
+
+    def __init__(self, max_attempts=4, base_delay=0.5, max_delay=10, max_reset_wait=60):
+        """
+        :param max_attempts: 最多尝试次数（包含首次请求）
+        :param base_delay: 退避的基础时间（秒）
+        :param max_delay: 单次退避的最大时间（秒）
+        :param max_reset_wait: 遵循限流重置头时最多等待的时间（秒）
+        """
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_reset_wait = max_reset_wait
+
+    @classmethod
+    def from_env(cls):
+        """
+        根据环境变量创建重试策略
+        """
+        return cls(
+            max_attempts=int(os.getenv('FEISHU_RETRY_MAX_ATTEMPTS', 4)),
+            base_delay=float(os.getenv('FEISHU_RETRY_BASE_DELAY', 0.5)),
+            max_delay=float(os.getenv('FEISHU_RETRY_MAX_DELAY', 10)),
+        )
+
+    @staticmethod
+    def retry_reason(status, body):
+        """
+        判断一次响应是否需要重试
+        :param status: HTTP 状态码
+        :param body: 解析后的响应体
+        :return: 重试原因字符串，不需要重试时返回 None
+        """
+        code = body.get('code') if isinstance(body, dict) else None
+        if code in RETRYABLE_CODES:
+            return f"code_{code}"
+        if status in RETRYABLE_STATUS:
+            return f"http_{status}"
+        return None
+
+    def compute_delay(self, attempt, headers=None):
+        """
+        计算第 attempt 次重试前的等待时间
+        :param attempt: 已失败的次数，从 0 开始
+        :param headers: 响应头，包含 x-ogw-ratelimit-reset 时按其等待
+        :return: 等待秒数
+        """
+        reset = (headers or {}).get('x-ogw-ratelimit-reset')
+        if reset is not None:
+            try:
+                return min(float(reset), self.max_reset_wait) + random.uniform(0, self.base_delay)
+            except ValueError:
+                pass
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+
+class RetryMetrics:
+    """
+    重试相关的计数器，按接口类别和原因统计
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._retries = Counter()
+        self._exhausted = Counter()
+
+    def record_retry(self, family, reason):
+        with self._lock:
+            self._retries[(family or "default", reason)] += 1
+
+    def record_exhausted(self, family, reason):
+        with self._lock:
+            self._exhausted[(family or "default", reason)] += 1
+
+    def snapshot(self):
+        """
+        :return: {"retries": {类别: {原因: 次数}}, "exhausted": {...}}
+        """
+        def group(counter):
+            result = {}
+            for (family, reason), count in counter.items():
+                result.setdefault(family, {})[reason] = count
+            return result
+
+        with self._lock:
+            return {"retries": group(self._retries), "exhausted": group(self._exhausted)}
+
+
+retry_policy = RetryPolicy.from_env()
+retry_metrics = RetryMetrics()
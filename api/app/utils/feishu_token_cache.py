@@ -0,0 +1,122 @@
+# file name: feishu_token_cache.py
+import hashlib
+import threading
+import time
+
+from api.app.utils.singleflight import SingleFlight, AsyncSingleFlight
+
+
+class _TokenEntry:
+    __slots__ = ("token", "secret_digest", "refresh_at", "expires_at")
+
+    def __init__(self, token, secret_digest, refresh_at, expires_at):
+        self.token = token
+        self.secret_digest = secret_digest
+        self.refresh_at = refresh_at
+        self.expires_at = expires_at
+
+
+class TenantTokenCache:
+    """
+    按 app_id 缓存 tenant_access_token
+
+    - 根据鉴权接口返回的 expire 字段计算有效期；
+    - 在到期前 refresh_margin 秒开始提前刷新，刷新期间仍返回当前有效的 token；
+    - 同一 app_id 的并发刷新合并为一次请求；
+    - 同步与异步客户端共享同一份缓存。
+    """
+
+    def __init__(self, refresh_margin=1800, expiry_skew=60):
+        """
+        :param refresh_margin: 到期前多少秒开始刷新。飞书仅在 token 剩余有效期不足 30 分钟时
+                               才会签发新 token，因此默认提前 30 分钟刷新
+        :param expiry_skew: 为网络延迟预留的时间，剩余有效期小于该值的 token 视为已过期
+        """
+        self.refresh_margin = refresh_margin
+        self.expiry_skew = expiry_skew
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._flight = SingleFlight()
+        self._async_flight = AsyncSingleFlight()
+
+    @staticmethod
+    def _digest(app_secret):
+        return hashlib.sha256((app_secret or "").encode("utf-8")).hexdigest()
+
+    def _lookup(self, app_id, app_secret):
+        """
+        :return: (entry, now)，secret 不匹配或已过期时 entry 为 None
+        """
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(app_id)
+        if entry is None or entry.secret_digest != self._digest(app_secret):
+            return None, now
+        if now >= entry.expires_at:
+            return None, now
+        return entry, now
+
+    def store(self, app_id, app_secret, token, expire):
+        """
+        写入缓存
+        :param token: tenant_access_token
+        :param expire: 剩余有效期（秒），即鉴权接口返回的 expire 字段
+        """
+        now = time.monotonic()
+        lead = min(self.refresh_margin, expire / 2)
+        entry = _TokenEntry(
+            token=token,
+            secret_digest=self._digest(app_secret),
+            refresh_at=now + expire - lead,
+            expires_at=now + expire - min(self.expiry_skew, expire / 2),
+        )
+        with self._lock:
+            self._entries[app_id] = entry
+
+    def invalidate(self, app_id):
+        """
+        使某个 app_id 的缓存失效，例如接口返回 token 无效时
+        """
+        with self._lock:
+            self._entries.pop(app_id, None)
+
+    def _refresh(self, app_id, app_secret, fetch):
+        token, expire = fetch(app_id, app_secret)
+        if token and expire:
+            self.store(app_id, app_secret, token, expire)
+        return token
+
+    async def _async_refresh(self, app_id, app_secret, fetch):
+        token, expire = await fetch(app_id, app_secret)
+        if token and expire:
+            self.store(app_id, app_secret, token, expire)
+        return token
+
+    def get(self, app_id, app_secret, fetch):
+        """
+        获取 token（同步）
+        :param fetch: fetch(app_id, app_secret) -> (token, expire)，实际请求鉴权接口
+        :return: tenant_access_token，获取失败时返回 None
+        """
+        entry, now = self._lookup(app_id, app_secret)
+        if entry is not None:
+            if now < entry.refresh_at or self._flight.in_flight(app_id):
+                return entry.token
+        return self._flight.do(app_id, self._refresh, app_id, app_secret, fetch)
+
+    async def aget(self, app_id, app_secret, fetch):
+        """
+        获取 token（异步）
+        :param fetch: 异步函数 fetch(app_id, app_secret) -> (token, expire)
+        :return: tenant_access_token，获取失败时返回 None
+        """
+        entry, now = self._lookup(app_id, app_secret)
+        if entry is not None:
+            if now >= entry.refresh_at:
+                # 提前在后台刷新，本次调用仍使用当前有效的 token
+                self._async_flight.start(app_id, self._async_refresh, app_id, app_secret, fetch)
+            return entry.token
+        return await self._async_flight.do(app_id, self._async_refresh, app_id, app_secret, fetch)
+
+
+tenant_token_cache = TenantTokenCache()
@@ -0,0 +1,571 @@
+# file name: job_queue.py
+import asyncio
+import concurrent.futures
+import os
+import random
+import sqlite3
+import threading
+import time
+import traceback
+import uuid
+
+from api.app.utils import json_codec
+from api.app.utils.data_dir import data_path, ensure_parent_dir
+from api.app.utils.write_scheduler import write_scheduler
+
+# 任务状态
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+
+# 任务结束时的状态，事件流在收到这两种事件后结束
+FINAL_STATUSES = (SUCCEEDED, FAILED)
+
+# 任务开始写入文档前报告的事件；之后任务失败或被中断时不再重新执行，避免重复写入已经写入的部分
+WRITING = "writing"
+
+# 不保存到数据库的任务参数（明文的应用凭证），执行时根据随任务保存的凭证引用取回（见 CredentialStore）
+SECRET_FIELDS = ("feishu_app_secret",)
+
+PARTIAL_WRITE_ERROR = "任务已写入部分内容，为避免重复写入不再自动重试，请检查文档后重新提交"
+
+
+class JobAborted(Exception):
+    """
+    任务无法继续执行且重试也不会成功（如缺少凭证），抛出后任务直接标记为失败
+    """
+
+
+class JobEventHub:
+    """
+    任务事件的内存订阅中心：每个订阅者持有一个 asyncio.Queue，收到所订阅任务的新事件
+    """
+
+    def __init__(self):
+        self._subscribers = {}
+
+    def subscribe(self, job_id):
+        """
+        :return: 接收该任务后续事件的 asyncio.Queue
+        """
+        queue = asyncio.Queue()
+        self._subscribers.setdefault(job_id, set()).add(queue)
+        return queue
+
+    def unsubscribe(self, job_id, queue):
+        subscribers = self._subscribers.get(job_id)
+        if subscribers is not None:
+            subscribers.discard(queue)
+            if not subscribers:
+                del self._subscribers[job_id]
+
+    def publish(self, event):
+        for queue in self._subscribers.get(event["job_id"], ()):
+            queue.put_nowait(event)
+
+    def subscriber_count(self):
+        return sum(len(subscribers) for subscribers in self._subscribers.values())
+
+
+class JobQueue:
+    """
+    基于 SQLite 的持久化任务队列，进程重启后未完成的任务仍然会被执行
+
+    任务的 payload 保存在本地数据库中，其中的应用凭证（SECRET_FIELDS）在写入前去掉；数据库文件只允许当前用户读写。
+    任务的状态变化和执行进度作为事件保存在 job_events 表中，并通过 JobEventHub 推送给订阅者；
+    任务执行中报告的进度事件由单独的线程按顺序写入，不阻塞事件循环（见 reporter）。
+    结束超过 retention 秒的任务及其事件由 purge 删除。
+
+    数据库在第一次使用时才打开，导入模块不会创建文件。
+    """
+
+    def __init__(self, path, retry_base_delay=5, retry_max_delay=300, max_running_per_app=None, retention=7 * 86400):
+        """
+        :param path: 数据库文件路径
+        :param retry_base_delay: 失败后重新执行前等待的基础时间（秒），按尝试次数指数增长
+        :param retry_max_delay: 失败后等待的最长时间（秒）
+        :param max_running_per_app: 单个应用同时执行的任务数上限，为 None 时不限制
+        :param retention: 已结束的任务保留的时间（秒），为 0 时不清理
+        """
+        self.path = path
+        self.retry_base_delay = retry_base_delay
+        self.retry_max_delay = retry_max_delay
+        self.max_running_per_app = max_running_per_app
+        self.retention = retention
+        self.handlers = {}
+        self.events_hub = JobEventHub()
+        self._lock = threading.Lock()
+        self._conn = None
+        self._event_writer = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="job-events")
+
+    def _db(self):
+        """
+        :return: 数据库连接，第一次调用时打开并建表；调用方需持有 _lock
+        """
+        if self._conn is not None:
+            return self._conn
+        ensure_parent_dir(self.path)
+        is_new = self.path != ":memory:" and not os.path.exists(self.path)
+        conn = sqlite3.connect(self.path, check_same_thread=False)
+        if is_new:
+            os.chmod(self.path, 0o600)
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "id TEXT PRIMARY KEY, kind TEXT NOT NULL, payload TEXT NOT NULL, status TEXT NOT NULL, "
+            "attempts INTEGER NOT NULL DEFAULT 0, max_attempts INTEGER NOT NULL, "
+            "app_id TEXT, document_id TEXT, last_error TEXT, result TEXT, "
+            "created_at REAL NOT NULL, updated_at REAL NOT NULL, available_at REAL NOT NULL, "
+            "writes_started INTEGER NOT NULL DEFAULT 0)"
+        )
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(jobs)")}
+        if "writes_started" not in columns:
+            conn.execute("ALTER TABLE jobs ADD COLUMN writes_started INTEGER NOT NULL DEFAULT 0")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status_available ON jobs (status, available_at)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_app_status ON jobs (app_id, status)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status_updated ON jobs (status, updated_at)")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS job_events ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, job_id TEXT NOT NULL, type TEXT NOT NULL, "
+            "data TEXT NOT NULL, created_at REAL NOT NULL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_job_events_job ON job_events (job_id, id)")
+        # 早期版本把应用凭证保存在 payload 中，打开旧数据库时清除
+        for job_id, payload in conn.execute(
+            "SELECT id, payload FROM jobs WHERE " + " OR ".join("payload LIKE ?" for _ in SECRET_FIELDS),
+            [f'%"{field}"%' for field in SECRET_FIELDS],
+        ).fetchall():
+            conn.execute("UPDATE jobs SET payload = ? WHERE id = ?", (json_codec.dumps(self._strip_secrets(json_codec.loads(payload))), job_id))
+        conn.commit()
+        self._conn = conn
+        return conn
+
+    @classmethod
+    def from_env(cls):
+        """
+        根据环境变量创建任务队列
+        FEISHU_JOB_DB_PATH: 数据库文件路径，默认为 FEISHU_DATA_DIR 目录下的 feishu_jobs.sqlite3
+        FEISHU_JOB_MAX_RUNNING_PER_APP: 单个应用同时执行的任务数上限
+        FEISHU_JOB_RETENTION: 已结束的任务保留的时间（秒）
+        """
+        return cls(
+            data_path('feishu_jobs.sqlite3', 'FEISHU_JOB_DB_PATH'),
+            max_running_per_app=int(os.getenv('FEISHU_JOB_MAX_RUNNING_PER_APP', 4)),
+            retention=float(os.getenv('FEISHU_JOB_RETENTION', 7 * 86400))
+        )
+
+    def register(self, kind, handler):
+        """
+        注册任务处理函数
+        :param kind: 任务类型
+        :param handler: 异步函数，参数为 (payload, job, report)，返回值作为任务结果保存；
+            report(event_type, data) 用于记录执行进度
+        """
+        self.handlers[kind] = handler
+
+    @staticmethod
+    def _row_to_job(row):
+        if row is None:
+            return None
+        keys = ("id", "kind", "payload", "status", "attempts", "max_attempts", "app_id", "document_id",
+                "last_error", "result", "created_at", "updated_at", "available_at", "writes_started")
+        job = dict(zip(keys, row))
+        job["payload"] = json_codec.loads(job["payload"])
+        job["result"] = json_codec.loads(job["result"]) if job["result"] is not None else None
+        return job
+
+    @staticmethod
+    def _strip_secrets(payload):
+        return {key: value for key, value in payload.items() if key not in SECRET_FIELDS}
+
+    def enqueue(self, kind, payload, app_id=None, document_id=None, max_attempts=3):
+        """
+        添加任务，payload 中的应用凭证不会被保存
+        :return: 任务 ID
+        """
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self._lock:
+            conn = self._db()
+            conn.execute(
+                "INSERT INTO jobs (id, kind, payload, status, attempts, max_attempts, app_id, document_id, "
+                "created_at, updated_at, available_at) VALUES (?, ?, ?, ?, 0, ?, ?, ?, ?, ?, ?)",
+                (job_id, kind, json_codec.dumps(self._strip_secrets(payload)), QUEUED, max_attempts, app_id, document_id,
+                 now, now, now),
+            )
+            conn.commit()
+        self.emit(job_id, QUEUED)
+        return job_id
+
+    def get(self, job_id):
+        """
+        :return: 任务字典，不存在时返回 None
+        """
+        with self._lock:
+            row = self._db().execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._row_to_job(row)
+
+    def claim(self, busy_documents=()):
+        """
+        取出最早的一个可执行任务并标记为执行中，跳过执行中的任务数已达上限的应用
+        :param busy_documents: 已有任务在执行的文档，这些文档的任务留在队列中，等前一个任务结束后再取出
+        :return: 任务字典，没有可执行的任务时返回 None
+        """
+        now = time.time()
+        query = "SELECT * FROM jobs WHERE status = ? AND available_at <= ?"
+        params = [QUEUED, now]
+        if busy_documents:
+            query += f" AND (document_id IS NULL OR document_id NOT IN ({', '.join('?' for _ in busy_documents)}))"
+            params += list(busy_documents)
+        if self.max_running_per_app is not None:
+            query += (" AND (app_id IS NULL OR app_id NOT IN ("
+                      "SELECT app_id FROM jobs WHERE status = ? AND app_id IS NOT NULL "
+                      "GROUP BY app_id HAVING COUNT(*) >= ?))")
+            params += [RUNNING, self.max_running_per_app]
+        with self._lock:
+            conn = self._db()
+            row = conn.execute(query + " ORDER BY created_at LIMIT 1", params).fetchone()
+            if row is None:
+                return None
+            conn.execute(
+                "UPDATE jobs SET status = ?, attempts = attempts + 1, updated_at = ? WHERE id = ?",
+                (RUNNING, now, row[0]),
+            )
+            conn.commit()
+        job = self._row_to_job(row)
+        job["status"] = RUNNING
+        job["attempts"] += 1
+        self.emit(job["id"], RUNNING, {"attempt": job["attempts"]})
+        return job
+
+    def complete(self, job_id, result=None):
+        with self._lock:
+            conn = self._db()
+            conn.execute(
+                "UPDATE jobs SET status = ?, result = ?, last_error = NULL, updated_at = ? WHERE id = ?",
+                (SUCCEEDED, json_codec.dumps(result), time.time(), job_id),
+            )
+            conn.commit()
+        self.emit(job_id, SUCCEEDED, {"result": result})
+
+    def fail(self, job, error, retry=True):
+        """
+        记录一次失败，未达到最大尝试次数时延迟后重新排队；
+        已经开始写入文档（报告过 WRITING 事件）的任务不再重试，重新执行会重复写入已写入的部分
+        :param retry: 为 False 时直接标记为失败
+        :return: 任务的新状态
+        """
+        now = time.time()
+        with self._lock:
+            conn = self._db()
+            if conn.execute("SELECT writes_started FROM jobs WHERE id = ?", (job["id"],)).fetchone()[0]:
+                retry, error = False, f"{error}（{PARTIAL_WRITE_ERROR}）"
+            if retry and job["attempts"] < job["max_attempts"]:
+                delay = min(self.retry_max_delay, self.retry_base_delay * (2 ** (job["attempts"] - 1)))
+                status, available_at = QUEUED, now + random.uniform(delay / 2, delay)
+            else:
+                status, available_at = FAILED, job["available_at"]
+            conn.execute(
+                "UPDATE jobs SET status = ?, last_error = ?, updated_at = ?, available_at = ? WHERE id = ?",
+                (status, error, now, available_at, job["id"]),
+            )
+            conn.commit()
+        if status == FAILED:
+            self.emit(job["id"], FAILED, {"error": error, "attempt": job["attempts"]})
+        else:
+            self.emit(job["id"], "retrying", {"error": error, "attempt": job["attempts"], "retry_at": available_at})
+        return status
+
+    def recover(self):
+        """
+        启动时调用：上次进程退出时仍在执行的任务重新排队，其中已经开始写入文档的任务标记为失败
+        :return: (重新排队的任务数, 标记为失败的任务数)
+        """
+        now = time.time()
+        with self._lock:
+            conn = self._db()
+            interrupted = [row[0] for row in conn.execute(
+                "SELECT id FROM jobs WHERE status = ? AND writes_started = 1", (RUNNING,)
+            ).fetchall()]
+            conn.execute(
+                "UPDATE jobs SET status = ?, last_error = ?, updated_at = ? WHERE status = ? AND writes_started = 1",
+                (FAILED, f"任务执行中服务退出（{PARTIAL_WRITE_ERROR}）", now, RUNNING),
+            )
+            requeued = conn.execute(
+                "UPDATE jobs SET status = ?, updated_at = ? WHERE status = ?", (QUEUED, now, RUNNING)
+            ).rowcount
+            conn.commit()
+        for job_id in interrupted:
+            self.emit(job_id, FAILED, {"error": f"任务执行中服务退出（{PARTIAL_WRITE_ERROR}）"})
+        return requeued, len(interrupted)
+
+    def purge(self, older_than=None):
+        """
+        删除已经结束（成功或最终失败）超过 older_than 秒的任务及其事件
+        :param older_than: 为 None 时使用 retention
+        :return: 删除的任务数
+        """
+        older_than = self.retention if older_than is None else older_than
+        if not older_than or older_than < 0:
+            return 0
+        params = (*FINAL_STATUSES, time.time() - older_than)
+        with self._lock:
+            conn = self._db()
+            conn.execute(
+                "DELETE FROM job_events WHERE job_id IN (SELECT id FROM jobs WHERE status IN (?, ?) AND updated_at < ?)",
+                params,
+            )
+            count = conn.execute("DELETE FROM jobs WHERE status IN (?, ?) AND updated_at < ?", params).rowcount
+            conn.commit()
+        return count
+
+    def emit(self, job_id, event_type, data=None):
+        """
+        记录任务事件并推送给订阅者
+        :param event_type: 事件类型，如 queued、running、succeeded、failed 或任务自定义的进度事件；
+            WRITING 事件同时把任务标记为已开始写入
+        :param data: 事件数据
+        :return: 事件字典，包含自增的事件 ID
+        """
+        event = self._record(job_id, event_type, data)
+        self.events_hub.publish(event)
+        return event
+
+    def _record(self, job_id, event_type, data=None):
+        """
+        把事件写入数据库，不推送
+        """
+        data = data or {}
+        now = time.time()
+        with self._lock:
+            conn = self._db()
+            if event_type == WRITING:
+                conn.execute("UPDATE jobs SET writes_started = 1 WHERE id = ?", (job_id,))
+            event_id = conn.execute(
+                "INSERT INTO job_events (job_id, type, data, created_at) VALUES (?, ?, ?, ?)",
+                (job_id, event_type, json_codec.dumps(data), now),
+            ).lastrowid
+            conn.commit()
+        return {"id": event_id, "job_id": job_id, "type": event_type, "data": data, "created_at": now}
+
+    def reporter(self, job_id):
+        """
+        :return: 记录该任务进度事件的函数 report(event_type, data)
+
+        在事件循环中调用时，事件交给写入线程按报告顺序保存，写入后在事件循环中推送，report 立即返回；
+        WRITING 事件等写入完成后才返回，保证开始写入文档前任务已经标记为不可重试。
+        """
+        def report(event_type, data=None):
+            try:
+                loop = asyncio.get_running_loop()
+            except RuntimeError:
+                return self.emit(job_id, event_type, data)
+
+            def publish(done):
+                if done.exception() is None and not loop.is_closed():
+                    loop.call_soon_threadsafe(self.events_hub.publish, done.result())
+
+            future = self._event_writer.submit(self._record, job_id, event_type, data)
+            future.add_done_callback(publish)
+            if event_type == WRITING:
+                return future.result()
+            return None
+        return report
+
+    async def flush_events(self):
+        """
+        等待已报告的进度事件全部保存并推送，任务结束前调用，保证结束事件排在进度事件之后
+        """
+        await asyncio.wrap_future(self._event_writer.submit(lambda: None))
+
+    def events(self, job_id, after=0):
+        """
+        :param after: 只返回 ID 大于该值的事件
+        :return: 任务的事件列表，按发生顺序排列
+        """
+        with self._lock:
+            rows = self._db().execute(
+                "SELECT id, job_id, type, data, created_at FROM job_events WHERE job_id = ? AND id > ? ORDER BY id",
+                (job_id, after),
+            ).fetchall()
+        return [
+            {"id": row[0], "job_id": row[1], "type": row[2], "data": json_codec.loads(row[3]), "created_at": row[4]}
+            for row in rows
+        ]
+
+    async def wait(self, job_id, timeout=None):
+        """
+        等待任务成功或最终失败
+        :param timeout: 最长等待时间（秒），为 None 时一直等待
+        :return: 任务字典（超时时为当前状态），任务不存在时返回 None
+        """
+        queue = self.events_hub.subscribe(job_id)
+        try:
+            job = self.get(job_id)
+            if job is None or job["status"] in FINAL_STATUSES:
+                return job
+
+            async def until_final():
+                while (await queue.get())["type"] not in FINAL_STATUSES:
+                    pass
+
+            try:
+                await asyncio.wait_for(until_final(), timeout)
+            except asyncio.TimeoutError:
+                pass
+            return self.get(job_id)
+        finally:
+            self.events_hub.unsubscribe(job_id, queue)
+
+    def active_counts(self, app_id=None):
+        """
+        :return: (全部未完成的任务数, 该应用未完成的任务数)，未完成指排队中或执行中
+        """
+        with self._lock:
+            total, per_app = self._db().execute(
+                "SELECT COUNT(*), COALESCE(SUM(app_id = ?), 0) FROM jobs WHERE status IN (?, ?)",
+                (app_id, QUEUED, RUNNING),
+            ).fetchone()
+        return total, per_app
+
+    def counts(self):
+        """
+        :return: 各状态的任务数
+        """
+        with self._lock:
+            rows = self._db().execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        return dict(rows)
+
+
+class JobWorkerPool:
+    """
+    异步任务执行池：多个 worker 协程从 JobQueue 中取出任务执行
+
+    同一文档同时只取出一个任务，后面的任务留在队列中，不会占用 worker 和单应用执行上限（JobQueue.max_running_per_app）
+    在文档队列里等待；带 document_id 的任务交给 DocumentWriteScheduler 执行，受全局写并发上限约束。
+    worker 只能在常驻进程中通过 start 启动（应用的 lifespan），Serverless 部署中不会运行。
+    """
+
+    def __init__(self, queue, concurrency=4, poll_interval=1.0, scheduler=None, purge_interval=3600):
+        """
+        :param queue: JobQueue
+        :param concurrency: worker 数量
+        :param poll_interval: 队列为空时的轮询间隔（秒）
+        :param scheduler: 可选的 DocumentWriteScheduler
+        :param purge_interval: 清理已结束任务的间隔（秒）
+        """
+        self.queue = queue
+        self.concurrency = concurrency
+        self.poll_interval = poll_interval
+        self.scheduler = scheduler
+        self.purge_interval = purge_interval
+        self._workers = []
+        self._purger = None
+        self._wakeup = None
+        self._busy_documents = set()
+
+    @classmethod
+    def from_env(cls, queue, scheduler=None):
+        """
+        FEISHU_JOB_WORKERS: worker 数量
+        """
+        return cls(queue, int(os.getenv('FEISHU_JOB_WORKERS', 4)), scheduler=scheduler)
+
+    @property
+    def running(self):
+        """
+        worker 是否已经启动
+        """
+        return bool(self._workers)
+
+    def notify(self):
+        """
+        有新任务时唤醒空闲的 worker
+        """
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def start(self):
+        """
+        恢复中断的任务并启动 worker 和定期清理
+        """
+        requeued, failed = self.queue.recover()
+        if requeued or failed:
+            print(f"恢复了 {requeued} 个中断的任务，{failed} 个已部分写入的任务标记为失败")
+        self._wakeup = asyncio.Event()
+        self._workers = [asyncio.ensure_future(self._worker()) for _ in range(max(1, self.concurrency))]
+        self._purger = asyncio.ensure_future(self._purge_loop())
+
+    async def stop(self):
+        """
+        停止 worker，执行中的任务会被取消：尚未开始写入的任务下次启动时重新执行，已经开始写入的任务标记为失败
+        """
+        tasks = self._workers + ([self._purger] if self._purger is not None else [])
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        # worker 被取消时写任务也随之取消，这里等待它们真正结束，之后才能关闭连接池
+        if self.scheduler is not None:
+            await self.scheduler.stop()
+        self._workers = []
+        self._purger = None
+
+    async def _purge_loop(self):
+        while True:
+            try:
+                purged = self.queue.purge()
+                if purged:
+                    print(f"清理了 {purged} 个已结束的任务")
+            except Exception as e:
+                print(f"清理已结束的任务失败: {e}")
+            await asyncio.sleep(self.purge_interval)
+
+    async def _worker(self):
+        while True:
+            job = self.queue.claim(self._busy_documents)
+            if job is None:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            if not job["document_id"]:
+                await self._execute(job)
+                continue
+            self._busy_documents.add(job["document_id"])
+            try:
+                await self._execute(job)
+            finally:
+                self._busy_documents.discard(job["document_id"])
+                # 该文档的下一个任务可以取出了
+                self.notify()
+
+    async def _execute(self, job):
+        handler = self.queue.handlers.get(job["kind"])
+        try:
+            if handler is None:
+                raise ValueError(f"未注册的任务类型: {job['kind']}")
+            report = self.queue.reporter(job["id"])
+            if self.scheduler is not None and job["document_id"]:
+                result = await self.scheduler.submit(job["document_id"], handler, job["payload"], job, report)
+            else:
+                result = await handler(job["payload"], job, report)
+        except asyncio.CancelledError:
+            raise
+        except JobAborted as e:
+            await self.queue.flush_events()
+            self.queue.fail(job, str(e), retry=False)
+            print(f"任务 {job['id']} 执行失败，不再重试: {e}")
+        except Exception as e:
+            await self.queue.flush_events()
+            status = self.queue.fail(job, f"{type(e).__name__}: {e}")
+            print(f"任务 {job['id']} 第 {job['attempts']} 次执行失败（{status}）: {e}")
+            traceback.print_exc()
+        else:
+            await self.queue.flush_events()
+            self.queue.complete(job["id"], result)
+
+
+job_queue = JobQueue.from_env()
+job_workers = JobWorkerPool.from_env(job_queue, write_scheduler)
@@ -0,0 +1,54 @@
+# file name: json_codec.py
+# 统一的 JSON 编解码层：安装了 orjson 时使用 orjson，否则回退到标准库 json
+import json
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - 取决于运行环境
+    orjson = None
+
+HAS_ORJSON = orjson is not None
+
+
+if HAS_ORJSON:
+    _ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS
+
+    def encode(obj):
+        """
+        编码为 UTF-8 JSON 字节串
+        """
+        return orjson.dumps(obj, option=_ORJSON_OPTIONS)
+
+    def decode(data):
+        """
+        解码 JSON 字节串或字符串
+        """
+        return orjson.loads(data)
+else:
+    _encoder = json.JSONEncoder(ensure_ascii=False, separators=(",", ":"))
+
+    def encode(obj):
+        """
+        编码为 UTF-8 JSON 字节串
+        """
+        return _encoder.encode(obj).encode("utf-8")
+
+    def decode(data):
+        """
+        解码 JSON 字节串或字符串
+        """
+        return json.loads(data)
+
+
+def dumps(obj):
+    """
+    编码为 JSON 字符串
+    """
+    return encode(obj).decode("utf-8")
+
+
+def loads(data):
+    """
+    解码 JSON 字符串，与 decode 相同，便于替换 json.loads
+    """
+    return decode(data)
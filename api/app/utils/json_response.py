@@ -0,0 +1,13 @@
+# file name: json_response.py
+from fastapi.responses import JSONResponse
+
+from api.app.utils import json_codec
+
+
+class CodecJSONResponse(JSONResponse):
+    """
+    使用 json_codec 编码的 JSON 响应（安装 orjson 时等同于 ORJSONResponse）
+    """
+
+    def render(self, content):
+        return json_codec.encode(content)
@@ -0,0 +1,108 @@
+# file name: singleflight.py
+import asyncio
+import threading
+
+
+class _Call:
+    __slots__ = ("event", "result", "error")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    合并并发的相同调用（线程版）
+
+    同一个 key 同时只会有一次真实调用在进行，其余线程等待并共享它的结果或异常。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def in_flight(self, key):
+        """
+        判断某个 key 是否有正在进行的调用
+        """
+        with self._lock:
+            return key in self._calls
+
+    def do(self, key, fn, *args, **kwargs):
+        """
+        执行 fn(*args, **kwargs)，若相同 key 的调用正在进行则等待其结果
+        :param key: 合并调用的键
+        :param fn: 实际执行的函数
+        :return: fn 的返回值
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            call.event.wait()
+        else:
+            try:
+                call.result = fn(*args, **kwargs)
+            except BaseException as e:
+                call.error = e
+            finally:
+                with self._lock:
+                    self._calls.pop(key, None)
+                call.event.set()
+
+        if call.error is not None:
+            raise call.error
+        return call.result
+
+
+class AsyncSingleFlight:
+    """
+    合并并发的相同调用（协程版）
+
+    同一个 key 同时只会有一个任务在执行，其余调用方等待并共享它的结果或异常。
+    调用方被取消不会影响共享任务，其他等待者仍能拿到结果。
+    """
+
+    def __init__(self):
+        self._tasks = {}
+
+    def in_flight(self, key):
+        """
+        判断某个 key 是否有正在进行的调用
+        """
+        task = self._tasks.get(key)
+        return task is not None and not task.done()
+
+    def _forget(self, key, task):
+        if self._tasks.get(key) is task:
+            del self._tasks[key]
+        # 避免无人等待时出现 "exception was never retrieved" 警告
+        if not task.cancelled():
+            task.exception()
+
+    def start(self, key, coro_fn, *args, **kwargs):
+        """
+        启动（或复用）相同 key 的共享任务，不等待其完成
+        :return: 共享任务
+        """
+        loop = asyncio.get_running_loop()
+        task = self._tasks.get(key)
+        if task is None or task.done() or task.get_loop() is not loop:
+            task = loop.create_task(coro_fn(*args, **kwargs))
+            self._tasks[key] = task
+            task.add_done_callback(lambda t: self._forget(key, t))
+        return task
+
+    async def do(self, key, coro_fn, *args, **kwargs):
+        """
+        执行 coro_fn(*args, **kwargs)，若相同 key 的调用正在进行则等待其结果
+        :param key: 合并调用的键
+        :param coro_fn: 返回协程的函数
+        :return: 协程的返回值
+        """
+        return await asyncio.shield(self.start(key, coro_fn, *args, **kwargs))
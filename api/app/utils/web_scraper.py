@@ -2,10 +2,11 @@
 import requests
 from bs4 import BeautifulSoup
 import re
-import json
 from urllib.parse import urlparse, parse_qs, urlencode, urlunparse
 import html
 
+from api.app.utils import json_codec
+
 class WebScraper:
     default_url_rules = [
         {
@@ -44,7 +45,11 @@ class WebScraper:
         self.url_rules = self.default_url_rules.copy()
 
         if url_rules_json:
-            custom_url_rules = json.loads(url_rules_json)
+            # 支持直接传入已解析的规则列表，避免每次请求都做一次 JSON 编解码
+            if isinstance(url_rules_json, (str, bytes)):
+                custom_url_rules = json_codec.loads(url_rules_json)
+            else:
+                custom_url_rules = url_rules_json
             self.update_headers(custom_url_rules)
 
     def update_headers(self, custom_url_rules):
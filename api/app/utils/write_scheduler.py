@@ -0,0 +1,136 @@
+# file name: write_scheduler.py
+import asyncio
+import os
+from collections import deque
+
+
+class DocumentWriteScheduler:
+    """
+    文档写任务调度器
+
+    同一文档的写任务按提交顺序逐个执行（每次插入都会移动后续块的索引，必须串行）；
+    不同文档的任务并行执行，同时执行的任务数不超过 max_concurrency，
+    各文档按轮转方式获得执行机会，任务多的文档不会让其他文档一直等待。
+    取消 submit 返回的 future（或等待它的协程）会同时取消排队中或执行中的写任务；stop 取消并等待所有写任务结束。
+    """
+
+    def __init__(self, max_concurrency=4):
+        """
+        :param max_concurrency: 全局同时执行的写任务数上限
+        """
+        self.max_concurrency = max(1, max_concurrency)
+        self._queues = {}
+        self._ready = deque()
+        self._running = set()
+        self._tasks = set()
+        self._completed = 0
+        self._failed = 0
+
+    @classmethod
+    def from_env(cls):
+        """
+        根据环境变量创建调度器
+        FEISHU_WRITE_CONCURRENCY: 全局同时执行的写任务数上限
+        """
+        return cls(int(os.getenv('FEISHU_WRITE_CONCURRENCY', 4)))
+
+    def submit_nowait(self, document_id, coro_fn, *args, **kwargs):
+        """
+        提交写任务，不等待执行完成
+        :param document_id: 任务写入的文档 ID
+        :param coro_fn: 返回协程的函数
+        :return: asyncio.Future，任务完成后得到 coro_fn 的返回值
+        """
+        future = asyncio.get_running_loop().create_future()
+        queue = self._queues.setdefault(document_id, deque())
+        queue.append((future, coro_fn, args, kwargs))
+        if document_id not in self._running and len(queue) == 1:
+            self._ready.append(document_id)
+        self._dispatch()
+        return future
+
+    async def submit(self, document_id, coro_fn, *args, **kwargs):
+        """
+        提交写任务并等待执行完成
+        :return: coro_fn 的返回值
+        """
+        return await self.submit_nowait(document_id, coro_fn, *args, **kwargs)
+
+    def _dispatch(self):
+        while self._ready and len(self._running) < self.max_concurrency:
+            document_id = self._ready.popleft()
+            queue = self._queues[document_id]
+            # 排队时已被取消的任务直接丢弃
+            while queue and queue[0][0].cancelled():
+                queue.popleft()
+            if not queue:
+                del self._queues[document_id]
+                continue
+            future, coro_fn, args, kwargs = queue.popleft()
+            self._running.add(document_id)
+            task = asyncio.ensure_future(self._run(document_id, future, coro_fn, args, kwargs))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+            future.add_done_callback(lambda f, task=task: task.cancel() if f.cancelled() else None)
+
+    async def _run(self, document_id, future, coro_fn, args, kwargs):
+        try:
+            result = await coro_fn(*args, **kwargs)
+        except asyncio.CancelledError:
+            self._failed += 1
+            future.cancel()
+            raise
+        except Exception as e:
+            self._failed += 1
+            if not future.done():
+                future.set_exception(e)
+        else:
+            self._completed += 1
+            if not future.done():
+                future.set_result(result)
+        finally:
+            self._running.discard(document_id)
+            if self._queues.get(document_id):
+                # 排到队尾，让其他文档先执行
+                self._ready.append(document_id)
+            else:
+                self._queues.pop(document_id, None)
+            self._dispatch()
+
+    async def stop(self):
+        """
+        取消排队中的任务，取消并等待执行中的任务结束
+        """
+        for queue in self._queues.values():
+            for future, _, _, _ in queue:
+                future.cancel()
+        self._queues.clear()
+        self._ready.clear()
+        tasks = list(self._tasks)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def pending(self, document_id=None):
+        """
+        :return: 某个文档（或全部文档）等待执行的任务数
+        """
+        if document_id is not None:
+            return len(self._queues.get(document_id, ()))
+        return sum(len(queue) for queue in self._queues.values())
+
+    def stats(self):
+        """
+        :return: 执行中的文档数、等待的任务数、已完成和失败的任务数
+        """
+        return {
+            "running": len(self._running),
+            "pending": self.pending(),
+            "documents": len(self._queues),
+            "completed": self._completed,
+            "failed": self._failed,
+            "max_concurrency": self.max_concurrency
+        }
+
+
+write_scheduler = DocumentWriteScheduler.from_env()
@@ -0,0 +1,25 @@
+# file name: bench_block_model.py
+# 对比 BlockType 编号到名称的查找：线性扫描枚举与预先生成的查找表
+# 运行方式：python -m benchmarks.bench_block_model
+import timeit
+
+from api.app.handlers.feishu_docx_api_handler_async import BlockType
+
+
+def linear_lookup(position):
+    # 修改前 get_string_by_position 的实现
+    for block in BlockType:
+        if block.position == position:
+            return block.string_value
+    return None
+
+
+if __name__ == "__main__":
+    number = 10
+    positions = [block.position for block in BlockType] * 200
+    assert [linear_lookup(p) for p in positions] == [BlockType.get_string_by_position(p) for p in positions]
+
+    linear = timeit.timeit(lambda: [linear_lookup(p) for p in positions], number=number) / number
+    table = timeit.timeit(lambda: [BlockType.get_string_by_position(p) for p in positions], number=number) / number
+    print(f"BlockType.get_string_by_position（{len(positions)} 次）")
+    print(f"  线性扫描 {linear * 1000:8.2f} ms  查找表 {table * 1000:8.2f} ms  加速 {linear / table:.1f}x")
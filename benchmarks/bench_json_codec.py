@@ -0,0 +1,64 @@
+# file name: bench_json_codec.py
+# 对比标准库 json 与 json_codec 在大型飞书响应上的编解码耗时
+# 运行方式：python -m benchmarks.bench_json_codec
+import json
+import timeit
+
+from api.app.utils import json_codec
+
+
+def build_document_blocks(count=5000):
+    """
+    构造一个与 get_document_blocks 响应结构相同的大型负载
+    """
+    items = []
+    for i in range(count):
+        items.append({
+            "block_id": f"doxcn{i:020d}",
+            "parent_id": "doxcn00000000000000000000",
+            "block_type": 2,
+            "children": [],
+            "text": {
+                "elements": [{
+                    "text_run": {
+                        "content": f"第 {i} 段：飞书小报内容示例，包含一些中文和 English text。",
+                        "text_element_style": {
+                            "bold": False,
+                            "inline_code": False,
+                            "italic": False,
+                            "strikethrough": False,
+                            "underline": False
+                        }
+                    }
+                }],
+                "style": {"align": 1, "folded": False}
+            }
+        })
+    return {"code": 0, "msg": "success", "data": {"has_more": False, "items": items}}
+
+
+def build_batch_records(count=500):
+    """
+    构造一个与 batch_create_records 请求体结构相同的负载
+    """
+    return {"records": [{"fields": {"标题": f"记录 {i}", "链接": f"https://example.com/{i}", "分数": i * 1.5, "标签": ["a", "b", "c"]}} for i in range(count)]}
+
+
+def bench(name, payload, number=20):
+    raw = json.dumps(payload).encode("utf-8")
+    results = {
+        "stdlib dumps": timeit.timeit(lambda: json.dumps(payload).encode("utf-8"), number=number),
+        "codec encode": timeit.timeit(lambda: json_codec.encode(payload), number=number),
+        "stdlib loads": timeit.timeit(lambda: json.loads(raw), number=number),
+        "codec decode": timeit.timeit(lambda: json_codec.decode(raw), number=number),
+    }
+    print(f"{name} ({len(raw) / 1024:.0f} KiB, {number} 次)")
+    for label, seconds in results.items():
+        print(f"  {label:<14} {seconds * 1000 / number:8.2f} ms/次")
+    print(f"  编码加速 {results['stdlib dumps'] / results['codec encode']:.1f}x，解码加速 {results['stdlib loads'] / results['codec decode']:.1f}x")
+
+
+if __name__ == "__main__":
+    print(f"orjson 可用: {json_codec.HAS_ORJSON}")
+    bench("get_document_blocks 响应", build_document_blocks())
+    bench("batch_create_records 请求体", build_batch_records())
@@ -0,0 +1,23 @@
+# file name: blocks.py
+# 测试中构造飞书文档块的辅助函数
+from api.app.handlers.feishu_docx_api_handler_async import BlockType
+
+
+def text_block(block_id, content, block_type=BlockType.TEXT, parent_id=None, children=None):
+    """
+    :return: 与 get_document_blocks 返回格式相同的文本类块
+    """
+    block = {
+        "block_id": block_id,
+        "block_type": block_type.position,
+        block_type.string_value: {"elements": [{"text_run": {"content": content}}], "style": {}}
+    }
+    if parent_id is not None:
+        block["parent_id"] = parent_id
+    if children is not None:
+        block["children"] = list(children)
+    return block
+
+
+def page(document_id, children):
+    return {"block_id": document_id, "block_type": BlockType.PAGE.position, "children": list(children)}
@@ -0,0 +1,10 @@
+# file name: conftest.py
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# 测试使用临时目录保存本地数据库，避免在仓库中生成文件
+os.environ.setdefault("FEISHU_DATA_DIR", tempfile.mkdtemp(prefix="feishu_test_"))
+os.environ.setdefault("API_KEY", "test")
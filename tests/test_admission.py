@@ -0,0 +1,81 @@
+# file name: test_admission.py
+import asyncio
+
+import pytest
+
+from api.app.utils.admission import AdmissionController, AdmissionRejected, BULK, INTERACTIVE
+from api.app.utils.feishu_rate_limiter import RateLimiter, interactive_lane
+
+
+class _Queue:
+    def __init__(self, total, per_app):
+        self.counts = (total, per_app)
+
+    def active_counts(self, app_id=None):
+        return self.counts
+
+
+def test_admit_job_rejects_over_global_and_per_app_limits():
+    admission = AdmissionController(max_jobs=10, max_jobs_per_app=4, job_retry_after=10)
+    admission.admit_job(_Queue(5, 2), "app", count=2)
+
+    with pytest.raises(AdmissionRejected) as e:
+        admission.admit_job(_Queue(5, 3), "app", count=2)
+    assert e.value.lane == BULK and e.value.retry_after == 10
+
+    with pytest.raises(AdmissionRejected) as e:
+        admission.admit_job(_Queue(9, 0), "other", workers=1, count=3)
+    assert e.value.retry_after == 20
+    assert admission.stats()["rejected"] == {BULK: 2, INTERACTIVE: 0}
+
+
+def test_interactive_lane_has_its_own_concurrency_limit():
+    admission = AdmissionController(max_interactive=3, max_interactive_per_app=1)
+
+    async def main():
+        async with admission.interactive("a"):
+            assert interactive_lane.get()
+            with pytest.raises(AdmissionRejected):
+                async with admission.interactive("a"):
+                    pass
+            async with admission.interactive("b"):
+                assert admission.stats()["interactive_running"] == 2
+        assert not interactive_lane.get()
+        return admission.stats()
+
+    stats = asyncio.run(main())
+    assert stats["interactive_running"] == 0
+    assert stats["rejected"][INTERACTIVE] == 1
+
+
+def test_interactive_requests_do_not_queue_behind_bulk_requests():
+    limiter = RateLimiter({"docx_read": 5}, interactive_share=0.2)
+    bulk, _ = limiter.buckets("app", "docx_read")
+    # 批量请求预约了 20 个令牌，之后的批量请求需要等待数秒
+    for _ in range(20):
+        bulk.reserve()
+    assert limiter._reserve("app", "docx_read") > 3
+
+    token = interactive_lane.set(True)
+    try:
+        assert limiter._reserve("app", "docx_read") == 0
+        # 预留额度（1 次/秒）用完后等待预留额度恢复，而不是排在批量请求之后
+        assert 0 < limiter._reserve("app", "docx_read") <= 1
+    finally:
+        interactive_lane.reset(token)
+
+
+def test_interactive_requests_borrow_idle_bulk_capacity():
+    limiter = RateLimiter({"docx_read": 5}, interactive_share=0.2)
+    token = interactive_lane.set(True)
+    try:
+        delays = [limiter._reserve("app", "docx_read") for _ in range(5)]
+    finally:
+        interactive_lane.reset(token)
+    assert delays == [0, 0, 0, 0, 0]
+
+
+def test_without_reserved_share_lanes_share_one_bucket():
+    limiter = RateLimiter({"docx_read": 5}, interactive_share=0)
+    assert limiter.buckets("app", "docx_read")[1] is None
+    assert limiter.buckets("app", "unknown") is None
@@ -0,0 +1,77 @@
+# file name: test_bitable_handler_async.py
+import asyncio
+
+from api.app.handlers.feishu_bitable_api_handler_async import FeishuBitableAPIHandler
+
+
+class _BitableAPI:
+    """
+    记录同时进行中的请求数的假接口
+    """
+
+    def __init__(self):
+        self.active = 0
+        self.max_active = 0
+        self.calls = []
+
+    async def _call(self, name, size, extra=None):
+        self.active += 1
+        self.max_active = max(self.max_active, self.active)
+        self.calls.append((name, size, extra))
+        await asyncio.sleep(0.01)
+        self.active -= 1
+        return {"code": 0, "data": {"records": [{}] * size}}
+
+    async def batch_create_records(self, app_token, table_id, records, user_id_type, client_token=None):
+        return await self._call("create", len(records), client_token)
+
+    async def batch_update_records(self, app_token, table_id, records, user_id_type):
+        return await self._call("update", len(records))
+
+    async def batch_get_records(self, app_token, table_id, record_ids, *args):
+        return await self._call("get", len(record_ids))
+
+
+def _handler(api):
+    handler = FeishuBitableAPIHandler("app", "secret")
+    handler.feishu_bitable_api = api
+    return handler
+
+
+def test_writes_to_the_same_table_never_overlap():
+    api = _BitableAPI()
+    first, second = _handler(api), _handler(api)
+
+    async def main():
+        return await asyncio.gather(
+            first.gather_batch_create_records("base", "tbl", [{}] * 1200),
+            second.gather_batch_update_records("base", "tbl", [{}] * 600),
+        )
+
+    created, updated = asyncio.run(main())
+    assert api.max_active == 1
+    assert len(created["data"]["records"]) == 1200
+    assert len(updated["data"]["records"]) == 600
+    tokens = [token for name, _, token in api.calls if name == "create"]
+    assert len(tokens) == 3 and len(set(tokens)) == 3
+
+
+def test_writes_to_different_tables_run_concurrently():
+    api = _BitableAPI()
+    handler = _handler(api)
+
+    async def main():
+        await asyncio.gather(
+            handler.gather_batch_create_records("base", "tbl1", [{}] * 10),
+            handler.gather_batch_create_records("base", "tbl2", [{}] * 10),
+        )
+
+    asyncio.run(main())
+    assert api.max_active == 2
+
+
+def test_reads_stay_parallel():
+    api = _BitableAPI()
+    result = asyncio.run(_handler(api).gather_batch_get_records("base", "tbl", list(range(450)), concurrency=5))
+    assert api.max_active == 5
+    assert len(result["data"]["records"]) == 450
@@ -0,0 +1,50 @@
+# file name: test_block_batch_update_planner.py
+from api.app.handlers.feishu_docx_api_handler_async import BlockBatchUpdatePlanner, BlockBatchUpdateRequestBuilder
+
+
+def text_style(block_id, style, fields):
+    return {"block_id": block_id, "update_text_style": {"style": style, "fields": fields}}
+
+
+def test_replacing_operations_keep_only_the_last_one_per_block():
+    builder = BlockBatchUpdateRequestBuilder()
+    builder.add_update_text("a", [{"content": "旧"}])
+    builder.add_replace_image("img", "key_1")
+    builder.add_update_text("b", [{"content": "b"}])
+    builder.add_update_text("a", [{"content": "新"}])
+    builder.add_replace_image("img", "key_2")
+
+    merged = BlockBatchUpdatePlanner.from_builder(builder).merged()
+
+    # 合并后的操作放在最后一次出现的位置
+    assert [request["block_id"] for request in merged] == ["b", "a", "img"]
+    assert merged[1]["update_text_elements"]["elements"][0]["text_run"]["content"] == "新"
+    assert merged[2]["replace_image"] == {"image_key": "key_2"}
+
+
+def test_text_styles_are_merged_by_field():
+    merged = BlockBatchUpdatePlanner([
+        text_style("a", {"bold": True, "italic": True}, ["bold", "italic"]),
+        text_style("a", {"bold": False, "align": 2}, ["bold", "align"]),
+    ]).merged()
+
+    assert merged == [text_style("a", {"bold": False, "italic": True, "align": 2}, ["bold", "italic", "align"])]
+
+
+def test_structural_operations_are_never_merged():
+    builder = BlockBatchUpdateRequestBuilder()
+    builder.add_insert_table_row("table", 1, {})
+    builder.add_delete_table_rows("table", [0])
+    builder.add_insert_table_row("table", 1, {})
+
+    assert BlockBatchUpdatePlanner.from_builder(builder).merged() == builder.build()
+
+
+def test_plan_splits_by_request_limit_with_distinct_client_tokens():
+    requests_list = [{"block_id": f"b{i}", "replace_file": {"file_key": str(i)}} for i in range(5)]
+
+    plan = BlockBatchUpdatePlanner(requests_list, max_requests=2).plan()
+
+    assert [batch["requests"] for batch in plan] == [requests_list[0:2], requests_list[2:4], requests_list[4:]]
+    assert len({batch["client_token"] for batch in plan}) == 3
+    assert BlockBatchUpdatePlanner([]).plan() == []
@@ -0,0 +1,83 @@
+# file name: test_content_dedup.py
+from api.app.handlers.feishu_docx_api_handler_async import BlockType
+from api.app.handlers.feishu_document_tree import DocumentTree
+from api.app.utils.content_dedup import ContentDedupIndex, canonicalize_link
+
+
+def _text(block_id, block_type, content, url=None):
+    style = {"link": {"url": url}} if url else {}
+    return {
+        "block_id": block_id,
+        "block_type": block_type.position,
+        block_type.string_value: {"elements": [{"text_run": {"content": content, "text_element_style": style}}]}
+    }
+
+
+def _document(*callouts):
+    blocks = [{"block_id": "doc", "block_type": BlockType.PAGE.position, "children": []}]
+    for i, (title, link) in enumerate(callouts):
+        callout_id = f"callout_{i}"
+        blocks[0]["children"].append(callout_id)
+        blocks.append({
+            "block_id": callout_id, "parent_id": "doc", "block_type": BlockType.CALLOUT.position,
+            "children": [f"title_{i}", f"link_{i}"], "callout": {}
+        })
+        blocks.append(_text(f"title_{i}", BlockType.HEADING2, title))
+        blocks.append(_text(f"link_{i}", BlockType.BULLET, "原文链接", link))
+    return DocumentTree(blocks, "doc", revision_id=1)
+
+
+def _content(title, link=None, bullets=()):
+    return {"title": title, "bullets": list(bullets), "link": link}
+
+
+def test_canonicalize_link_strips_only_known_tracking_params():
+    assert canonicalize_link("HTTPS://Example.com:443/a/?utm_source=x&b=2&fbclid=1&a=1#top") == "https://example.com/a?a=1&b=2"
+    assert canonicalize_link("https%3A%2F%2Fexample.com%2Fa%3Fid%3D1") == "https://example.com/a?id=1"
+    # 通用参数可能标识不同的文章，协议也保持不变
+    assert canonicalize_link("https://example.com/a?from=1") != canonicalize_link("https://example.com/a?from=2")
+    assert canonicalize_link("https://example.com/a?scene=1&source=x&timestamp=3") == "https://example.com/a?scene=1&source=x&timestamp=3"
+    assert canonicalize_link("http://example.com/a") == "http://example.com/a"
+    assert canonicalize_link("") is None
+
+
+def test_filter_skips_published_content_by_link_or_hash(tmp_path):
+    index = ContentDedupIndex(str(tmp_path / "dedup.sqlite3"))
+    index.add("doc", [_content("Old", "https://example.com/old"), _content("Same text", None, ["point"])])
+
+    fresh, skipped = index.filter("doc", [
+        _content("Renamed", "https://example.com/old?utm_medium=feed"),
+        _content("  same   TEXT ", "https://example.com/other", ["point"]),
+        _content("New", "https://example.com/new"),
+        _content("New again", "https://example.com/new#comments"),
+    ])
+    assert [content["title"] for content in fresh] == ["New"]
+    assert len(skipped) == 3
+    assert index.stats()["skipped"] == 3
+    # 其他文档不受影响
+    assert index.filter("other", [_content("Old", "https://example.com/old")])[1] == []
+
+
+def test_index_persists_and_opens_lazily(tmp_path):
+    path = tmp_path / "data" / "dedup.sqlite3"
+    index = ContentDedupIndex(str(path))
+    assert not path.exists()
+    index.add("doc", [_content("Title", "https://example.com/a")])
+    assert path.exists()
+
+    reopened = ContentDedupIndex(str(path))
+    assert reopened.filter("doc", [_content("Other", "https://example.com/a")])[0] == []
+
+
+def test_seed_and_invalidate(tmp_path):
+    index = ContentDedupIndex(str(tmp_path / "dedup.sqlite3"))
+    assert not index.is_seeded("doc")
+    assert index.seed("doc", _document(("Existing", "https://example.com/existing"))) == 1
+    assert index.is_seeded("doc")
+    assert index.filter("doc", [_content("Changed title", "https://example.com/existing")])[0] == []
+
+    assert index.invalidate("doc") == 2
+    assert not index.is_seeded("doc")
+    assert not ContentDedupIndex(index.path).is_seeded("doc")
+    fresh, _ = index.filter("doc", [_content("Changed title", "https://example.com/existing")])
+    assert len(fresh) == 1
@@ -0,0 +1,46 @@
+# file name: test_credentials.py
+import pytest
+
+from api.app.utils.credentials import CredentialStore, MissingCredentials
+
+
+def test_env_app_is_stored_as_a_reference(monkeypatch):
+    monkeypatch.setenv("FEISHU_APP_ID", "env_app")
+    monkeypatch.setenv("FEISHU_APP_SECRET", "env_secret")
+    store = CredentialStore()
+
+    credential = store.seal("env_app", "env_secret")
+
+    assert credential == {"source": "env"}
+    assert store.unseal("env_app", credential) == "env_secret"
+    # 早期版本提交的任务没有凭证引用，仍然可以使用环境变量中的凭证
+    assert store.unseal("env_app", None) == "env_secret"
+
+
+def test_secret_that_cannot_survive_a_restart_is_rejected(monkeypatch):
+    monkeypatch.setenv("FEISHU_APP_ID", "env_app")
+    monkeypatch.setenv("FEISHU_APP_SECRET", "env_secret")
+    store = CredentialStore()
+
+    with pytest.raises(MissingCredentials):
+        store.seal("other_app", "secret")
+    # 与环境变量中不同的 App Secret 不能用环境变量代替
+    with pytest.raises(MissingCredentials):
+        store.seal("env_app", "rotated_secret")
+    with pytest.raises(MissingCredentials):
+        store.unseal("other_app", None)
+
+
+def test_secret_is_encrypted_with_the_configured_key():
+    pytest.importorskip("cryptography")
+    store = CredentialStore("key")
+
+    credential = store.seal("app", "secret")
+
+    assert credential["source"] == "encrypted" and "secret" not in credential["token"]
+    # 服务重启后使用相同的密钥可以解密
+    assert CredentialStore("key").unseal("app", credential) == "secret"
+    with pytest.raises(MissingCredentials):
+        CredentialStore("another key").unseal("app", credential)
+    with pytest.raises(MissingCredentials):
+        CredentialStore().unseal("app", credential)
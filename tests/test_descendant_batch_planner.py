@@ -0,0 +1,100 @@
+# file name: test_descendant_batch_planner.py
+import pytest
+
+from api.app.handlers.feishu_docx_api_handler_async import DescendantBatchPlanner
+from tests.blocks import text_block
+
+
+def tree(shape, prefix="b"):
+    """
+    :param shape: 嵌套列表，每项为 0（没有子块）或子块的 shape，如 [0, [0, 0], 0]
+    :return: (children_ids, descendants)
+    """
+    descendants = []
+
+    def build(items, path):
+        ids = []
+        for i, item in enumerate(items):
+            block_id = f"{path}_{i}"
+            children = build(item, block_id) if isinstance(item, list) else []
+            descendants.append(text_block(block_id, block_id, children=children))
+            ids.append(block_id)
+        return ids
+
+    return build(shape, prefix), descendants
+
+
+def replay(batches, parent_id, max_blocks):
+    """
+    按顺序执行请求计划，检查每个请求都是合法的，返回写入后每个块的子块列表
+    """
+    created = {parent_id: []}
+    for batch in batches:
+        assert batch["parent"] in created, "父块必须已经存在"
+        assert 0 < len(batch["descendants"]) <= max_blocks
+        in_batch = {block["block_id"]: block for block in batch["descendants"]}
+        reachable, stack = set(), list(batch["children_ids"])
+        while stack:
+            block_id = stack.pop()
+            reachable.add(block_id)
+            stack.extend(in_batch[block_id].get("children") or [])
+        assert reachable == set(in_batch), "请求中的块必须组成以 children_ids 为根的完整子树"
+        siblings = created[batch["parent"]]
+        index = len(siblings) if batch["index"] == -1 else batch["index"]
+        assert index <= len(siblings)
+        siblings[index:index] = batch["children_ids"]
+        for block_id, block in in_batch.items():
+            assert block_id not in created
+            created[block_id] = list(block.get("children") or [])
+    return created
+
+
+def expected(children_ids, descendants, parent_id):
+    result = {block["block_id"]: list(block.get("children") or []) for block in descendants}
+    result[parent_id] = list(children_ids)
+    return result
+
+
+def test_small_tree_is_one_request():
+    children_ids, descendants = tree([0, [0, 0], 0])
+    batches = DescendantBatchPlanner(children_ids, descendants, max_blocks=10).plan("doc", 3)
+
+    assert len(batches) == 1
+    assert batches[0]["parent"] == "doc" and batches[0]["index"] == 3
+    assert batches[0]["children_ids"] == children_ids
+
+
+def test_siblings_are_packed_into_full_requests_with_advancing_index():
+    children_ids, descendants = tree([[0, 0]] * 5)
+    batches = DescendantBatchPlanner(children_ids, descendants, max_blocks=7).plan("doc", 0)
+
+    assert [len(batch["descendants"]) for batch in batches] == [6, 6, 3]
+    assert [batch["index"] for batch in batches] == [0, 2, 4]
+    assert replay(batches, "doc", 7) == expected(children_ids, descendants, "doc")
+
+
+@pytest.mark.parametrize("shape", [
+    [[0] * 25],                        # 一个块的子块超过上限
+    [0, [[0] * 6, [0, [0] * 9]], 0],   # 多层嵌套的大子树
+    [[[[[[0] * 4]]]]],                 # 深层链
+])
+def test_oversized_subtrees_are_continued_under_their_temporary_id(shape):
+    children_ids, descendants = tree(shape)
+    batches = DescendantBatchPlanner(children_ids, descendants, max_blocks=4).plan("doc", 0)
+
+    assert len(batches) > 1
+    assert replay(batches, "doc", 4) == expected(children_ids, descendants, "doc")
+
+
+def test_append_keeps_index_at_end():
+    children_ids, descendants = tree([0] * 5)
+    batches = DescendantBatchPlanner(children_ids, descendants, max_blocks=2).plan("doc", -1)
+
+    assert [batch["index"] for batch in batches] == [-1, -1, -1]
+    assert [batch["children_ids"] for batch in batches] == [children_ids[:2], children_ids[2:4], children_ids[4:]]
+
+
+def test_missing_child_is_rejected():
+    descendants = [text_block("a", "a", children=["missing"])]
+    with pytest.raises(ValueError):
+        DescendantBatchPlanner(["a"], descendants)
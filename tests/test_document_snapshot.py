@@ -0,0 +1,128 @@
+# file name: test_document_snapshot.py
+import asyncio
+
+from api.app.handlers.feishu_docx_api_handler_async import BlockType
+from api.app.handlers.feishu_document_snapshot import DocumentSnapshotCache
+from api.app.utils.feishu_app_api_async import FeishuDocxAPI
+from tests.blocks import page, text_block
+
+
+class _DocxHandler:
+    FEISHU_APP_ID = "app"
+
+    def __init__(self, revision_id=1):
+        self.revision_id = revision_id
+        self.info_calls = 0
+        self.block_loads = 0
+
+    async def get_document_info(self, document_id, use_cache=True):
+        # 核对版本不能使用缓存的文档信息
+        assert use_cache is False
+        self.info_calls += 1
+        return {"code": 0, "data": {"document": {"document_id": document_id, "revision_id": self.revision_id}}}
+
+    async def get_document_block_map(self, document_id, document_revision_id=-1):
+        self.block_loads += 1
+        await asyncio.sleep(0.01)
+        blocks = [page(document_id, ["h1"]), text_block("h1", "每日推荐", BlockType.HEADING1, document_id)]
+        return {block["block_id"]: block for block in blocks}
+
+
+def _created(revision_id, relations):
+    return {"code": 0, "data": {
+        "document_revision_id": revision_id,
+        "children": [text_block(real_id, "新内容", BlockType.TEXT, "doc") for _, real_id in relations],
+        "block_id_relations": [{"temporary_block_id": temp, "block_id": real} for temp, real in relations],
+    }}
+
+
+def test_snapshot_is_reused_until_it_needs_validation():
+    cache = DocumentSnapshotCache(validate_after=60)
+    handler = _DocxHandler()
+
+    async def main():
+        first = await cache.get_tree(handler, "doc")
+        second = await cache.get_tree(handler, "doc")
+        return first, second
+
+    first, second = asyncio.run(main())
+    assert first is second and first.revision_id == 1
+    assert handler.block_loads == 1 and handler.info_calls == 1
+    assert cache.stats()["hits"] == 1
+
+
+def test_stale_snapshot_is_validated_and_reloaded_after_foreign_edits():
+    cache = DocumentSnapshotCache(validate_after=0)
+    handler = _DocxHandler()
+
+    async def main():
+        first = await cache.get_tree(handler, "doc")
+        validated = await cache.get_tree(handler, "doc")
+        handler.revision_id = 5
+        reloaded = await cache.get_tree(handler, "doc")
+        return first, validated, reloaded
+
+    first, validated, reloaded = asyncio.run(main())
+    assert validated is first
+    assert reloaded is not first and reloaded.revision_id == 5
+    assert handler.block_loads == 2
+    assert cache.stats()["validated"] == 1 and cache.stats()["invalidated"] == 1
+
+
+def test_concurrent_loads_are_coalesced():
+    cache = DocumentSnapshotCache()
+    handler = _DocxHandler()
+
+    async def main():
+        return await asyncio.gather(*(cache.get_tree(handler, "doc") for _ in range(5)))
+
+    trees = asyncio.run(main())
+    assert all(tree is trees[0] for tree in trees)
+    assert handler.block_loads == 1
+
+
+def test_own_writes_patch_the_snapshot_and_foreign_writes_invalidate_it():
+    cache = DocumentSnapshotCache()
+    handler = _DocxHandler()
+    tree = asyncio.run(cache.get_tree(handler, "doc"))
+
+    cache.apply_create_descendant_blocks("app", "doc", "doc", 1, ["tmp"], _created(2, [("tmp", "real")]))
+    assert tree.revision_id == 2
+    assert [block["block_id"] for block in tree.children("doc")] == ["h1", "real"]
+    assert cache.stats()["patched"] == 1
+
+    # 版本号跳变说明文档被其他人修改过
+    cache.apply_create_descendant_blocks("app", "doc", "doc", 1, ["tmp2"], _created(4, [("tmp2", "real2")]))
+    assert cache.stats()["documents"] == 0
+    assert "real2" not in tree
+
+
+def test_least_recently_used_document_is_evicted():
+    cache = DocumentSnapshotCache(max_documents=2)
+    handler = _DocxHandler()
+
+    async def main():
+        for document_id in ("a", "b", "a", "c"):
+            await cache.get_tree(handler, document_id)
+
+    asyncio.run(main())
+    assert set(key[1] for key in cache._entries) == {"a", "c"}
+
+
+def test_revision_check_bypasses_the_cached_document_info(monkeypatch):
+    api = FeishuDocxAPI("token", "app_bypass")
+    revisions = iter([1, 2])
+
+    async def request(method, url, **kwargs):
+        return {"code": 0, "data": {"document": {"revision_id": next(revisions)}}}
+
+    monkeypatch.setattr(api, "_request", request)
+
+    def revision(use_cache=True):
+        return asyncio.run(api.get_document_info("doc", use_cache))["data"]["document"]["revision_id"]
+
+    assert revision() == 1
+    assert revision() == 1
+    # 跳过缓存时拿到最新的版本，并刷新缓存
+    assert revision(use_cache=False) == 2
+    assert revision() == 2
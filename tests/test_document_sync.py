@@ -0,0 +1,160 @@
+# file name: test_document_sync.py
+import asyncio
+import copy
+
+from api.app.handlers.feishu_docx_api_handler_async import BlockType
+from api.app.handlers.feishu_document_sync import DocumentSyncEngine
+from api.app.handlers.feishu_document_tree import DocumentTree
+from tests.blocks import page, text_block
+
+
+def callout(block_id, children, parent_id=None, emoji_id="fire"):
+    block = {
+        "block_id": block_id,
+        "block_type": BlockType.CALLOUT.position,
+        "callout": {"background_color": 1, "border_color": 2, "emoji_id": emoji_id},
+        "children": list(children)
+    }
+    if parent_id is not None:
+        block["parent_id"] = parent_id
+    return block
+
+
+def live_tree():
+    # doc
+    # ├── h "标题"
+    # ├── c (callout) ── t "第一条" / b "要点"
+    # └── p "结尾"
+    return DocumentTree([
+        page("doc", ["h", "c", "p"]),
+        text_block("h", "标题", BlockType.HEADING2, "doc"),
+        callout("c", ["t", "b"], "doc"),
+        text_block("t", "第一条", BlockType.HEADING2, "c"),
+        text_block("b", "要点", BlockType.BULLET, "c"),
+        text_block("p", "结尾", BlockType.TEXT, "doc"),
+    ], "doc")
+
+
+def target(heading="标题", title="第一条", bullet="要点", ending="结尾", extra=None, emoji_id="star"):
+    # 目标块树使用临时 ID，callout 的颜色和表情每次随机生成
+    descendants = [
+        text_block("new_h", heading, BlockType.HEADING2),
+        callout("new_c", ["new_t", "new_b"], emoji_id=emoji_id),
+        text_block("new_t", title, BlockType.HEADING2),
+        text_block("new_b", bullet, BlockType.BULLET),
+        text_block("new_p", ending, BlockType.TEXT),
+    ]
+    children_ids = ["new_h", "new_c", "new_p"]
+    if extra is not None:
+        index, block = extra
+        descendants.append(block)
+        children_ids.insert(index, block["block_id"])
+    return children_ids, descendants
+
+
+def replay(tree, operations):
+    """
+    在块树的副本上执行操作，返回 (块字典, 根块的子块)
+    """
+    blocks = copy.deepcopy(tree.blocks)
+    for operation in operations:
+        if operation["op"] == "update":
+            name = BlockType.get_string_by_position(blocks[operation["block_id"]]["block_type"])
+            blocks[operation["block_id"]][name]["elements"] = operation["elements"]
+        elif operation["op"] == "delete":
+            del blocks[operation["parent"]]["children"][operation["start"]:operation["end"]]
+        else:
+            blocks[operation["parent"]]["children"][operation["index"]:operation["index"]] = operation["children_ids"]
+            blocks.update({block["block_id"]: block for block in operation["descendants"]})
+    return blocks, blocks["doc"]["children"]
+
+
+def outline(blocks, children_ids):
+    return [
+        (blocks[block_id]["block_type"], DocumentTree.text_of(blocks[block_id]), outline(blocks, blocks[block_id].get("children") or []))
+        for block_id in children_ids
+    ]
+
+
+def test_unchanged_content_needs_no_operations():
+    # 块 ID 和 callout 的随机样式不同，内容相同
+    assert DocumentSyncEngine(None, live_tree()).plan("doc", *target()) == []
+
+
+def test_text_change_is_an_in_place_update_of_the_live_block():
+    operations = DocumentSyncEngine(None, live_tree()).plan("doc", *target(bullet="新要点"))
+
+    assert [(operation["op"], operation.get("block_id")) for operation in operations] == [("update", "b")]
+    assert operations[0]["elements"][0]["text_run"]["content"] == "新要点"
+
+
+def test_insertion_creates_only_the_new_block():
+    children_ids, descendants = target(extra=(2, text_block("new_x", "插入", BlockType.TEXT)))
+    operations = DocumentSyncEngine(None, live_tree()).plan("doc", children_ids, descendants)
+
+    assert len(operations) == 1
+    assert operations[0]["op"] == "create"
+    assert (operations[0]["parent"], operations[0]["index"], operations[0]["children_ids"]) == ("doc", 2, ["new_x"])
+
+
+def test_type_change_replaces_the_block():
+    children_ids, descendants = target()
+    descendants[-1] = text_block("new_p", "结尾", BlockType.BULLET)
+    operations = DocumentSyncEngine(None, live_tree()).plan("doc", children_ids, descendants)
+
+    assert [operation["op"] for operation in operations] == ["delete", "create"]
+    assert (operations[0]["start"], operations[0]["end"]) == (2, 3)
+    assert operations[1]["index"] == 2
+
+
+def test_replaying_the_plan_produces_the_target():
+    tree = live_tree()
+    children_ids, descendants = target(heading="新标题", title="新的第一条", ending="新结尾",
+                                       extra=(1, text_block("new_x", "插入", BlockType.BULLET)))
+    descendants[0] = text_block("new_h", "新标题", BlockType.HEADING1)
+
+    blocks, root = replay(tree, DocumentSyncEngine(None, tree).plan("doc", children_ids, descendants))
+
+    target_blocks = {block["block_id"]: block for block in descendants}
+    assert outline(blocks, root) == outline(target_blocks, children_ids)
+
+
+def test_sync_range_leaves_other_blocks_untouched():
+    # 只同步 [1, 2)，即 callout；标题和结尾的差异不在范围内
+    children_ids, descendants = target(heading="不同的标题", title="新的第一条", ending="不同的结尾")
+    operations = DocumentSyncEngine(None, live_tree()).plan("doc", ["new_c"], descendants, start_index=1, end_index=2)
+
+    assert [(operation["op"], operation.get("block_id")) for operation in operations] == [("update", "t")]
+
+
+class _DocxHandler:
+    def __init__(self):
+        self.calls = []
+
+    async def batch_update_blocks_planned(self, document_id, requests_list):
+        self.calls.append(("update", [request["block_id"] for request in requests_list]))
+        return {"code": 0, "data": {"requests": 1}}
+
+    async def delete_block(self, document_id, block_id, start_index, end_index):
+        self.calls.append(("delete", block_id, start_index, end_index))
+        return {"code": 0}
+
+    async def create_descendant_blocks_chunked(self, document_id, block_id, children_ids, descendants, index, on_batch=None):
+        self.calls.append(("create", block_id, index, list(children_ids)))
+        return {"code": 0, "data": {"requests": 1}}
+
+
+def test_apply_batches_updates_before_structural_changes():
+    handler = _DocxHandler()
+    children_ids, descendants = target(title="新的第一条", bullet="新要点")
+    descendants[-1] = text_block("new_p", "结尾", BlockType.BULLET)
+
+    result = asyncio.run(DocumentSyncEngine(handler, live_tree()).sync("doc", "doc", children_ids, descendants))
+
+    # 文本更新合并为一次批量更新，在删除和创建之前执行
+    assert handler.calls[0][0] == "update" and sorted(handler.calls[0][1]) == ["b", "t"]
+    assert handler.calls[1:] == [
+        ("delete", "doc", 2, 3),
+        ("create", "doc", 2, ["new_p"]),
+    ]
+    assert result == {"code": 0, "msg": "success", "data": {"requests": 3, "created": 1, "updated": 2, "deleted": 1}}
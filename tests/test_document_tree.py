@@ -0,0 +1,88 @@
+# file name: test_document_tree.py
+import re
+
+import pytest
+
+from api.app.handlers.feishu_docx_api_handler_async import BlockType
+from api.app.handlers.feishu_document_tree import DocumentTree
+from tests.blocks import page, text_block
+
+
+def _tree():
+    # doc
+    # ├── h1 "每日推荐"
+    # ├── list "父项" ── item "子项 Alpha"
+    # └── p "结尾 alpha"
+    return DocumentTree([
+        page("doc", ["h1", "list", "p"]),
+        text_block("h1", "每日推荐", BlockType.HEADING1, "doc"),
+        text_block("list", "父项", BlockType.BULLET, "doc", ["item"]),
+        text_block("item", "子项 Alpha", BlockType.BULLET, "list"),
+        text_block("p", "结尾 alpha", BlockType.TEXT, "doc"),
+    ], "doc", revision_id=3)
+
+
+def test_lookups_use_the_index():
+    tree = _tree()
+    assert tree.parent_of("item") == "list"
+    assert tree.index_of("p") == 2
+    assert tree.insertion_point("list") == ("doc", 1)
+    assert [block["block_id"] for block in tree.walk()] == ["doc", "h1", "list", "item", "p"]
+    assert [block["block_id"] for block in tree.children("list")] == ["item"]
+    with pytest.raises(ValueError):
+        tree.insertion_point("missing")
+
+
+def test_find_by_text_and_type():
+    tree = _tree()
+    assert tree.find("每日推荐", BlockType.HEADING1) == "h1"
+    assert tree.find("每日推荐", BlockType.HEADING2) is None
+    assert [block["block_id"] for block in tree.find_all("项", BlockType.BULLET)] == ["list", "item"]
+    assert [block["block_id"] for block in tree.blocks_of_type(BlockType.BULLET.position)] == ["list", "item"]
+
+
+def test_search_runs_several_queries_in_one_pass():
+    tree = _tree()
+    alpha, bullets, first = tree.search([
+        {"text": "alpha", "ignore_case": True},
+        {"block_types": {BlockType.BULLET.position}, "pattern": re.compile("项")},
+        {"limit": 1, "block_types": {BlockType.TEXT.position, BlockType.BULLET.position}},
+    ])
+    assert [(match["block_id"], match["path"]) for match in alpha] == [("item", ["doc", "list"]), ("p", ["doc"])]
+    assert [match["block_id"] for match in bullets] == ["list", "item"]
+    assert [match["block_id"] for match in first] == ["list"]
+    assert first[0]["parent_id"] == "doc" and first[0]["index"] == 1
+
+
+def test_insert_blocks_updates_positions_in_place():
+    tree = _tree()
+    tree.blocks_of_type(BlockType.TEXT)
+    tree.insert_blocks("doc", 1, ["new"], [text_block("new", "新内容", BlockType.TEXT, "doc", ["new_child"]),
+                                           text_block("new_child", "子块", BlockType.TEXT, "new")])
+    assert [block["block_id"] for block in tree.children("doc")] == ["h1", "new", "list", "p"]
+    assert tree.index_of("list") == 2 and tree.parent_of("new_child") == "new"
+    assert [block["block_id"] for block in tree.blocks_of_type(BlockType.TEXT)] == ["new", "new_child", "p"]
+
+
+def test_delete_children_removes_whole_subtrees():
+    tree = _tree()
+    tree.delete_children("doc", 1, 2)
+    assert "list" not in tree and "item" not in tree
+    assert tree.index_of("p") == 1
+    assert tree.find("子项") is None
+
+
+def test_replace_blocks_keeps_children_missing_from_the_response():
+    tree = _tree()
+    tree.replace_blocks([text_block("list", "新父项", BlockType.BULLET, "doc")])
+    assert tree.text_of(tree.get("list")) == "新父项"
+    assert tree.get("list")["children"] == ["item"]
+
+
+def test_walk_handles_deep_trees_without_recursion():
+    depth = 5000
+    blocks = [page("doc", ["b0"])]
+    blocks += [text_block(f"b{i}", str(i), children=[f"b{i + 1}"] if i + 1 < depth else []) for i in range(depth)]
+    tree = DocumentTree(blocks, "doc")
+    assert sum(1 for _ in tree.walk()) == depth + 1
+    assert tree.parent_of(f"b{depth - 1}") == f"b{depth - 2}"
@@ -0,0 +1,60 @@
+# file name: test_feishu_http.py
+import requests
+from urllib3.exceptions import NewConnectionError, ProtocolError
+
+from api.app.utils import feishu_http
+
+
+class _Response:
+    status_code = 200
+    headers = {}
+
+
+class _Session:
+    def __init__(self, failures):
+        self.failures = list(failures)
+        self.calls = 0
+
+    def request(self, *args, **kwargs):
+        self.calls += 1
+        if self.failures:
+            raise self.failures.pop(0)
+        return _Response()
+
+
+def _patch(monkeypatch, session):
+    monkeypatch.setattr(feishu_http.session_pool, "get_session", lambda: session)
+    monkeypatch.setattr(feishu_http.retry_policy, "compute_delay", lambda *args: 0)
+    monkeypatch.setattr(feishu_http, "_decode", lambda response: {"code": 0})
+
+
+def test_refused_connection_is_a_connect_error():
+    try:
+        requests.post("http://127.0.0.1:1/", timeout=2)
+    except requests.RequestException as e:
+        assert feishu_http._is_connect_error(e)
+
+
+def test_errors_after_sending_are_not_connect_errors():
+    assert not feishu_http._is_connect_error(requests.exceptions.ReadTimeout())
+    assert not feishu_http._is_connect_error(requests.exceptions.ConnectionError(ProtocolError("reset")))
+
+
+def test_write_is_retried_when_connection_was_never_established(monkeypatch):
+    refused = requests.exceptions.ConnectionError(NewConnectionError(None, "refused"))
+    session = _Session([refused, refused])
+    _patch(monkeypatch, session)
+    assert feishu_http.request("POST", "http://feishu.test/x", data=b"{}") == {"code": 0}
+    assert session.calls == 3
+
+
+def test_write_is_not_retried_after_the_request_was_sent(monkeypatch):
+    session = _Session([requests.exceptions.ConnectionError(ProtocolError("reset"))])
+    _patch(monkeypatch, session)
+    try:
+        feishu_http.request("POST", "http://feishu.test/x", data=b"{}")
+    except requests.exceptions.ConnectionError:
+        pass
+    else:
+        raise AssertionError("写请求在发送后失败时不应重试")
+    assert session.calls == 1
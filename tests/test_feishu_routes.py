@@ -0,0 +1,78 @@
+# file name: test_feishu_routes.py
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from api.app.routes import feishu
+from api.app.utils.credentials import CredentialStore
+from api.app.utils.job_queue import JobQueue
+
+
+def _client():
+    app = FastAPI()
+    app.include_router(feishu.router)
+    return TestClient(app)
+
+
+def test_jobs_run_in_process_without_running_workers(monkeypatch):
+    # 没有通过 lifespan 启动 worker（如 Serverless 部署）时，任务在响应返回后于当前进程中执行，不写入任务队列
+    calls = []
+
+    async def handler(payload, job, report):
+        calls.append(payload)
+        return {"requests": 1}
+
+    monkeypatch.setitem(feishu.job_queue.handlers, "publish_markdown", handler)
+    response = _client().post("/publish_markdown", json={
+        "feishu_app_id": "app", "feishu_app_secret": "secret", "doc_id": "doc", "markdown": "# title"
+    }, headers={"Authorization": "Bearer test"})
+
+    assert response.status_code == 200
+    assert response.json()["status"] == "processing" and "job_id" not in response.json()
+    assert [(payload["doc_id"], payload["feishu_app_secret"]) for payload in calls] == [("doc", "secret")]
+    assert feishu.job_queue.counts() == {}
+
+
+def test_targets_wait_in_process_without_running_workers(monkeypatch):
+    async def handler(payload, job, report):
+        if payload["doc_id"] == "bad":
+            raise ValueError("写入失败")
+        return {"requests": 1}
+
+    monkeypatch.setitem(feishu.job_queue.handlers, "update_feishu_xiaobao", handler)
+    response = _client().post("/update_feishu_xiaobao_targets", json={
+        "feishu_app_id": "app", "feishu_app_secret": "secret", "date_str": "2024-01-01", "content_data": "**标题**",
+        "targets": [{"doc_id": "good", "target_block_id": "t"}, {"doc_id": "bad", "target_block_id": "t"}], "wait": True
+    }, headers={"Authorization": "Bearer test"})
+
+    body = response.json()
+    assert body["status"] == "partial_failure"
+    assert [(target["doc_id"], target["status"]) for target in body["targets"]] == [("good", "succeeded"), ("bad", "failed")]
+    assert feishu.job_queue.counts() == {}
+
+
+def test_queued_jobs_keep_a_credential_reference_instead_of_the_secret(monkeypatch, tmp_path):
+    monkeypatch.setattr(feishu.job_workers, "_workers", [object()])
+    monkeypatch.setattr(feishu, "job_queue", JobQueue(str(tmp_path / "jobs.sqlite3")))
+    monkeypatch.setattr(feishu, "app_credentials", CredentialStore())
+    monkeypatch.setenv("FEISHU_APP_ID", "env_app")
+    monkeypatch.setenv("FEISHU_APP_SECRET", "env_secret")
+    body = {"doc_id": "doc_credentials", "markdown": "# title"}
+
+    # 没有加密密钥时，服务重启后无法取回的凭证不被接收
+    response = _client().post("/publish_markdown", json={**body, "feishu_app_id": "app", "feishu_app_secret": "secret"},
+                              headers={"Authorization": "Bearer test"})
+    assert response.status_code == 400
+
+    response = _client().post("/publish_markdown", json={**body, "feishu_app_id": "env_app", "feishu_app_secret": "env_secret"},
+                              headers={"Authorization": "Bearer test"})
+    job = feishu.job_queue.get(response.json()["job_id"])
+    assert job["payload"]["credential"] == {"source": "env"} and "feishu_app_secret" not in job["payload"]
+    assert feishu._app_secret(job["payload"]) == "env_secret"
+
+
+def test_invalidate_published_content():
+    feishu.content_dedup.add("doc_invalidate", [{"title": "Title", "bullets": [], "link": "https://example.com/a"}])
+    response = _client().delete("/published_content/doc_invalidate", headers={"Authorization": "Bearer test"})
+    assert response.status_code == 200
+    assert response.json()["removed_keys"] == 2
+    assert feishu.content_dedup.filter("doc_invalidate", [{"title": "Title", "bullets": [], "link": None}])[1] == []
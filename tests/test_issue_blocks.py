@@ -0,0 +1,110 @@
+# file name: test_issue_blocks.py
+import asyncio
+
+from api.app.handlers.feishu_docx_api_handler_async import BlockFactory, BlockType
+from api.app.handlers.feishu_document_tree import DocumentTree
+from api.app.routes import feishu
+from api.app.routes.feishu import FeishuDocxContentManager
+from api.app.utils.content_dedup import ContentDedupIndex
+from api.app.utils.job_queue import WRITING
+from tests.blocks import page, text_block
+
+CONTENTS = [
+    {"title": "第一条", "bullets": ["要点 1", "", "要点 2"], "link": "https://example.com/1"},
+    {"title": "第二条", "bullets": [], "link": None},
+]
+
+
+def test_issue_is_one_tree_with_a_callout_per_content():
+    children_ids, descendants = BlockFactory.create_issue_blocks("2024-01-01", CONTENTS, [(1, 2, "fire"), (3, 4, "star")])
+    by_id = {block["block_id"]: block for block in descendants}
+
+    assert len(by_id) == len(descendants)
+    assert children_ids == ["date_heading", "callout_1", "callout_2"]
+    assert all(child in by_id for block in descendants for child in block.get("children", []))
+    assert by_id["date_heading"]["heading2"]["elements"][0]["text_run"]["content"] == "2024-01-01"
+    assert by_id["callout_2"]["callout"] == {"background_color": 3, "border_color": 4, "emoji_id": "star"}
+    # 空要点被忽略，没有链接时不生成链接块
+    assert [by_id[child]["block_type"] for child in by_id["callout_1"]["children"]] == [
+        BlockType.HEADING2.position, BlockType.BULLET.position, BlockType.BULLET.position, BlockType.TEXT.position
+    ]
+    assert len(by_id["callout_2"]["children"]) == 1
+
+
+class _Snapshots:
+    """
+    目标块位于第二个位置的文档快照
+    """
+
+    def __init__(self):
+        self.tree = DocumentTree([
+            page("doc", ["intro", "target"]),
+            text_block("intro", "简介", parent_id="doc"),
+            text_block("target", "目标", parent_id="doc"),
+        ], "doc", revision_id=1)
+
+    async def get_tree(self, docx_handler, document_id, *args, **kwargs):
+        return self.tree
+
+
+class _DocxHandler:
+    FEISHU_APP_ID = "app"
+
+    def __init__(self):
+        self.calls = []
+
+    async def create_descendant_blocks_chunked(self, document_id, block_id, children_ids, descendants, index=0, on_batch=None, **kwargs):
+        self.calls.append((block_id, list(children_ids), len(descendants), index))
+        relations = [{"temporary_block_id": block["block_id"], "block_id": "real_" + block["block_id"]} for block in descendants]
+        if on_batch is not None:
+            on_batch({"request": 1, "blocks": len(descendants), "latency_ms": 1, "code": 0, "block_id_relations": relations})
+        return {"code": 0, "data": {"requests": 1, "document_revision_id": 2, "block_id_relations": relations}}
+
+
+def _manager(monkeypatch, tmp_path):
+    manager = FeishuDocxContentManager("app", "secret")
+    manager.docx_handler = _DocxHandler()
+
+    async def initialize():
+        pass
+
+    monkeypatch.setattr(manager, "initialize", initialize)
+    monkeypatch.setattr(feishu, "document_snapshots", _Snapshots())
+    monkeypatch.setattr(feishu, "content_dedup", ContentDedupIndex(str(tmp_path / "dedup.sqlite3")))
+    return manager
+
+
+def test_issue_is_written_after_the_target_in_one_request(monkeypatch, tmp_path):
+    manager = _manager(monkeypatch, tmp_path)
+
+    assert asyncio.run(manager.add_content_blocks("issue_doc", "target", "2024-01-01", CONTENTS)) is True
+    assert manager.docx_handler.calls == [("doc", ["date_heading", "callout_1", "callout_2"], 8, 2)]
+
+
+def test_publish_issue_reports_each_callout(monkeypatch, tmp_path):
+    manager = _manager(monkeypatch, tmp_path)
+    events = []
+
+    result = asyncio.run(manager.publish_issue("progress_doc", "target", "2024-01-02", CONTENTS, lambda *event: events.append(event)))
+
+    # 写入前先报告 WRITING，之后的失败不会被自动重试
+    assert events[0] == (WRITING,)
+    assert result["block_ids"] == ["real_date_heading", "real_callout_1", "real_callout_2"]
+    # 后面的内容显示在上方：callout_1 对应最后一条内容
+    callouts = {event[1]["callout"]: event[1]["title"] for event in events if event[0] == "callout"}
+    assert callouts == {1: "第二条", 2: "第一条"}
+
+
+def test_published_contents_are_skipped(monkeypatch, tmp_path):
+    manager = _manager(monkeypatch, tmp_path)
+
+    first = asyncio.run(manager.publish_issue("doc", "target", "2024-01-03", CONTENTS[:1]))
+    second = asyncio.run(manager.publish_issue("doc", "target", "2024-01-04", CONTENTS))
+
+    assert (first["skipped"], second["skipped"]) == (0, 1)
+    # 第二次只写入没有发布过的内容；全部发布过时不写入
+    assert asyncio.run(manager.add_content_blocks("doc", "target", "2024-01-05", CONTENTS)) is True
+    assert [call[2] for call in manager.docx_handler.calls] == [6, 3]
+    # 关闭去重时全部写入
+    asyncio.run(manager.publish_issue("doc", "target", "2024-01-06", CONTENTS, skip_published=False))
+    assert [call[2] for call in manager.docx_handler.calls] == [6, 3, 8]
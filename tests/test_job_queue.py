@@ -0,0 +1,248 @@
+# file name: test_job_queue.py
+import asyncio
+import os
+import subprocess
+import sys
+import threading
+import time
+
+from api.app.utils.job_queue import (
+    JobAborted, JobQueue, JobWorkerPool, FAILED, QUEUED, RUNNING, SUCCEEDED, WRITING
+)
+from api.app.utils.write_scheduler import DocumentWriteScheduler
+
+
+def _queue(tmp_path, **kwargs):
+    kwargs.setdefault("retry_base_delay", 0)
+    return JobQueue(str(tmp_path / "jobs.sqlite3"), **kwargs)
+
+
+def test_database_is_opened_on_first_use(tmp_path):
+    path = tmp_path / "data" / "jobs.sqlite3"
+    queue = JobQueue(str(path))
+    assert not path.exists()
+    queue.enqueue("publish", {})
+    assert path.exists()
+    assert oct(os.stat(path).st_mode & 0o777) == "0o600"
+
+
+def test_import_does_not_create_database(tmp_path):
+    repo = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = {**os.environ, "PYTHONPATH": repo}
+    env.pop("FEISHU_DATA_DIR", None)
+    subprocess.run([sys.executable, "-c", "import api.app.utils.job_queue"], cwd=tmp_path, env=env, check=True)
+    assert not (tmp_path / "feishu_jobs.sqlite3").exists()
+
+
+def test_secret_is_not_stored(tmp_path):
+    queue = _queue(tmp_path)
+    job_id = queue.enqueue("publish", {"feishu_app_id": "app", "feishu_app_secret": "secret", "doc_id": "doc"})
+    assert queue.get(job_id)["payload"] == {"feishu_app_id": "app", "doc_id": "doc"}
+    with open(queue.path, "rb") as f:
+        assert b"secret" not in f.read()
+
+
+def test_failed_job_is_retried_until_max_attempts(tmp_path):
+    queue = _queue(tmp_path)
+    job_id = queue.enqueue("publish", {}, max_attempts=2)
+    assert queue.fail(queue.claim(), "boom") == QUEUED
+    job = queue.claim()
+    assert job["id"] == job_id and job["attempts"] == 2
+    assert queue.fail(job, "boom") == FAILED
+    assert [event["type"] for event in queue.events(job_id)] == [QUEUED, RUNNING, "retrying", RUNNING, FAILED]
+
+
+def test_job_that_started_writing_is_not_retried(tmp_path):
+    queue = _queue(tmp_path)
+    job_id = queue.enqueue("publish", {}, max_attempts=3)
+    job = queue.claim()
+    queue.reporter(job_id)(WRITING)
+    assert queue.fail(job, "boom") == FAILED
+    assert "不再自动重试" in queue.get(job_id)["last_error"]
+
+
+def test_aborted_job_is_not_retried(tmp_path):
+    queue = _queue(tmp_path)
+    queue.enqueue("publish", {}, max_attempts=3)
+    assert queue.fail(queue.claim(), "missing credentials", retry=False) == FAILED
+
+
+def test_recover_requeues_only_jobs_without_writes(tmp_path):
+    queue = _queue(tmp_path)
+    clean = queue.enqueue("publish", {})
+    partial = queue.enqueue("publish", {})
+    queue.claim()
+    queue.claim()
+    queue.reporter(partial)(WRITING)
+
+    assert queue.recover() == (1, 1)
+    assert queue.get(clean)["status"] == QUEUED
+    assert queue.get(partial)["status"] == FAILED
+    assert queue.events(partial)[-1]["type"] == FAILED
+
+
+def test_claim_respects_per_app_running_cap(tmp_path):
+    queue = _queue(tmp_path, max_running_per_app=1)
+    queue.enqueue("publish", {}, app_id="a")
+    queue.enqueue("publish", {}, app_id="a")
+    other = queue.enqueue("publish", {}, app_id="b")
+    assert queue.claim()["app_id"] == "a"
+    assert queue.claim()["id"] == other
+    assert queue.claim() is None
+
+
+def test_purge_removes_finished_jobs_and_events(tmp_path):
+    queue = _queue(tmp_path, retention=60)
+    old = queue.enqueue("publish", {})
+    queue.complete(queue.claim()["id"])
+    pending = queue.enqueue("publish", {})
+    with queue._lock:
+        queue._db().execute("UPDATE jobs SET updated_at = ?", (time.time() - 120,))
+
+    assert queue.purge() == 1
+    assert queue.get(old) is None
+    assert queue.events(old) == []
+    assert queue.get(pending)["status"] == QUEUED
+    assert queue.purge(older_than=0) == 0
+
+
+def test_worker_pool_runs_jobs_and_aborts_without_retry(tmp_path):
+    queue = _queue(tmp_path)
+
+    async def succeed(payload, job, report):
+        report("progress", {"n": 1})
+        return {"ok": payload["n"]}
+
+    async def abort(payload, job, report):
+        raise JobAborted("no credentials")
+
+    queue.register("succeed", succeed)
+    queue.register("abort", abort)
+    ok = queue.enqueue("succeed", {"n": 1})
+    aborted = queue.enqueue("abort", {}, max_attempts=3)
+
+    async def main():
+        pool = JobWorkerPool(queue, concurrency=2, poll_interval=0.01)
+        assert not pool.running
+        await pool.start()
+        assert pool.running
+        results = await asyncio.gather(queue.wait(ok, 2), queue.wait(aborted, 2))
+        await pool.stop()
+        assert not pool.running
+        return results
+
+    done, failed = asyncio.run(main())
+    assert done["status"] == SUCCEEDED and done["result"] == {"ok": 1}
+    assert failed["status"] == FAILED and failed["attempts"] == 1
+
+
+def test_progress_events_are_written_off_the_event_loop_in_order(tmp_path, monkeypatch):
+    queue = _queue(tmp_path)
+    record = queue._record
+    writers = set()
+
+    def tracking_record(job_id, event_type, data=None):
+        if event_type in ("progress", WRITING):
+            writers.add(threading.current_thread().name)
+        return record(job_id, event_type, data)
+
+    monkeypatch.setattr(queue, "_record", tracking_record)
+
+    async def write(payload, job, report):
+        for n in range(5):
+            assert report("progress", {"n": n}) is None
+        assert report(WRITING)["type"] == WRITING
+        report("progress", {"n": 5})
+        return {}
+
+    queue.register("write", write)
+    job_id = queue.enqueue("write", {})
+
+    async def main():
+        stream = queue.events_hub.subscribe(job_id)
+        pool = JobWorkerPool(queue, concurrency=1, poll_interval=0.01)
+        await pool.start()
+        await queue.wait(job_id, 2)
+        await pool.stop()
+        received = []
+        while not stream.empty():
+            received.append(stream.get_nowait()["type"])
+        return received
+
+    received = asyncio.run(main())
+    expected = [RUNNING] + ["progress"] * 5 + [WRITING, "progress", SUCCEEDED]
+    assert [event["type"] for event in queue.events(job_id)][1:] == expected
+    assert received == expected
+    assert [event["data"]["n"] for event in queue.events(job_id) if event["type"] == "progress"] == list(range(6))
+    assert writers and all(name.startswith("job-events") for name in writers)
+
+
+def test_stopping_the_pool_cancels_scheduled_writes(tmp_path):
+    queue = _queue(tmp_path)
+    scheduler = DocumentWriteScheduler()
+    state = {}
+
+    async def write(payload, job, report):
+        state["started"] = True
+        try:
+            await asyncio.sleep(10)
+        finally:
+            state["finished"] = True
+
+    queue.register("write", write)
+    job_id = queue.enqueue("write", {}, document_id="doc")
+
+    async def main():
+        pool = JobWorkerPool(queue, concurrency=1, poll_interval=0.01, scheduler=scheduler)
+        await pool.start()
+        await asyncio.sleep(0.05)
+        await pool.stop()
+        # 停止后写任务已经结束，不会在连接池关闭后继续执行
+        assert state == {"started": True, "finished": True}
+
+    asyncio.run(main())
+    assert queue.get(job_id)["status"] == RUNNING
+    assert queue.recover() == (1, 0)
+
+
+def test_claim_skips_busy_documents(tmp_path):
+    queue = _queue(tmp_path, max_running_per_app=2)
+    first = queue.enqueue("publish", {}, app_id="a", document_id="doc1")
+    queue.enqueue("publish", {}, app_id="a", document_id="doc1")
+    other = queue.enqueue("publish", {}, app_id="a", document_id="doc2")
+    assert queue.claim()["id"] == first
+    assert queue.claim({"doc1"})["id"] == other
+    assert queue.claim({"doc1", "doc2"}) is None
+
+
+def test_fan_out_runs_documents_concurrently(tmp_path):
+    # 同一文档排队的任务不占用单应用执行上限：两个文档各两个任务，应始终有两个文档在并行写入
+    queue = _queue(tmp_path, max_running_per_app=2)
+    active = {"now": set(), "max": 0}
+    order = []
+
+    async def write(payload, job, report):
+        assert job["document_id"] not in active["now"]
+        active["now"].add(job["document_id"])
+        active["max"] = max(active["max"], len(active["now"]))
+        order.append(payload["n"])
+        await asyncio.sleep(0.02)
+        active["now"].discard(job["document_id"])
+
+    queue.register("write", write)
+    job_ids = [
+        queue.enqueue("write", {"n": n}, app_id="a", document_id=document_id)
+        for n, document_id in enumerate(["doc1", "doc1", "doc2", "doc2"])
+    ]
+
+    async def main():
+        pool = JobWorkerPool(queue, concurrency=4, poll_interval=0.01, scheduler=DocumentWriteScheduler(4))
+        await pool.start()
+        jobs = await asyncio.gather(*(queue.wait(job_id, 2) for job_id in job_ids))
+        await pool.stop()
+        return jobs
+
+    jobs = asyncio.run(main())
+    assert all(job["status"] == SUCCEEDED for job in jobs)
+    assert active["max"] == 2
+    assert order.index(0) < order.index(1) and order.index(2) < order.index(3)
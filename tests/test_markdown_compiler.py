@@ -0,0 +1,123 @@
+# file name: test_markdown_compiler.py
+from api.app.handlers.feishu_docx_api_handler_async import BlockType
+from api.app.handlers.feishu_document_tree import DocumentTree
+from api.app.handlers.feishu_markdown_compiler import MarkdownCompiler, parse_inline
+
+MARKDOWN = """# 标题
+
+第一行
+第二行
+
+- 项目 A
+  - 子项目 A1
+  - 子项目 A2
+- 项目 B
+1. 有序
+
+> 引用一
+> 引用二
+
+```Python
+print("hi")
+
+x = 1
+```
+
+---
+"""
+
+
+def outline(subtree):
+    """
+    :return: 顶层块的 (类型, 文本, 子块的 outline)
+    """
+    blocks = {block["block_id"]: block for block in subtree}
+
+    def describe(block_id):
+        block = blocks[block_id]
+        return block["block_type"], DocumentTree.text_of(block), [describe(child) for child in block.get("children") or []]
+
+    return describe(subtree[0]["block_id"])
+
+
+def test_parse_inline_styles():
+    runs = parse_inline("普通 **粗体 *斜体* 粗体** `代码` [链接](https://example.com) ~~删除~~")
+
+    assert [(run["content"], run["text_element_style"]) for run in runs] == [
+        ("普通 ", {}),
+        ("粗体 ", {"bold": True}),
+        ("斜体", {"bold": True, "italic": True}),
+        (" 粗体", {"bold": True}),
+        (" ", {}),
+        ("代码", {"inline_code": True}),
+        (" ", {}),
+        ("链接", {"link": {"url": "https://example.com"}}),
+        (" ", {}),
+        ("删除", {"strikethrough": True}),
+    ]
+    assert parse_inline("") == [{"content": "", "text_element_style": {}}]
+
+
+def test_iter_blocks_builds_nested_structure():
+    subtrees = list(MarkdownCompiler().iter_blocks(MARKDOWN))
+
+    assert [outline(subtree) for subtree in subtrees] == [
+        (BlockType.HEADING1.position, "标题", []),
+        (BlockType.TEXT.position, "第一行 第二行", []),
+        (BlockType.BULLET.position, "项目 A", [
+            (BlockType.BULLET.position, "子项目 A1", []),
+            (BlockType.BULLET.position, "子项目 A2", []),
+        ]),
+        (BlockType.BULLET.position, "项目 B", []),
+        (BlockType.ORDERED.position, "有序", []),
+        (BlockType.QUOTE_CONTAINER.position, "", [
+            (BlockType.TEXT.position, "引用一", []),
+            (BlockType.TEXT.position, "引用二", []),
+        ]),
+        (BlockType.CODE.position, 'print("hi")\n\nx = 1', []),
+        (BlockType.DIVIDER.position, "", []),
+    ]
+    code = subtrees[6][0]
+    assert code["code"]["style"]["language"] == 49
+
+
+def test_unclosed_code_fence_is_kept():
+    subtrees = list(MarkdownCompiler().iter_blocks("```\nline"))
+    assert [outline(subtree) for subtree in subtrees] == [(BlockType.CODE.position, "line", [])]
+
+
+def test_compile_batches_whole_subtrees_within_the_limit():
+    # 每个列表项带两个子项，子树大小为 3
+    source = "\n".join(f"- 项 {i}\n  - 子 {i}.1\n  - 子 {i}.2" for i in range(5))
+    batches = list(MarkdownCompiler(max_blocks=7).compile(source))
+
+    assert [len(descendants) for _, descendants in batches] == [6, 6, 3]
+    seen = set()
+    for children_ids, descendants in batches:
+        ids = {block["block_id"] for block in descendants}
+        assert set(children_ids) <= ids
+        assert all(child in ids for block in descendants for child in block.get("children") or [])
+        assert not ids & seen
+        seen |= ids
+
+
+def test_oversized_subtree_gets_its_own_batch():
+    source = "段落\n\n- 父项\n" + "\n".join(f"  - 子 {i}" for i in range(5))
+    batches = list(MarkdownCompiler(max_blocks=3).compile(source))
+
+    assert [len(descendants) for _, descendants in batches] == [1, 6]
+
+
+def test_compile_consumes_lines_lazily():
+    consumed = []
+
+    def lines():
+        for i in range(100):
+            consumed.append(i)
+            yield f"# 标题 {i}"
+
+    batches = MarkdownCompiler(max_blocks=10).compile(lines())
+    children_ids, _ = next(batches)
+
+    assert len(children_ids) == 10
+    assert len(consumed) < 100
@@ -0,0 +1,99 @@
+# file name: test_response_cache.py
+import asyncio
+
+import pytest
+
+from api.app.utils import feishu_app_api_async, feishu_response_cache
+from api.app.utils.feishu_response_cache import MemoryCacheBackend, ResponseCache, SQLiteCacheBackend
+
+OK = {"code": 0, "data": {"name": "space"}}
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = {"t": 1000.0}
+    monkeypatch.setattr(feishu_response_cache.time, "time", lambda: now["t"])
+    return now
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def backend(request, tmp_path):
+    if request.param == "memory":
+        return MemoryCacheBackend(max_entries=2)
+    return SQLiteCacheBackend(str(tmp_path / "cache.sqlite3"), max_entries=2)
+
+
+def test_entries_expire_after_their_ttl(backend, clock):
+    cache = ResponseCache(backend, ttls={"wiki.space_info": 10})
+    cache.set("wiki.space_info", "space", value=OK)
+    assert cache.get("wiki.space_info", "space") == OK
+    clock["t"] += 11
+    assert cache.get("wiki.space_info", "space") is None
+    assert cache.stats()["hits"] == {"wiki.space_info": 1}
+    assert cache.stats()["misses"] == {"wiki.space_info": 1}
+
+
+def test_only_successful_responses_are_cached(backend, clock):
+    cache = ResponseCache(backend, ttls={"wiki.space_info": 10, "wiki.node_info": 0})
+    cache.set("wiki.space_info", "space", value={"code": 99991400, "msg": "too many requests"})
+    cache.set("wiki.node_info", "node", value=OK)
+    assert cache.get("wiki.space_info", "space") is None
+    assert cache.get("wiki.node_info", "node") is None
+
+
+def test_invalidate_by_prefix_does_not_touch_similar_keys(backend, clock):
+    cache = ResponseCache(backend, ttls={"drive.folder_files": 10})
+    cache.set("drive.folder_files", "fld1", "page1", value=OK)
+    cache.set("drive.folder_files", "fld10", value=OK)
+    cache.invalidate("drive.folder_files", "fld1")
+    assert cache.get("drive.folder_files", "fld1", "page1") is None
+    assert cache.get("drive.folder_files", "fld10") == OK
+
+
+def test_least_recently_used_entry_is_evicted(backend, clock):
+    cache = ResponseCache(backend, ttls={"wiki.node_info": 10})
+    cache.set("wiki.node_info", "a", value=OK)
+    clock["t"] += 1
+    cache.set("wiki.node_info", "b", value=OK)
+    clock["t"] += 1
+    cache.get("wiki.node_info", "a")
+    clock["t"] += 1
+    cache.set("wiki.node_info", "c", value=OK)
+    assert cache.get("wiki.node_info", "b") is None
+    assert cache.get("wiki.node_info", "a") == OK
+    assert cache.stats()["evictions"] == 1
+
+
+def test_sqlite_backend_survives_reopening(tmp_path, clock):
+    path = str(tmp_path / "cache.sqlite3")
+    ResponseCache(SQLiteCacheBackend(path), ttls={"wiki.space_info": 10}).set("wiki.space_info", "space", value=OK)
+    assert ResponseCache(SQLiteCacheBackend(path), ttls={"wiki.space_info": 10}).get("wiki.space_info", "space") == OK
+
+
+def test_sqlite_backend_opens_in_the_data_dir_on_first_use(tmp_path, monkeypatch):
+    monkeypatch.setenv("FEISHU_CACHE_BACKEND", "sqlite")
+    monkeypatch.delenv("FEISHU_CACHE_PATH", raising=False)
+    monkeypatch.setenv("FEISHU_DATA_DIR", str(tmp_path / "data"))
+    cache = ResponseCache.from_env()
+    path = tmp_path / "data" / "feishu_cache.sqlite3"
+    assert cache.backend.path == str(path)
+    assert not path.exists()
+    cache.set("wiki.space_info", "space", value=OK)
+    assert oct(path.stat().st_mode & 0o777) == "0o600"
+    assert cache.get("wiki.space_info", "space") == OK
+
+
+def test_tokens_are_not_stored_in_cache_keys(tmp_path, monkeypatch):
+    path = tmp_path / "cache.sqlite3"
+    cache = ResponseCache(SQLiteCacheBackend(str(path)))
+    monkeypatch.setattr(feishu_app_api_async, "response_cache", cache)
+    api = feishu_app_api_async.FeishuDocxAPI("t-secret-token")
+
+    async def fake_request(method, url, **kwargs):
+        return {"code": 0, "data": {"document": {"revision_id": 1}}}
+
+    monkeypatch.setattr(api, "_request", fake_request)
+    asyncio.run(api.get_document_info("doc"))
+    assert len(cache.backend) == 1
+    assert b"t-secret-token" not in path.read_bytes()
+    assert cache.get("docx.document_info", feishu_response_cache.owner_key(None, "t-secret-token"), "doc") is not None
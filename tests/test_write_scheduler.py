@@ -0,0 +1,93 @@
+# file name: test_write_scheduler.py
+import asyncio
+
+import pytest
+
+from api.app.utils.write_scheduler import DocumentWriteScheduler
+
+
+def test_same_document_runs_in_order_and_documents_run_in_parallel():
+    scheduler = DocumentWriteScheduler(max_concurrency=2)
+    log = []
+    active = {"now": 0, "max": 0}
+
+    async def write(document_id, n):
+        active["now"] += 1
+        active["max"] = max(active["max"], active["now"])
+        log.append((document_id, n, "start"))
+        await asyncio.sleep(0.01)
+        log.append((document_id, n, "end"))
+        active["now"] -= 1
+        return n
+
+    async def main():
+        return await asyncio.gather(*(
+            scheduler.submit(document_id, write, document_id, n)
+            for n in range(3) for document_id in ("a", "b", "c")
+        ))
+
+    results = asyncio.run(main())
+    assert results == [n for n in range(3) for _ in range(3)]
+    assert active["max"] == 2
+    for document_id in ("a", "b", "c"):
+        events = [(n, phase) for doc, n, phase in log if doc == document_id]
+        assert events == [(n, phase) for n in range(3) for phase in ("start", "end")]
+    # 轮转调度：c 的第一个任务不会排在 a、b 的全部任务之后
+    assert log.index(("c", 0, "start")) < log.index(("a", 2, "start"))
+    assert scheduler.stats()["completed"] == 9
+
+
+def test_handler_exception_is_raised_to_the_submitter():
+    scheduler = DocumentWriteScheduler()
+
+    async def fail():
+        raise ValueError("boom")
+
+    with pytest.raises(ValueError):
+        asyncio.run(scheduler.submit("a", fail))
+    assert scheduler.stats()["failed"] == 1
+
+
+def test_cancelling_the_submitter_cancels_the_write():
+    scheduler = DocumentWriteScheduler()
+    state = {}
+
+    async def write():
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            state["cancelled"] = True
+            raise
+
+    async def main():
+        submitter = asyncio.ensure_future(scheduler.submit("a", write))
+        await asyncio.sleep(0.01)
+        submitter.cancel()
+        await asyncio.gather(submitter, return_exceptions=True)
+        await asyncio.sleep(0)
+        return scheduler.stats()
+
+    stats = asyncio.run(main())
+    assert state == {"cancelled": True}
+    assert stats["running"] == 0
+
+
+def test_stop_cancels_running_and_queued_writes():
+    scheduler = DocumentWriteScheduler(max_concurrency=1)
+    started = []
+
+    async def write(n):
+        started.append(n)
+        await asyncio.sleep(10)
+
+    async def main():
+        first = scheduler.submit_nowait("a", write, 1)
+        second = scheduler.submit_nowait("a", write, 2)
+        await asyncio.sleep(0.01)
+        await scheduler.stop()
+        return first, second
+
+    first, second = asyncio.run(main())
+    assert started == [1]
+    assert first.cancelled() and second.cancelled()
+    assert scheduler.stats()["running"] == 0 and scheduler.pending() == 0